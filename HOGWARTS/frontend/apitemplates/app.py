@@ -4,13 +4,20 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from werkzeug.security import generate_password_hash, check_password_hash
+from collections import namedtuple
 from datetime import datetime, timedelta
+import atexit
 import os
 from functools import wraps
 import jwt
 from jwt import ExpiredSignatureError, InvalidTokenError
+from gryffin.passwords import PasswordHasher, PoolBusy
+from gryffin.ratelimit import RateLimiter, check_login_limits
+from login_activity import LoginActivity
+from token_cache import TokenCache
 
 
 # Initialize Flask apppip install Flask Flask-CORS Flask-SQLAlchemy PyJWT Werkzeug SQLAlchemy
@@ -22,10 +29,18 @@ db = SQLAlchemy()
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///gryffintwain.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
+app.config['PASSWORD_HASH_COST'] = 15  # log2 of the scrypt work factor
+app.config['PASSWORD_HASH_WORKERS'] = 2
+app.config['RATE_LIMIT_DB'] = None  # a file path shares the login buckets between workers
 
 # Initialize extensions
 db = SQLAlchemy(app)
 CORS(app)
+login_activity = LoginActivity()
+hasher = PasswordHasher(cost=app.config['PASSWORD_HASH_COST'], workers=app.config['PASSWORD_HASH_WORKERS'])
+tokens = TokenCache()
+ip_limiter = RateLimiter(rate=10 / 60, burst=10, path=app.config['RATE_LIMIT_DB'])
+email_limiter = RateLimiter(rate=1 / 60, burst=5, path=app.config['RATE_LIMIT_DB'])
 
 # ==================== DATABASE MODELS ====================
 
@@ -36,6 +51,7 @@ class User(db.Model):
     name = db.Column(db.String(120), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(255), nullable=False)
+    token_version = db.Column(db.Integer, nullable=False, default=0)  # bumped to revoke every issued token
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -43,10 +59,14 @@ class User(db.Model):
     goals = db.relationship('Goal', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password = generate_password_hash(password)
+        self.password = hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password, password)
+        """Whether the password matches; rehashes it if stored as plaintext or with an older cost"""
+        matches, needs_rehash = hasher.verify(password, self.password)
+        if needs_rehash:
+            self.password = hasher.upgrade(password)
+        return matches
     
     def to_dict(self):
         return {
@@ -103,8 +123,153 @@ class Goal(db.Model):
         }
 
 
+class Budget(db.Model):
+    """Monthly limit and running spend for one category; category NULL holds the overall limit"""
+    __tablename__ = 'budgets'
+    __table_args__ = (
+        db.Index('ix_budgets_user_category_month', 'user_id', 'category', 'month', unique=True),
+        db.Index('ix_budgets_user_month', 'user_id', 'month'),
+        db.Index('ix_budgets_user_month_overall', 'user_id', 'month', unique=True, sqlite_where=text('category IS NULL')),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    category = db.Column(db.String(50))
+    month = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    limit_amount = db.Column(db.Float)
+    spent = db.Column(db.Float, default=0)
+
+
+# ==================== BUDGETS ====================
+
+def month_key(date=None):
+    return (date or datetime.utcnow()).strftime('%Y-%m')
+
+
+def _old_value(obj, attr):
+    history = inspect(obj).attrs[attr].history
+    return history.deleted[0] if history.deleted else getattr(obj, attr)
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_budget_spend(session, flush_context):
+    """Apply each flush's expense changes to the monthly spend counters"""
+    deltas = {}
+    
+    def apply(user_id, category, date, amount):
+        key = (user_id, category, month_key(date))
+        deltas[key] = deltas.get(key, 0) + amount
+    
+    for obj in session.new:
+        if isinstance(obj, Expense):
+            apply(obj.user_id, obj.category, obj.date, obj.amount)
+    for obj in session.deleted:
+        if isinstance(obj, Expense):
+            apply(obj.user_id, obj.category, obj.date, -obj.amount)
+    for obj in session.dirty:
+        if isinstance(obj, Expense) and session.is_modified(obj):
+            apply(obj.user_id, _old_value(obj, 'category'), _old_value(obj, 'date'), -_old_value(obj, 'amount'))
+            apply(obj.user_id, obj.category, obj.date, obj.amount)
+    
+    for (user_id, category, month), delta in deltas.items():
+        if round(delta, 2):
+            add_spend(session, user_id, category, month, round(delta, 2))
+
+
+def add_spend(session, user_id, category, month, delta):
+    updated = session.execute(
+        Budget.__table__.update()
+        .where(Budget.user_id == user_id, Budget.category == category, Budget.month == month)
+        .values(spent=Budget.spent + delta)
+    ).rowcount
+    if not updated:
+        roll_budgets_forward(session, user_id, month)
+        session.execute(
+            sqlite_insert(Budget)
+            .values(user_id=user_id, category=category, month=month, spent=delta)
+            .on_conflict_do_update(index_elements=['user_id', 'category', 'month'], set_={'spent': Budget.spent + delta})
+        )
+
+
+def roll_budgets_forward(session, user_id, month):
+    """Carry limits from the user's latest earlier month into a month's first row"""
+    session.execute(text(
+        'INSERT OR IGNORE INTO budgets (user_id, category, month, limit_amount, spent) '
+        'SELECT user_id, category, :month, limit_amount, 0 FROM budgets '
+        'WHERE user_id = :user_id AND limit_amount IS NOT NULL '
+        'AND month = (SELECT MAX(month) FROM budgets WHERE user_id = :user_id AND month < :month)'
+    ), {'user_id': user_id, 'month': month})
+
+
+# This month's rows, plus limits that will roll forward from the latest earlier month
+BUDGET_STATUS_SQL = text('''
+    SELECT category, limit_amount, spent FROM budgets
+    WHERE user_id = :user_id AND month = :month
+    UNION ALL
+    SELECT category, limit_amount, 0 FROM budgets AS prev
+    WHERE user_id = :user_id AND limit_amount IS NOT NULL
+      AND month = (SELECT MAX(month) FROM budgets WHERE user_id = :user_id AND month < :month)
+      AND NOT EXISTS (
+        SELECT 1 FROM budgets AS cur
+        WHERE cur.user_id = :user_id AND cur.month = :month AND cur.category IS prev.category
+      )
+''')
+
+
+def budget_status(user_id, month=None):
+    """Limits and spend for one month, one row per category"""
+    month = month or month_key()
+    overall_limit, category_limits, total_spent, categories = None, 0, 0, []
+    for category, limit, spent in db.session.execute(BUDGET_STATUS_SQL, {'user_id': user_id, 'month': month}):
+        if category is None:
+            overall_limit = limit
+            continue
+        total_spent += spent or 0
+        category_limits += limit or 0
+        categories.append({
+            'category': category,
+            'limit': limit,
+            'spent': round(spent or 0, 2),
+            'remaining': round(limit - (spent or 0), 2) if limit is not None else None
+        })
+    if overall_limit is None and category_limits:
+        overall_limit = category_limits
+    return {
+        'month': month,
+        'limit': overall_limit,
+        'spent': round(total_spent, 2),
+        'remaining': round(overall_limit - total_spent, 2) if overall_limit is not None else None,
+        'percentage': int(total_spent / overall_limit * 100) if overall_limit else 0,
+        'categories': sorted(categories, key=lambda c: c['spent'], reverse=True)
+    }
+
+
+def seed_budget_counters():
+    """Build the spend counters from existing expenses the first time budgets exist"""
+    if Budget.query.first():
+        return
+    db.session.execute(text(
+        "INSERT INTO budgets (user_id, category, month, spent) "
+        "SELECT user_id, category, strftime('%Y-%m', date), SUM(amount) FROM expenses "
+        "GROUP BY user_id, category, strftime('%Y-%m', date)"
+    ))
+    db.session.commit()
+
+
 # ==================== AUTHENTICATION ====================
 
+# What an authenticated request knows about its user, cached per token
+Principal = namedtuple('Principal', ['id', 'email', 'name'])
+
+
+def add_token_version_column():
+    """Databases created before token revocation lack users.token_version"""
+    columns = [c['name'] for c in inspect(db.engine).get_columns('users')]
+    if 'token_version' not in columns:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ALTER TABLE users ADD COLUMN token_version INTEGER NOT NULL DEFAULT 0')
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -119,23 +284,31 @@ def token_required(f):
         if not token:
             return jsonify({'detail': 'Token missing'}), 401
         
-        try:
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
-            current_user = User.query.get(data['user_id'])
-            if not current_user:
+        # Verified before and not revoked since: no signature check, no query
+        current_user = tokens.get(token)
+        if current_user is None:
+            try:
+                data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=['HS256'])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'detail': 'Token expired'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'detail': 'Invalid token'}), 401
+            
+            user = db.session.get(User, data['user_id'])
+            if not user:
                 return jsonify({'detail': 'User not found'}), 401
-        except jwt.ExpiredSignatureError:
-            return jsonify({'detail': 'Token expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'detail': 'Invalid token'}), 401
+            if data.get('ver', 0) != user.token_version:
+                return jsonify({'detail': 'Token revoked'}), 401
+            current_user = tokens.put(token, Principal(user.id, user.email, user.name), user.id, user.token_version, data['exp'])
         
         return f(current_user, *args, **kwargs)
     return decorated
 
 
-def create_token(user_id):
+def create_token(user):
     payload = {
-        'user_id': user_id,
+        'user_id': user.id,
+        'ver': user.token_version or 0,
         'exp': datetime.utcnow() + timedelta(days=7)
     }
     token = jwt.encode(payload, app.config['SECRET_KEY'], algorithm='HS256')
@@ -152,12 +325,22 @@ def login():
     if not data or not data.get('email') or not data.get('password'):
         return jsonify({'detail': 'Email and password required'}), 400
     
+    retry_after = check_login_limits(ip_limiter, email_limiter, request.remote_addr, data['email'])
+    if retry_after:
+        return jsonify({'detail': 'Too many attempts, try again later'}), 429, {'Retry-After': str(retry_after)}
+    
     user = User.query.filter_by(email=data['email']).first()
+    try:
+        success = user.check_password(data['password']) if user else hasher.verify_absent(data['password'])[0]
+    except PoolBusy:
+        return jsonify({'detail': 'Server busy, try again'}), 503, {'Retry-After': '1'}
+    login_activity.record(data['email'], success, request.remote_addr, request.headers.get('User-Agent'))
     
-    if not user or not user.check_password(data['password']):
+    if not success:
         return jsonify({'detail': 'Invalid credentials'}), 401
+    db.session.commit()
     
-    token = create_token(user.id)
+    token = create_token(user)
     
     return jsonify({
         'accessToken': token,
@@ -174,16 +357,23 @@ def register():
     if not data or not data.get('name') or not data.get('email') or not data.get('password'):
         return jsonify({'detail': 'Name, email, and password required'}), 400
     
+    retry_after = check_login_limits(ip_limiter, email_limiter, request.remote_addr, data['email'])
+    if retry_after:
+        return jsonify({'detail': 'Too many attempts, try again later'}), 429, {'Retry-After': str(retry_after)}
+    
     if User.query.filter_by(email=data['email']).first():
         return jsonify({'detail': 'Email already registered'}), 400
     
     user = User(name=data['name'], email=data['email'])
-    user.set_password(data['password'])
+    try:
+        user.set_password(data['password'])
+    except PoolBusy:
+        return jsonify({'detail': 'Server busy, try again'}), 503, {'Retry-After': '1'}
     
     db.session.add(user)
     db.session.commit()
     
-    token = create_token(user.id)
+    token = create_token(user)
     
     return jsonify({
         'accessToken': token,
@@ -192,6 +382,17 @@ def register():
     }), 201
 
 
+@app.route('/api/auth/logout', methods=['POST'])
+@token_required
+def logout(current_user):
+    """Revoke every token issued to the user"""
+    user = db.session.get(User, current_user.id)
+    user.token_version = User.token_version + 1
+    db.session.commit()
+    tokens.revoke(user.id, user.token_version)
+    return jsonify({'message': 'Logged out'}), 200
+
+
 # ==================== DASHBOARD ENDPOINTS ====================
 
 @app.route('/api/dashboard/summary', methods=['GET'])
@@ -202,7 +403,8 @@ def dashboard_summary(current_user):
     goals = Goal.query.filter_by(user_id=current_user.id).all()
     
     total_balance = 50000.00
-    monthly_expenses = sum(e.amount for e in expenses if e.date.month == datetime.now().month)
+    budget = budget_status(current_user.id)
+    monthly_expenses = budget['spent']
     total_expenses = sum(e.amount for e in expenses)
     investments = 12450.00
     
@@ -215,7 +417,7 @@ def dashboard_summary(current_user):
     return jsonify({
         'totalBalance': total_balance,
         'monthlyExpenses': monthly_expenses,
-        'budgetPercentage': int((monthly_expenses / 4200) * 100),
+        'budgetPercentage': budget['percentage'],
         'investments': investments,
         'goalsProgress': goals_progress,
         'activeGoals': len(goals),
@@ -235,14 +437,14 @@ def get_expenses(current_user):
     expenses = Expense.query.filter_by(user_id=current_user.id).all()
     
     total_expenses = sum(e.amount for e in expenses)
-    monthly_budget = 4200.00
-    remaining_budget = monthly_budget - total_expenses
+    budget = budget_status(current_user.id)
     
     return jsonify({
         'totalExpenses': total_expenses,
-        'monthlyBudget': monthly_budget,
-        'remainingBudget': remaining_budget,
-        'budgetPercentage': int((total_expenses / monthly_budget) * 100),
+        'monthlyExpenses': budget['spent'],
+        'monthlyBudget': budget['limit'],
+        'remainingBudget': budget['remaining'],
+        'budgetPercentage': budget['percentage'],
         'expenses': [e.to_dict() for e in expenses]
     }), 200
 
@@ -323,6 +525,44 @@ def delete_expense(current_user, expense_id):
     return jsonify({'message': 'Expense deleted'}), 200
 
 
+# ==================== BUDGET ENDPOINTS ====================
+
+@app.route('/api/budgets', methods=['GET'])
+@token_required
+def get_budgets(current_user):
+    """Budget status for a month (?month=YYYY-MM, default this month)"""
+    month = request.args.get('month')
+    if month and not (len(month) == 7 and month[4] == '-' and (month[:4] + month[5:]).isdigit()):
+        return jsonify({'detail': 'month must be YYYY-MM'}), 400
+    return jsonify(budget_status(current_user.id, month)), 200
+
+
+@app.route('/api/budgets', methods=['PUT'])
+@token_required
+def set_budget(current_user):
+    """Set or clear a category's (or the overall) limit; months started later inherit it"""
+    data = request.get_json() or {}
+    month = data.get('month') or month_key()
+    if not (len(month) == 7 and month[4] == '-' and (month[:4] + month[5:]).isdigit()):
+        return jsonify({'detail': 'month must be YYYY-MM'}), 400
+    category = data.get('category')
+    limit = float(data['limit']) if data.get('limit') is not None else None
+    
+    roll_budgets_forward(db.session, current_user.id, month)
+    db.session.execute(
+        sqlite_insert(Budget)
+        .values(user_id=current_user.id, category=category, month=month, limit_amount=limit, spent=0)
+        .on_conflict_do_update(
+            index_elements=['user_id', 'category', 'month'] if category else ['user_id', 'month'],
+            index_where=None if category else Budget.category.is_(None),
+            set_={'limit_amount': limit}
+        )
+    )
+    db.session.commit()
+    
+    return jsonify(budget_status(current_user.id, month)), 200
+
+
 # ==================== GOALS ENDPOINTS ====================
 
 @app.route('/api/goals', methods=['GET'])
@@ -419,7 +659,14 @@ def get_security(current_user):
     """Get security information"""
     return jsonify({
         'overallSecurity': 'Excellent',
-        'loginActivity': 'Normal',
+        'loginActivity': login_activity.status(current_user.email),
+        'recentLogins': [{
+            'success': attempt['success'],
+            'ip': attempt['ip'],
+            'userAgent': attempt['user_agent'],
+            'unusual': attempt['unusual'],
+            'timestamp': attempt['timestamp'].isoformat()
+        } for attempt in login_activity.recent(current_user.email, limit=10)],
         'fraudAlerts': 0,
         'passwordStrength': 'Strong',
         'twoFactorAuth': True,
@@ -451,6 +698,26 @@ def get_analytics(current_user):
     }), 200
 
 
+# ==================== METRICS ====================
+
+@app.route('/api/metrics/passwords', methods=['GET'])
+def password_metrics():
+    """Password hashing pool queue depth and latency"""
+    return jsonify(hasher.metrics()), 200
+
+
+@app.route('/api/metrics/tokens', methods=['GET'])
+def token_metrics():
+    """Verified-token cache size and hit rate"""
+    return jsonify(tokens.metrics()), 200
+
+
+@app.route('/api/metrics/ratelimits', methods=['GET'])
+def rate_limit_metrics():
+    """Login rate limiter buckets and refused attempts"""
+    return jsonify({'ip': ip_limiter.metrics(), 'email': email_limiter.metrics()}), 200
+
+
 # ==================== DUMMY DATA ENDPOINTS ====================
 
 @app.route('/api/seed', methods=['POST'])
@@ -532,11 +799,20 @@ def initialize_db():
         os.makedirs('instance')
 
 
+# Write login attempts from app setup, so WSGI servers and imports record them too.
+# start() is a no-op once running; stop() at exit flushes what is still pending.
+with app.app_context():
+    login_activity.start(db.engine.url.database)
+atexit.register(login_activity.stop)
+
+
 # ==================== MAIN ====================
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        add_token_version_column()
+        seed_budget_counters()
         print("Database tables created!")
     
     app.run(debug=True, host='127.0.0.1', port=8000)
@@ -9,18 +9,26 @@ Run the server:
 uvicorn fastapi_backend:app --reload --port 8000
 """
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
+import sqlite3
+import threading
+from gryffin.ratelimit import RateLimiter, check_login_limits
+from login_activity import LoginActivity
+from token_cache import TokenCache
 
 # ============ CONFIGURATION ============
 SECRET_KEY = "your-secret-key-change-this-in-production"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+LOGIN_ACTIVITY_DB = "login_activity.db"
+USERS_DB = "users.db"  # token versions per email, so revocations survive restarts
+RATE_LIMIT_DB = None  # a file path shares the login buckets between workers
 
 # ============ INITIALIZE APP ============
 app = FastAPI(
@@ -39,6 +47,10 @@ app.add_middleware(
 )
 
 security = HTTPBearer()
+login_activity = LoginActivity()
+tokens = TokenCache()
+ip_limiter = RateLimiter(rate=10 / 60, burst=10, path=RATE_LIMIT_DB)
+email_limiter = RateLimiter(rate=1 / 60, burst=5, path=RATE_LIMIT_DB)
 
 # ============ PYDANTIC MODELS ============
 
@@ -82,9 +94,17 @@ class ExpensesResponse(BaseModel):
     budget_percentage: int
     expenses: List[Expense]
 
+class LoginEvent(BaseModel):
+    success: bool
+    ip: Optional[str]
+    user_agent: Optional[str]
+    unusual: List[str]
+    timestamp: datetime
+
 class SecurityResponse(BaseModel):
     overall_security: str
     login_activity: str
+    recent_logins: List[LoginEvent]
     fraud_alerts: int
     password_strength: str
     two_factor_auth: bool
@@ -112,6 +132,34 @@ class AnalyticsResponse(BaseModel):
     categories: List[str]
     category_amounts: List[float]
 
+# ============ TOKEN VERSIONS ============
+# The demo has no accounts, so a users row only holds the token version for an email.
+# It is read when a token misses the cache and bumped on logout.
+
+users_db = sqlite3.connect(USERS_DB, check_same_thread=False, isolation_level=None)
+users_db.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, token_version INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+users_lock = threading.Lock()
+
+def token_version(email: str) -> int:
+    """The stored token version for an email, from the cache when it holds one"""
+    version = tokens.version(email)
+    if version is not None:
+        return version
+    with users_lock:
+        row = users_db.execute("SELECT token_version FROM users WHERE email = ?", (email,)).fetchone()
+    return row[0] if row else 0
+
+def revoke_tokens(email: str) -> int:
+    """Bump the stored version, so every token issued before stops verifying"""
+    with users_lock:
+        version = users_db.execute(
+            "INSERT INTO users (email, token_version) VALUES (?, 1) "
+            "ON CONFLICT (email) DO UPDATE SET token_version = token_version + 1 RETURNING token_version",
+            (email,),
+        ).fetchone()[0]
+    tokens.revoke(email, version)
+    return version
+
 # ============ JWT FUNCTIONS ============
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -126,16 +174,22 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    """Verify JWT token from Authorization header"""
+    """Verify JWT token from Authorization header, from the cache when it was verified before"""
+    token = credentials.credentials
+    email = tokens.get(token)
+    if email is not None:
+        return email
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return email
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    email: str = payload.get("sub")
+    if email is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    version = payload.get("ver", 0)
+    if version != token_version(email):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    return tokens.put(token, email, email, version, payload["exp"])
 
 # ============ API ROUTES ============
 
@@ -157,19 +211,38 @@ def health_check():
         "service": "GryffinTwin API"
     }
 
+# ============ STARTUP & SHUTDOWN ============
+
+@app.on_event("startup")
+def startup():
+    login_activity.start(LOGIN_ACTIVITY_DB)
+
+@app.on_event("shutdown")
+def shutdown():
+    login_activity.stop()
+
 # ============ AUTHENTICATION ENDPOINTS ============
 
 @app.post("/api/auth/login", response_model=LoginResponse)
-def login(request: LoginRequest):
+def login(request: LoginRequest, http_request: Request):
     """
     Login endpoint - accepts any email/password for demo
     Returns JWT token and user data
     
     In production, validate against database with password hashing
     """
+    ip = http_request.client.host if http_request.client else None
+    user_agent = http_request.headers.get("user-agent")
+    retry_after = check_login_limits(ip_limiter, email_limiter, ip, request.email)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many attempts, try again later", headers={"Retry-After": str(retry_after)})
     if not request.email or not request.password:
+        if request.email:
+            login_activity.record(request.email, False, ip, user_agent)
         raise HTTPException(status_code=400, detail="Email and password required")
     
+    login_activity.record(request.email, True, ip, user_agent)
+    
     # Demo: Accept any email/password combination
     # In production: Hash password and validate against database
     user = User(
@@ -179,7 +252,7 @@ def login(request: LoginRequest):
     )
     
     access_token = create_access_token(
-        data={"sub": request.email},
+        data={"sub": request.email, "ver": token_version(request.email)},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
@@ -189,6 +262,12 @@ def login(request: LoginRequest):
         user=user
     )
 
+@app.post("/api/auth/logout")
+def logout(email: str = Depends(verify_token)):
+    """Revoke every token issued to this email"""
+    revoke_tokens(email)
+    return {"message": "Logged out"}
+
 # ============ DASHBOARD ENDPOINTS ============
 
 @app.get("/api/dashboard/summary", response_model=DashboardSummary)
@@ -265,7 +344,8 @@ def get_security(email: str = Depends(verify_token)):
     """Get security status for authenticated user"""
     return SecurityResponse(
         overall_security="Excellent",
-        login_activity="Normal",
+        login_activity=login_activity.status(email),
+        recent_logins=[LoginEvent(**attempt) for attempt in login_activity.recent(email, limit=10)],
         fraud_alerts=0,
         password_strength="Strong",
         two_factor_auth=True,
@@ -339,6 +419,18 @@ def get_analytics(email: str = Depends(verify_token)):
         category_amounts=[2450.0, 1890.0, 1560.0, 980.0, 720.0, 640.0]
     )
 
+# ============ METRICS ENDPOINTS ============
+
+@app.get("/api/metrics/tokens")
+def token_metrics():
+    """Verified-token cache size and hit rate"""
+    return tokens.metrics()
+
+@app.get("/api/metrics/ratelimits")
+def rate_limit_metrics():
+    """Login rate limiter buckets and refused attempts"""
+    return {"ip": ip_limiter.metrics(), "email": email_limiter.metrics()}
+
 # ============ MAIN ============
 
 if __name__ == "__main__":
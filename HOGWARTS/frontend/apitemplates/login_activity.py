@@ -0,0 +1,213 @@
+"""
+GryffinTwin Login Activity
+Login attempt log with an in-memory recent-activity buffer per account
+
+Every login attempt, successful or not, is appended to a SQLite
+`login_activity` table. Attempts are queued in memory and written by a
+background thread in batches, so a login costs a list append rather than
+a commit. Each account also keeps its last few attempts in a bounded ring
+buffer. The security page and the unusual-login checks read that buffer
+and never query the table. Buffers are kept for the `max_accounts` most
+recently attempted emails, so a flood of attempts on random emails
+evicts old buffers instead of growing memory.
+"""
+
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS login_activity (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    email TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    ip TEXT,
+    user_agent TEXT,
+    unusual TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_login_activity_email_timestamp ON login_activity (email, timestamp);
+"""
+
+RECENT_LOGINS = 20  # attempts kept in memory per account
+MAX_ACCOUNTS = 10000  # accounts with a buffer; least recently attempted are evicted
+FLUSH_EVERY = 100  # pending attempts that trigger a write
+FLUSH_INTERVAL = 1.0  # seconds between writes otherwise
+
+# Failed attempts within the window that make the next one unusual
+FAILED_LIMIT = 5
+FAILED_WINDOW = timedelta(minutes=15)
+# How long a flagged attempt keeps the account's status at "Unusual"
+UNUSUAL_WINDOW = timedelta(days=1)
+
+# The newest attempts per account, to refill the buffers after a restart
+RECENT_SQL = """
+SELECT email, success, ip, user_agent, unusual, timestamp FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY email ORDER BY id DESC) AS n FROM login_activity
+) WHERE n <= ? ORDER BY id
+"""
+
+
+def _attempt(email, success, ip, user_agent, unusual, timestamp):
+    return {
+        "email": email,
+        "success": bool(success),
+        "ip": ip,
+        "user_agent": user_agent,
+        "unusual": unusual.split(",") if unusual else [],
+        "timestamp": timestamp,
+    }
+
+
+class LoginActivity:
+    """
+    Login log with batched writes and a ring buffer per account.
+
+    Call `record` from the login handler and `start(db_path)` at startup.
+    Attempts recorded before `start` are written once it runs.
+    """
+
+    def __init__(self, size=RECENT_LOGINS, max_accounts=MAX_ACCOUNTS):
+        self.size = size
+        self.max_accounts = max_accounts
+        self.buffers = OrderedDict()
+        self.pending = []
+        self.conn = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+
+    # ---------- lifecycle ----------
+
+    def start(self, db_path):
+        if self.running:
+            return
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        rows = self.conn.execute(RECENT_SQL, (self.size,)).fetchall()
+        with self.lock:
+            loaded, self.buffers = self.buffers, OrderedDict()
+            for email, success, ip, user_agent, unusual, timestamp in rows:
+                attempt = _attempt(email, success, ip, user_agent, unusual, datetime.fromisoformat(timestamp))
+                self._buffer(email).append(attempt)
+            # Attempts recorded before start are newer than anything stored
+            for email, attempts in loaded.items():
+                self._buffer(email).extend(attempts)
+        self.running = True
+        self.thread = threading.Thread(target=self._write, name="login-activity-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup.set()
+        self.thread.join(timeout)
+        self.thread = None
+        self.conn.close()
+        self.conn = None
+
+    # ---------- recording ----------
+
+    def _buffer(self, email):
+        buffer = self.buffers.get(email)
+        if buffer is None:
+            buffer = self.buffers[email] = deque(maxlen=self.size)
+            while len(self.buffers) > self.max_accounts:
+                self.buffers.popitem(last=False)
+        else:
+            self.buffers.move_to_end(email)
+        return buffer
+
+    def record(self, email, success, ip=None, user_agent=None):
+        """Log an attempt and return it, with the reasons it looks unusual (if any)"""
+        email = (email or "").strip().lower()
+        now = datetime.utcnow()
+        with self.lock:
+            buffer = self._buffer(email)
+            unusual = self._unusual(buffer, success, ip, user_agent, now)
+            attempt = _attempt(email, success, ip, user_agent, ",".join(unusual), now)
+            buffer.append(attempt)
+            self.pending.append(attempt)
+            backlog = len(self.pending)
+        if unusual:
+            logger.warning("Unusual login for %s from %s: %s", email, ip, ", ".join(unusual))
+        if backlog >= FLUSH_EVERY:
+            self.wakeup.set()
+        return attempt
+
+    def _unusual(self, buffer, success, ip, user_agent, now):
+        """Compare an attempt with the account's recent ones"""
+        reasons = []
+        failures = sum(1 for a in buffer if not a["success"] and now - a["timestamp"] <= FAILED_WINDOW)
+        if failures >= FAILED_LIMIT:
+            reasons.append("repeated_failures")
+        if success:
+            known = [a for a in buffer if a["success"]]
+            # A first login has nothing to compare with
+            if known and ip and ip not in {a["ip"] for a in known}:
+                reasons.append("new_ip")
+            if known and user_agent and user_agent not in {a["user_agent"] for a in known}:
+                reasons.append("new_device")
+        return reasons
+
+    # ---------- reading ----------
+
+    def recent(self, email, limit=None):
+        """An account's recent attempts, newest first"""
+        with self.lock:
+            attempts = list(self.buffers.get((email or "").strip().lower(), ()))
+        attempts.reverse()
+        return attempts[:limit] if limit else attempts
+
+    def status(self, email):
+        """'Unusual' if an attempt was flagged within the last day, otherwise 'Normal'"""
+        since = datetime.utcnow() - UNUSUAL_WINDOW
+        for attempt in self.recent(email):
+            if attempt["timestamp"] < since:
+                break
+            if attempt["unusual"]:
+                return "Unusual"
+        return "Normal"
+
+    # ---------- writer ----------
+
+    def flush(self):
+        """Write pending attempts in one transaction; returns how many were written"""
+        if self.conn is None:
+            return 0
+        with self.lock:
+            batch, self.pending = self.pending, []
+        if not batch:
+            return 0
+        rows = [
+            (a["email"], int(a["success"]), a["ip"], a["user_agent"], ",".join(a["unusual"]) or None, a["timestamp"].isoformat(" "))
+            for a in batch
+        ]
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT INTO login_activity (email, success, ip, user_agent, unusual, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error:
+            # Keep the batch for the next write
+            with self.lock:
+                self.pending[:0] = batch
+            raise
+        return len(batch)
+
+    def _write(self):
+        while self.running:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning("Could not write login activity: %s", e)
+        self.flush()
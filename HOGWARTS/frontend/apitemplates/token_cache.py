@@ -0,0 +1,104 @@
+"""
+GryffinTwin Token Cache
+Verified JWTs mapped to their principal, so repeat requests skip the HMAC check
+
+Entries are keyed by the SHA-256 of the token, never the token itself.
+An entry lives until the token expires or `max_age` passes, whichever
+comes first, and the cache evicts its least recently used entries past
+`maxsize`.
+
+Revocation uses a version counter per account. Tokens carry the version
+they were issued under (the `ver` claim). The backend persists the
+counter on the account, and this cache only holds the versions of
+recently seen accounts, at most `maxsize` of them. `revoke` records the
+new version, and any cached entry from an older version is dropped on
+its next lookup. An entry whose account version was evicted is verified
+again. Another process only learns of a revocation when it verifies the
+token again, so `max_age` bounds how long a revoked token can keep
+working there.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+import time
+
+
+def token_key(token):
+    return hashlib.sha256(token.encode()).digest()
+
+
+class TokenCache:
+    """Bounded LRU of token hash -> (principal, account, version, expires_at)"""
+
+    def __init__(self, maxsize=10000, max_age=300):
+        self.maxsize = maxsize
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.versions = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "revoked": 0, "evicted": 0}
+
+    def get(self, token):
+        """The cached principal for a token, or None if it must be verified again"""
+        key = token_key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                principal, account, version, expires_at = entry
+                if expires_at <= time.time():
+                    del self.entries[key]
+                elif account not in self.versions:
+                    del self.entries[key]  # version evicted; verify against the stored one
+                elif version != self.versions[account]:
+                    del self.entries[key]
+                    self.stats["revoked"] += 1
+                else:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return principal
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, token, principal, account, version, exp):
+        """Cache a verified token; `exp` is its expiry as a Unix timestamp"""
+        key = token_key(token)
+        expires_at = min(exp, time.time() + self.max_age)
+        with self.lock:
+            current = self.versions.get(account)
+            if current is not None and version < current:
+                return principal
+            self._set_version(account, version)
+            self.entries[key] = (principal, account, version, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.stats["evicted"] += 1
+        return principal
+
+    def _set_version(self, account, version):
+        self.versions[account] = version
+        self.versions.move_to_end(account)
+        while len(self.versions) > self.maxsize:
+            self.versions.popitem(last=False)
+
+    def version(self, account):
+        """The current version for an account, if this process has it cached"""
+        with self.lock:
+            return self.versions.get(account)
+
+    def revoke(self, account, version):
+        """Record an account's new version; its tokens from older versions stop matching"""
+        with self.lock:
+            self._set_version(account, version)
+
+    def metrics(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "size": len(self.entries),
+                "accounts": len(self.versions),
+                "capacity": self.maxsize,
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0,
+            }
@@ -5,6 +5,8 @@ from datetime import datetime
 import logging
 import requests
 
+from gryffin.session_store import ServerSessionInterface, SqliteSessionStore
+
 app = Flask(__name__)
 app.secret_key = 'gryffin-twin-secret-key-change-in-production'
 
@@ -12,6 +14,11 @@ app.secret_key = 'gryffin-twin-secret-key-change-in-production'
 app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
 app.config['SESSION_COOKIE_SECURE'] = False
 app.config['SESSION_COOKIE_HTTPONLY'] = True
+app.config['SESSION_DB'] = 'sessions.db'  # None keeps sessions in signed cookies
+
+# Sessions live server-side; the cookie only carries an opaque id
+if app.config['SESSION_DB']:
+    app.session_interface = ServerSessionInterface(SqliteSessionStore(app.config['SESSION_DB']))
 
 # Enable debug logging for tracing login/session behavior
 logging.basicConfig(level=logging.DEBUG)
@@ -47,6 +54,7 @@ def login():
                 
                 if response.status_code == 200:
                     user_data = response.json()
+                    session.clear()  # new session id on login
                     session['user_id'] = user_data['id'] # Store ID for path parameters
                     session['user_email'] = user_data['email']
                     session['user_name'] = user_data['name']
@@ -90,7 +98,7 @@ def dashboard():
         if response.status_code == 200:
             dashboard_data = response.json()
             # Map API response to template expected format if necessary
-            # API returns: balance, total_expenses, total_income, goal_progress, active_goals, recent_transactions
+            # API returns: balance, total_expenses, total_income, goal_progress, active_goals, ledger_entries
             
             # The template expects a 'dashboard_data' object with specific fields.
             # We construct it from the API response.
@@ -98,7 +106,7 @@ def dashboard():
             template_data = {
                 'total_balance': dashboard_data.get('balance', 0),
                 'expenses': dashboard_data.get('total_expenses', 0),
-                'investments': 12450, # Mocked as backend doesn't have investment portfolio yet
+                'investments': dashboard_data.get('investments', 0), # Market value of the portfolio at the latest prices
                 'goals_progress': dashboard_data.get('goal_progress', 0),
                 'financial_score': 850, # Mocked
                 'accounts': [ # Mocked as backend doesn't track specific accounts yet
@@ -128,15 +136,16 @@ def expenses():
     try:
         user_id = session['user_id']
         response = requests.get(f"{BACKEND_URL}/expenses/{user_id}")
+        budget_response = requests.get(f"{BACKEND_URL}/budgets/{user_id}")
         
-        if response.status_code == 200:
+        if response.status_code == 200 and budget_response.status_code == 200:
             data = response.json()
             return render_template('expenses.html', 
                                  user_name=session.get('user_name', 'User'),
                                  user_email=session.get('user_email', ''),
                                  expenses=data.get('expenses', []),
                                  total_expenses=data.get('total', 0),
-                                 budget=5000) # Hardcoded budget for now
+                                 budget=budget_response.json()) # This month's limits and spend
         return "Failed to load expenses"
     except Exception as e:
         return f"Error: {e}"
@@ -201,10 +210,19 @@ def security():
 def portfolio():
     if 'user_id' not in session:
         return redirect(url_for('login'))
-    # Backend doesn't have portfolio endpoint yet, using static template
-    return render_template('portfolio.html', 
-                         user_name=session.get('user_name', 'User'),
-                         user_email=session.get('user_email', ''))
+        
+    try:
+        user_id = session['user_id']
+        response = requests.get(f"{BACKEND_URL}/portfolio/{user_id}")
+        
+        if response.status_code == 200:
+            return render_template('portfolio.html', 
+                                 user_name=session.get('user_name', 'User'),
+                                 user_email=session.get('user_email', ''),
+                                 portfolio=response.json()) # Valued at the latest loaded prices
+        return "Failed to load portfolio"
+    except Exception as e:
+        return f"Error: {e}"
 
 @app.route('/myfam')
 def myfam():
@@ -0,0 +1,9 @@
+"""
+GryffinTwin backend
+
+The backends in this folder run as scripts (`python app.py`) and import
+their modules by bare name. Installed as the `gryffin` package
+(`pip install -e .` from the repository's HOGWARTS folder), the
+dependency-free modules are shared with the frontends:
+`gryffin.passwords`, `gryffin.ratelimit` and `gryffin.session_store`.
+"""
@@ -0,0 +1,103 @@
+"""
+GryffinTwin Fraud Detector
+Online anomaly scoring for expenses as they are inserted
+"""
+
+from collections import deque
+import math
+import threading
+import time
+
+# Thresholds
+Z_SCORE_THRESHOLD = 3.0
+MIN_HISTORY = 5
+VELOCITY_WINDOWS = ((60, 5, "a minute"), (3600, 20, "an hour"))  # (seconds, max expenses, label)
+VELOCITY_MAXLEN = max(limit for _, limit, _ in VELOCITY_WINDOWS) + 1
+
+# Persistence cadence
+PERSIST_EVERY = 50
+PERSIST_INTERVAL = 60.0
+
+
+class ExpenseAnomalyDetector:
+    """
+    Scores each expense against the user's history for its category.
+
+    Per (user, category) it keeps Welford running statistics as a
+    [count, mean, m2] list, and per user a bounded deque of recent insert
+    times for velocity checks. Scoring and updating are O(1) per expense.
+    """
+
+    def __init__(self):
+        self.stats = {}
+        self.recent = {}
+        self.dirty = set()
+        self.updates_since_persist = 0
+        self.last_persist = time.monotonic()
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """Load persisted state from (user_id, category, count, mean, m2) rows"""
+        for user_id, category, count, mean, m2 in rows:
+            self.stats[(user_id, category)] = [count, mean, m2]
+
+    def observe(self, user_id, category, amount, now=None):
+        """Score an expense, fold it into the statistics and return alerts as (type, message)"""
+        now = time.time() if now is None else now
+        with self.lock:
+            return self._observe(user_id, category, amount, now)
+
+    def _observe(self, user_id, category, amount, now):
+        alerts = []
+
+        stat = self.stats.get((user_id, category))
+        if stat is None:
+            stat = self.stats[(user_id, category)] = [0, 0.0, 0.0]
+        count, mean, m2 = stat
+        if count >= MIN_HISTORY:
+            std = math.sqrt(m2 / (count - 1))
+            if std > 0:
+                z = (amount - mean) / std
+                if z > Z_SCORE_THRESHOLD:
+                    alerts.append((
+                        "Unusual Amount",
+                        f"{category} expense of {amount:.2f} is {z:.1f} standard deviations above your average of {mean:.2f}",
+                    ))
+
+        # Welford update
+        count += 1
+        delta = amount - mean
+        mean += delta / count
+        m2 += delta * (amount - mean)
+        stat[0], stat[1], stat[2] = count, mean, m2
+        self.dirty.add((user_id, category))
+
+        recent = self.recent.get(user_id)
+        if recent is None:
+            recent = self.recent[user_id] = deque(maxlen=VELOCITY_MAXLEN)
+        recent.append(now)
+        for window, limit, label in VELOCITY_WINDOWS:
+            in_window = sum(1 for t in recent if now - t <= window)
+            if in_window == limit + 1:
+                alerts.append((
+                    "High Velocity",
+                    f"{in_window} expenses recorded within {label}",
+                ))
+
+        self.updates_since_persist += 1
+        return alerts
+
+    def should_persist(self):
+        return bool(self.dirty) and (
+            self.updates_since_persist >= PERSIST_EVERY
+            or time.monotonic() - self.last_persist >= PERSIST_INTERVAL
+        )
+
+    def drain_dirty(self):
+        """Return changed state as (user_id, category, count, mean, m2) rows and reset"""
+        with self.lock:
+            rows = [(u, c, *self.stats[(u, c)]) for u, c in self.dirty]
+            self.dirty.clear()
+            self.updates_since_persist = 0
+            self.last_persist = time.monotonic()
+        return rows
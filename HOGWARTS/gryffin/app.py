@@ -3,14 +3,35 @@ GryffinTwin FastAPI Backend
 Financial Management System with SQLite
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import create_engine, event, insert, update, case, text, bindparam, Column, ForeignKey, Integer, String, Float, DateTime, Boolean, Index, LargeBinary, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from pydantic import BaseModel
 from datetime import datetime, timedelta
+import json
 import os
+import re
+import uuid
+
+from anomaly import ExpenseAnomalyDetector
+from budgets import budget_status, month_key, spend_deltas
+from categorize import Categorizer, FALLBACK_CATEGORY
+from currency import EPOCH, REFERENCE, RateCache, UnknownRate, rate_files, read_rate_files
+from events import EventHub
+from forecast import forecast_goals
+from idempotency import IdempotencyStore, KeyInProgress, KeyReused, request_fingerprint
+from jobs import JobQueue
+from money import Money, cents, from_cents, migrate_money_columns, to_cents
+from passwords import PasswordHasher, PoolBusy
+from portfolio import PriceBook, value_holdings
+from ratelimit import RateLimiter, check_login_limits
+from recurring import Cadence
+from summary import flush_deltas, summary_to_dict
 
 # Database Setup
 DATABASE_URL = "sqlite:///./gryfftwin.db"
@@ -18,6 +39,26 @@ engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Password Hashing: log2 of the scrypt work factor (each step doubles the cost of a login)
+PASSWORD_HASH_COST = 15
+PASSWORD_HASH_WORKERS = 2
+
+# Login Rate Limits: token buckets per client IP and per email.
+# Set RATE_LIMIT_DB to a file path to share the buckets between worker processes.
+RATE_LIMIT_DB = None
+LOGIN_IP_LIMIT = {"rate": 10 / 60, "burst": 10}  # 10 attempts, then one every 6 s
+LOGIN_EMAIL_LIMIT = {"rate": 1 / 60, "burst": 5}  # 5 attempts, then one a minute
+
+# Idempotency Keys: how long a stored response is replayed to retries
+IDEMPOTENCY_TTL = 24 * 3600
+
+# Exchange Rates: a directory of CSV files with date,currency,rate rows, where
+# rate is the USD value of one unit. Files are re-read when they change.
+RATES_PATH = "rates"
+
+# Prices: CSV files with date,symbol,price rows in USD, in the same layout as the rate files
+PRICES_PATH = "prices"
+
 # FastAPI App
 app = FastAPI(title="GryffinTwin API", version="1.0")
 
@@ -39,19 +80,45 @@ class User(Base):
     email = Column(String, unique=True, index=True)
     password = Column(String)
     name = Column(String)
+    base_currency = Column(String, default=REFERENCE)  # totals are reported in this currency
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class Category(Base):
+    __tablename__ = "categories"
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, unique=True, nullable=False)
+
 class Expense(Base):
     __tablename__ = "expenses"
+    __table_args__ = (Index("ix_expenses_user_foreign", "user_id", "date", sqlite_where=text("currency IS NOT NULL")),)
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer)
-    category = Column(String)
+    category_id = Column(Integer, ForeignKey("categories.id"), index=True)
     description = Column(String)
-    amount = Column(Float)
+    amount = Column(Money)
+    currency = Column(String)  # NULL for the user's base currency
     date = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="Completed")
 
+    @property
+    def category(self):
+        pending = getattr(self, "_pending_category", None)
+        return pending if pending is not None else categories.name(self.category_id)
+
+    @category.setter
+    def category(self, name):
+        category_id = categories.cached_id(name)
+        if category_id is not None:
+            self.category_id = category_id
+            return
+        # Unknown name: resolved to an id inside the flush (see resolve_categories).
+        # Clearing the id marks the row dirty and keeps the old id in the
+        # attribute history, which the budget spend deltas move the amount from.
+        self._pending_category = name
+        self.category_id = None
+
 class Goal(Base):
     __tablename__ = "goals"
     
@@ -59,23 +126,33 @@ class Goal(Base):
     user_id = Column(Integer)
     name = Column(String)
     description = Column(String)
-    target_amount = Column(Float)
-    current_amount = Column(Float, default=0)
+    target_amount = Column(Money)
+    current_amount = Column(Money, default=0)
     status = Column(String, default="Active")
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Transaction(Base):
+    """Append-only ledger: income entries add to the balance, expense entries subtract"""
     __tablename__ = "transactions"
+    __table_args__ = (
+        Index("ix_transactions_user_id_id", "user_id", "id"),
+        Index("ix_transactions_user_id_date", "user_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer)
     type = Column(String)  # income or expense
-    amount = Column(Float)
+    amount = Column(Money)
     date = Column(DateTime, default=datetime.utcnow)
     description = Column(String)
 
 class SecurityAlert(Base):
     __tablename__ = "security_alerts"
+    __table_args__ = (
+        # Open alerts are few; the overview counts and lists them from this index alone
+        Index("ix_security_alerts_unresolved", "user_id", "timestamp", sqlite_where=text("resolved = 0")),
+        Index("ix_security_alerts_resolved", "user_id", "timestamp", sqlite_where=text("resolved = 1")),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer)
@@ -84,26 +161,350 @@ class SecurityAlert(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     resolved = Column(Boolean, default=False)
 
+class AlertCount(Base):
+    """Resolved alerts per user, month and type, kept after the alerts themselves are compacted"""
+    __tablename__ = "security_alert_counts"
+    
+    user_id = Column(Integer, primary_key=True)
+    month = Column(String, primary_key=True)  # YYYY-MM
+    alert_type = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+
+class ExpenseStat(Base):
+    __tablename__ = "expense_stats"
+    
+    user_id = Column(Integer, primary_key=True)
+    category = Column(String, primary_key=True)
+    count = Column(Integer, default=0)
+    mean = Column(Float, default=0)
+    m2 = Column(Float, default=0)
+
+class Change(Base):
+    __tablename__ = "changes"
+    __table_args__ = (
+        Index("ix_changes_user_seq", "user_id", "seq"),
+        {"sqlite_autoincrement": True},
+    )
+    
+    seq = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    entity = Column(String)
+    entity_id = Column(Integer)
+    op = Column(String)  # upsert or delete
+
+class GoalContribution(Base):
+    __tablename__ = "goal_contributions"
+    __table_args__ = (Index("ix_goal_contributions_goal_date", "goal_id", "date"),)
+    
+    id = Column(Integer, primary_key=True)
+    goal_id = Column(Integer)
+    user_id = Column(Integer)
+    amount = Column(Money)
+    note = Column(String, default="")
+    date = Column(DateTime, default=datetime.utcnow)
+
+class UserSummary(Base):
+    __tablename__ = "user_summaries"
+    
+    user_id = Column(Integer, primary_key=True)
+    total_expenses = Column(Money, default=0)
+    expense_count = Column(Integer, default=0)
+    total_income = Column(Money, default=0)
+    transaction_count = Column(Integer, default=0)
+    goal_target = Column(Money, default=0)
+    goal_current = Column(Money, default=0)
+    goal_count = Column(Integer, default=0)
+    active_goals = Column(Integer, default=0)
+
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (
+        Index("ix_balance_snapshots_user_txn", "user_id", "last_txn_id"),
+        Index("ix_balance_snapshots_user_as_of", "user_id", "as_of"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    last_txn_id = Column(Integer)  # ledger entries with id <= last_txn_id are included
+    as_of = Column(DateTime)  # latest entry date covered
+    balance = Column(Money)
+    entries = Column(Integer)
+
+class CategoryRule(Base):
+    """Keyword -> category rule for automatic categorization; user_id NULL is a global rule"""
+    __tablename__ = "category_rules"
+    __table_args__ = (Index("ix_category_rules_user_keyword", "user_id", "keyword", unique=True),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    keyword = Column(String, nullable=False)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class Budget(Base):
+    """Monthly limit and running spend for one category; category_id NULL holds the overall limit"""
+    __tablename__ = "budgets"
+    __table_args__ = (
+        Index("ix_budgets_user_category_month", "user_id", "category_id", "month", unique=True),
+        Index("ix_budgets_user_month", "user_id", "month"),
+        Index("ix_budgets_user_month_overall", "user_id", "month", unique=True, sqlite_where=text("category_id IS NULL")),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+    month = Column(String)  # YYYY-MM
+    limit_amount = Column(Money)
+    spent = Column(Money, default=0)
+
+class RecurringRule(Base):
+    """A salary, rent or subscription posted automatically on a cron-style cadence"""
+    __tablename__ = "recurring_rules"
+    __table_args__ = (Index("ix_recurring_rules_active_next_run", "active", "next_run"),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, index=True)
+    kind = Column(String, default="expense")  # expense or income
+    cadence = Column(String)
+    amount = Column(Money)
+    category_id = Column(Integer, ForeignKey("categories.id"))
+    description = Column(String)
+    start_date = Column(DateTime, default=datetime.utcnow)
+    end_date = Column(DateTime)
+    next_run = Column(DateTime)  # first occurrence not yet posted
+    last_run = Column(DateTime)
+    active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RecurringOccurrence(Base):
+    """One row per posted occurrence, so a rule never posts the same period twice"""
+    __tablename__ = "recurring_occurrences"
+    
+    rule_id = Column(Integer, primary_key=True)
+    occurs_at = Column(DateTime, primary_key=True)
+    posted_at = Column(DateTime, default=datetime.utcnow)
+    batch = Column(String, index=True)  # the scheduler run that claimed it
+
+class ExchangeRate(Base):
+    """Daily rate per currency, loaded from the files under RATES_PATH"""
+    __tablename__ = "exchange_rates"
+    
+    currency = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)  # YYYY-MM-DD
+    rate = Column(Float)  # USD value of one unit
+
+class Price(Base):
+    """Daily closing price per symbol, loaded from the files under PRICES_PATH"""
+    __tablename__ = "prices"
+    
+    symbol = Column(String, primary_key=True)
+    day = Column(String, primary_key=True)  # YYYY-MM-DD
+    price = Column(Float)  # USD
+
+class Holding(Base):
+    """A user's position in one symbol, with running totals of its lots"""
+    __tablename__ = "holdings"
+    __table_args__ = (Index("ix_holdings_user_symbol", "user_id", "symbol", unique=True),)
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    symbol = Column(String)
+    quantity = Column(Float, default=0)
+    cost_basis = Column(Money, default=0)  # USD, at average cost
+    realized_gain = Column(Money, default=0)  # USD, from sales
+
+class Lot(Base):
+    """One purchase or sale of a holding; quantity is negative for a sale"""
+    __tablename__ = "lots"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer)
+    holding_id = Column(Integer, ForeignKey("holdings.id"), index=True)
+    quantity = Column(Float)
+    price = Column(Float)  # USD per unit
+    cost = Column(Money)  # cost basis the lot added; negative for a sale, which removes it at average cost
+    date = Column(DateTime, default=datetime.utcnow)
+
+class IdempotencyKey(Base):
+    """The response to a POST sent with an Idempotency-Key, replayed to its retries"""
+    __tablename__ = "idempotency_keys"
+    
+    scope = Column(String, primary_key=True)  # the path the key was sent to
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String)  # hash of method, path and body
+    status = Column(Integer)  # NULL while the first request is running
+    body = Column(LargeBinary)
+    content_type = Column(String)
+    expires_at = Column(Float, index=True)  # Unix time
+
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# ==================== MIGRATIONS ====================
+
+def _post_expenses_to_ledger(conn):
+    """Expenses now post to the transactions ledger; backfill existing ones"""
+    conn.exec_driver_sql(
+        "INSERT INTO transactions (user_id, type, amount, date, description) "
+        "SELECT user_id, 'expense', amount, date, description FROM expenses ORDER BY date, id"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_transactions_user_id_id ON transactions (user_id, id)")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_transactions_user_id_date ON transactions (user_id, date)")
+    for op in ("UPDATE", "DELETE"):
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER IF NOT EXISTS transactions_no_{op.lower()} BEFORE {op} ON transactions "
+            "BEGIN SELECT RAISE(ABORT, 'transactions ledger is append-only'); END"
+        )
+
+def _create_search_index(conn):
+    """FTS5 indexes over descriptions, kept in sync with their tables by triggers"""
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5("
+        "user_id, description, content='expenses', content_rowid='id', prefix='2 3')"
+    )
+    conn.exec_driver_sql(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5("
+        "user_id, type, description, content='transactions', content_rowid='id', prefix='2 3')"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses BEGIN "
+        "INSERT INTO expenses_fts (rowid, user_id, description) VALUES (new.id, new.user_id, new.description); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses BEGIN "
+        "INSERT INTO expenses_fts (expenses_fts, rowid, user_id, description) "
+        "VALUES ('delete', old.id, old.user_id, old.description); END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF user_id, description ON expenses BEGIN "
+        "INSERT INTO expenses_fts (expenses_fts, rowid, user_id, description) "
+        "VALUES ('delete', old.id, old.user_id, old.description); "
+        "INSERT INTO expenses_fts (rowid, user_id, description) VALUES (new.id, new.user_id, new.description); END"
+    )
+    # The ledger is append-only, so inserts are the only change to follow
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions BEGIN "
+        "INSERT INTO transactions_fts (rowid, user_id, type, description) "
+        "VALUES (new.id, new.user_id, new.type, new.description); END"
+    )
+    conn.exec_driver_sql("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+    conn.exec_driver_sql("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+def _encode_categories(conn):
+    """Replace the free-text expenses.category column with a categories.id reference"""
+    columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(expenses)")}
+    if "category" not in columns:
+        return  # created with the new schema
+    if "category_id" not in columns:
+        conn.exec_driver_sql("ALTER TABLE expenses ADD COLUMN category_id INTEGER REFERENCES categories (id)")
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO categories (name) "
+        "SELECT DISTINCT category FROM expenses WHERE category IS NOT NULL"
+    )
+    conn.exec_driver_sql(
+        "UPDATE expenses SET category_id = (SELECT id FROM categories WHERE name = expenses.category)"
+    )
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_expenses_category_id ON expenses (category_id)")
+    conn.exec_driver_sql("ALTER TABLE expenses DROP COLUMN category")
+
+# Money columns stored as integer cents, per table
+MONEY_COLUMNS = {
+    "expenses": ["amount"],
+    "goals": ["target_amount", "current_amount"],
+    "transactions": ["amount"],
+    "goal_contributions": ["amount"],
+    "user_summaries": ["total_expenses", "total_income", "goal_target", "goal_current"],
+    "balance_snapshots": ["balance"],
+}
+
+def _store_money_as_cents(conn):
+    migrate_money_columns(conn, MONEY_COLUMNS)
+
+def _count_budget_spend(conn):
+    """Seed the monthly spend counters from existing expenses"""
+    conn.exec_driver_sql(
+        "INSERT OR IGNORE INTO budgets (user_id, category_id, month, spent) "
+        "SELECT user_id, category_id, strftime('%Y-%m', date), SUM(amount) FROM expenses "
+        "WHERE category_id IS NOT NULL GROUP BY user_id, category_id, strftime('%Y-%m', date)"
+    )
+
+def _index_security_alerts(conn):
+    """create_all skips indexes on tables that already exist"""
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_security_alerts_unresolved ON security_alerts (user_id, timestamp) WHERE resolved = 0"
+    )
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_security_alerts_resolved ON security_alerts (user_id, timestamp) WHERE resolved = 1"
+    )
+
+def _add_currencies(conn):
+    """Existing users keep USD as their base currency and existing expenses are in it"""
+    user_columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(users)")}
+    if "base_currency" not in user_columns:
+        conn.exec_driver_sql(f"ALTER TABLE users ADD COLUMN base_currency VARCHAR DEFAULT '{REFERENCE}'")
+    expense_columns = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(expenses)")}
+    if "currency" not in expense_columns:
+        conn.exec_driver_sql("ALTER TABLE expenses ADD COLUMN currency VARCHAR")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_expenses_user_foreign ON expenses (user_id, date) WHERE currency IS NOT NULL"
+    )
+
+# Applied in order; PRAGMA user_version records how many have run
+MIGRATIONS = [
+    _post_expenses_to_ledger,
+    _create_search_index,
+    _encode_categories,
+    _store_money_as_cents,
+    _count_budget_spend,
+    _index_security_alerts,
+    _add_currencies,
+]
+
+def run_migrations():
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+run_migrations()
+
 # ==================== PYDANTIC SCHEMAS ====================
 
 class UserCreate(BaseModel):
     email: str
     password: str
     name: str
+    base_currency: str = REFERENCE
 
 class UserLogin(BaseModel):
     email: str
     password: str
 
 class ExpenseCreate(BaseModel):
-    category: str
+    category: str = None  # categorized automatically when omitted
     description: str
     amount: float
+    currency: str = None  # defaults to the user's base currency
     date: datetime = None
 
+class ExpenseUpdate(BaseModel):
+    category: str
+
+class RecurringRuleCreate(BaseModel):
+    kind: str = "expense"  # expense or income
+    cadence: str  # cron expression or @daily/@weekly/@monthly/@yearly
+    amount: float
+    category: str = None
+    description: str
+    start_date: datetime = None
+    end_date: datetime = None
+
+class BudgetSet(BaseModel):
+    category: str = None  # omitted for the overall monthly limit
+    limit: float = None  # None clears the limit
+    month: str = None  # YYYY-MM, defaults to the current month
+
 class GoalCreate(BaseModel):
     name: str
     description: str
@@ -113,11 +514,681 @@ class GoalUpdate(BaseModel):
     current_amount: float = None
     status: str = None
 
+class GoalContributionCreate(BaseModel):
+    amount: float
+    note: str = ""
+
+class BatchOperation(BaseModel):
+    op: str  # delete, update, or adjust (goals only)
+    ids: list[int] = []
+    category: str = None  # update: new expense category
+    status: str = None  # update: new status
+    amounts: dict[int, float] = {}  # adjust: goal id -> amount added to current_amount
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation]
+
+class LotCreate(BaseModel):
+    symbol: str
+    quantity: float  # negative to sell
+    price: float  # USD per unit
+    date: datetime = None
+
 class TransactionCreate(BaseModel):
     type: str
     amount: float
     description: str = ""
 
+# ==================== SERIALIZERS ====================
+
+def expense_to_dict(e):
+    return {
+        "id": e.id,
+        "category": e.category,
+        "description": e.description,
+        "amount": e.amount,
+        "currency": e.currency,  # None for the user's base currency
+        "date": e.date,
+        "status": e.status,
+    }
+
+def goal_to_dict(g):
+    return {
+        "id": g.id,
+        "name": g.name,
+        "description": g.description,
+        "target_amount": g.target_amount,
+        "current_amount": g.current_amount,
+        "progress": round(g.current_amount / g.target_amount * 100, 1) if g.target_amount > 0 else 0,
+        "status": g.status,
+    }
+
+def transaction_to_dict(t):
+    return {
+        "id": t.id,
+        "type": t.type,
+        "amount": t.amount,
+        "date": t.date,
+        "description": t.description,
+    }
+
+def lot_to_dict(l):
+    return {
+        "id": l.id,
+        "holding_id": l.holding_id,
+        "quantity": l.quantity,
+        "price": l.price,
+        "cost": l.cost,
+        "date": l.date,
+    }
+
+def recurring_rule_to_dict(r):
+    return {
+        "id": r.id,
+        "kind": r.kind,
+        "cadence": r.cadence,
+        "amount": r.amount,
+        "category": categories.name(r.category_id),
+        "description": r.description,
+        "start_date": r.start_date,
+        "end_date": r.end_date,
+        "next_run": r.next_run,
+        "last_run": r.last_run,
+        "active": r.active,
+    }
+
+def alert_to_dict(a):
+    return {
+        "id": a.id,
+        "type": a.alert_type,
+        "message": a.message,
+        "timestamp": a.timestamp,
+        "resolved": a.resolved,
+    }
+
+# ==================== CATEGORIES ====================
+
+class CategoryMap:
+    """
+    Process-wide id <-> name cache for the small categories dictionary.
+
+    A name created inside a transaction is kept on its session until the
+    commit, and only then shared. A rolled-back transaction drops its own
+    names and leaves everyone else's cached ids alone.
+    """
+
+    def __init__(self):
+        self.by_id = {}
+        self.by_name = {}
+
+    def _load(self):
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT id, name FROM categories")).all()
+        self.by_id = dict(rows)
+        self.by_name = {name: category_id for category_id, name in rows}
+
+    def name(self, category_id):
+        if category_id is None:
+            return None
+        if category_id not in self.by_id:
+            self._load()
+        return self.by_id.get(category_id)
+
+    def cached_id(self, name):
+        return self.by_name.get(name)
+
+    def _remember(self, name, category_id):
+        self.by_name[name] = category_id
+        self.by_id[category_id] = name
+
+    def id_for(self, session: Session, name: str) -> int:
+        """Look up or create a category inside the caller's transaction"""
+        category_id = self.by_name.get(name)
+        if category_id is not None:
+            return category_id
+        created = session.info.setdefault("new_categories", {})
+        category_id = created.get(name)
+        if category_id is None:
+            inserted = session.execute(sqlite_insert(Category).values(name=name).on_conflict_do_nothing()).rowcount
+            category_id = session.execute(text("SELECT id FROM categories WHERE name = :name"), {"name": name}).scalar()
+            if inserted:
+                created[name] = category_id
+            else:
+                self._remember(name, category_id)
+        return category_id
+
+    def publish(self, session: Session):
+        """Share the names a session created, once its transaction has committed"""
+        for name, category_id in session.info.pop("new_categories", {}).items():
+            self._remember(name, category_id)
+
+    def discard(self, session: Session):
+        """Drop the names a rolled-back session created; their ids may be reused"""
+        session.info.pop("new_categories", None)
+
+categories = CategoryMap()
+
+@event.listens_for(SessionLocal, "before_flush")
+def resolve_categories(session, flush_context, instances):
+    for obj in list(session.new) + list(session.dirty):
+        pending = getattr(obj, "_pending_category", None)
+        if isinstance(obj, Expense) and pending is not None:
+            obj.category_id = categories.id_for(session, pending)
+            obj._pending_category = None
+
+@event.listens_for(SessionLocal, "after_commit")
+def publish_new_categories(session):
+    categories.publish(session)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def forget_uncommitted_categories(session):
+    categories.discard(session)
+
+# ==================== CATEGORIZER ====================
+
+categorizer = Categorizer()
+
+def load_category_rules():
+    db = SessionLocal()
+    try:
+        rows = db.query(CategoryRule.user_id, CategoryRule.keyword, CategoryRule.category_id).all()
+        categorizer.load((user_id, keyword, categories.name(category_id)) for user_id, keyword, category_id in rows)
+    finally:
+        db.close()
+
+def categorize(user_id: int, expenses):
+    """Categories for a batch of ExpenseCreate, filling in the ones left blank"""
+    missing = [e.description for e in expenses if not e.category]
+    guessed = iter(categorizer.classify_many(user_id, missing))
+    return [e.category or next(guessed) or FALLBACK_CATEGORY for e in expenses]
+
+# ==================== CURRENCIES ====================
+
+RATES_RELOAD_INTERVAL = 3600.0
+
+rate_cache = RateCache()
+_rate_files = {}  # rate file -> mtime when it was loaded
+_base_currencies = {}  # user id -> base currency, which is fixed at registration
+
+def load_rates(force: bool = False):
+    """Upsert new or changed rate files into exchange_rates, then reload the cache from the table"""
+    changed = {name: mtime for name, mtime in rate_files(RATES_PATH) if _rate_files.get(name) != mtime}
+    if not changed and not force:
+        return 0
+    rows = [(REFERENCE, EPOCH, 1.0)] + read_rate_files(changed)
+    stmt = sqlite_insert(ExchangeRate)
+    with engine.begin() as conn:
+        conn.execute(
+            stmt.on_conflict_do_update(index_elements=["currency", "day"], set_={"rate": stmt.excluded.rate}),
+            [{"currency": currency, "day": day, "rate": rate} for currency, day, rate in rows],
+        )
+        table = conn.execute(text("SELECT currency, day, rate FROM exchange_rates ORDER BY currency, day")).all()
+    rate_cache.load(table)
+    _rate_files.update(changed)
+    return len(rows) - 1
+
+def base_currency(db: Session, user_id: int) -> str:
+    base = _base_currencies.get(user_id)
+    if base is None:
+        base = db.query(User.base_currency).filter(User.id == user_id).scalar()
+        if base is None:
+            return REFERENCE
+        _base_currencies[user_id] = base
+    return base
+
+def stored_currency(db: Session, user_id: int, currency: str):
+    """The currency to store on an expense: None when it is the user's base currency"""
+    currency = currency.strip().upper() if currency else None
+    return None if currency in (None, base_currency(db, user_id)) else currency
+
+def in_base(db: Session, user_id: int, amount: float, currency: str, date: datetime) -> float:
+    """An amount converted to the user's base currency at the rate for its date, from the cache"""
+    if currency is None:
+        return amount
+    try:
+        return from_cents(rate_cache.convert(to_cents(amount), currency, base_currency(db, user_id), date.strftime("%Y-%m-%d")))
+    except UnknownRate as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _rate_on(currency: str, day: str) -> str:
+    return f"(SELECT rate FROM exchange_rates WHERE currency = {currency} AND day <= {day} ORDER BY day DESC LIMIT 1)"
+
+def _in_base(base: str) -> str:
+    """
+    An expense `e` in cents of the `base` currency; NULL when a rate is missing.
+    Each rate is one primary-key seek, so conversion stays inside the aggregate query.
+    """
+    return (
+        "CASE WHEN e.currency IS NULL THEN e.amount ELSE CAST(ROUND(e.amount * "
+        f"{_rate_on('e.currency', 'substr(e.date, 1, 10)')} / {_rate_on(base, 'substr(e.date, 1, 10)')}) AS INTEGER) END"
+    )
+
+_IN_BASE = _in_base(":base")
+FOREIGN_EXPENSES_SQL = text(f"""
+    SELECT COALESCE(SUM(amount), 0), COUNT(*) - COUNT(amount) FROM (
+        SELECT {_IN_BASE} AS amount FROM expenses e WHERE e.user_id = :user_id AND e.currency IS NOT NULL
+    )
+""")
+CATEGORY_TOTALS_SQL = text(f"""
+    SELECT category_id, SUM(amount) FROM (
+        SELECT e.category_id, {_IN_BASE} AS amount FROM expenses e WHERE e.user_id = :user_id
+    ) GROUP BY category_id
+""")
+MONTHLY_SPEND_SQL = text(f"""
+    SELECT substr(e.date, 1, 7), SUM({_IN_BASE}) FROM expenses e WHERE e.user_id = :user_id GROUP BY 1
+""")
+# Every user's expenses in their own base currency, for bootstrapping per-category statistics
+EXPENSE_HISTORY_SQL = text(f"""
+    SELECT user_id, category_id, COUNT(amount), SUM(amount), SUM(amount * amount) FROM (
+        SELECT e.user_id, e.category_id, {_in_base(f"COALESCE(u.base_currency, '{REFERENCE}')")} AS amount
+        FROM expenses e LEFT JOIN users u ON u.id = e.user_id
+    ) GROUP BY user_id, category_id
+""")
+FOREIGN_SPEND_SQL = text(f"""
+    SELECT category_id, SUM(amount) FROM (
+        SELECT e.category_id, {_IN_BASE} AS amount FROM expenses e
+        WHERE e.user_id = :user_id AND e.currency IS NOT NULL AND substr(e.date, 1, 7) = :month
+    ) GROUP BY category_id
+""")
+
+# ==================== PORTFOLIO ====================
+
+PRICES_RELOAD_INTERVAL = 3600.0
+
+price_book = PriceBook()
+_price_files = {}  # price file -> mtime when it was loaded
+_valuation_cache = {}  # user id -> ((data version, price epoch, fx), valuation)
+
+HOLDINGS_SQL = text("SELECT symbol, quantity, cost_basis, realized_gain FROM holdings WHERE user_id = :user_id")
+
+def load_prices(force: bool = False):
+    """Upsert new or changed price files into prices, then refresh the latest price per symbol"""
+    changed = {name: mtime for name, mtime in rate_files(PRICES_PATH) if _price_files.get(name) != mtime}
+    if not changed and not force:
+        return 0
+    rows = read_rate_files(changed)  # (symbol, day, price); price files share the rate file layout
+    with engine.begin() as conn:
+        if rows:
+            stmt = sqlite_insert(Price)
+            conn.execute(
+                stmt.on_conflict_do_update(index_elements=["symbol", "day"], set_={"price": stmt.excluded.price}),
+                [{"symbol": symbol, "day": day, "price": price} for symbol, day, price in rows],
+            )
+        # SQLite takes the bare price column from the row that holds MAX(day)
+        latest = conn.execute(text("SELECT symbol, MAX(day), price FROM prices GROUP BY symbol")).all()
+    _price_files.update(changed)
+    return price_book.load(latest)
+
+def portfolio_valuation(db: Session, user_id: int):
+    """
+    The user's portfolio in their base currency, cached until their data,
+    the prices or the exchange rate change. A miss reads one row per holding.
+    """
+    base = base_currency(db, user_id)
+    try:
+        fx = 1.0 if base == REFERENCE else 1 / rate_cache.rate(base, datetime.utcnow().strftime("%Y-%m-%d"))
+    except UnknownRate as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    epoch, prices = price_book.snapshot()
+    key = (data_version(user_id), epoch, fx)
+    cached = _valuation_cache.get(user_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    holdings = db.execute(HOLDINGS_SQL, {"user_id": user_id}).all()
+    valuation = value_holdings(
+        [h.symbol for h in holdings],
+        [h.quantity for h in holdings],
+        [h.cost_basis for h in holdings],
+        [h.realized_gain for h in holdings],
+        prices,
+        fx,
+    )
+    valuation["currency"] = base
+    _valuation_cache[user_id] = (key, valuation)
+    return valuation
+
+def book_lot(db: Session, user_id: int, lot: LotCreate) -> Lot:
+    """Add a lot and fold it into its holding's running totals"""
+    symbol = lot.symbol.strip().upper()
+    if not symbol or lot.quantity == 0 or lot.price < 0:
+        raise HTTPException(status_code=400, detail="A lot needs a symbol, a non-zero quantity and a price")
+    holding = db.query(Holding).filter(Holding.user_id == user_id, Holding.symbol == symbol).first()
+    if holding is None:
+        holding = Holding(user_id=user_id, symbol=symbol, quantity=0, cost_basis=0, realized_gain=0)
+        db.add(holding)
+        db.flush()
+    if lot.quantity < 0 and -lot.quantity > holding.quantity + 1e-9:
+        raise HTTPException(status_code=400, detail=f"Only {holding.quantity:g} {symbol} held")
+    
+    if lot.quantity > 0:
+        cost = round(lot.quantity * to_cents(lot.price))
+    else:
+        # A sale removes its share of the basis at average cost and realizes the difference
+        cost = -round(to_cents(holding.cost_basis) * -lot.quantity / holding.quantity)
+        holding.realized_gain = from_cents(to_cents(holding.realized_gain) + round(-lot.quantity * to_cents(lot.price)) + cost)
+    quantity = round(holding.quantity + lot.quantity, 8)
+    holding.quantity = quantity
+    holding.cost_basis = from_cents(to_cents(holding.cost_basis) + cost) if quantity else 0
+    db_lot = Lot(
+        user_id=user_id,
+        holding_id=holding.id,
+        quantity=lot.quantity,
+        price=lot.price,
+        cost=from_cents(cost),
+        date=lot.date or datetime.utcnow(),
+    )
+    db.add(db_lot)
+    return db_lot
+
+# ==================== CHANGE LOG ====================
+
+# Entities tracked for delta sync: name -> (model, serializer)
+SYNCED_ENTITIES = {
+    "expenses": (Expense, expense_to_dict),
+    "goals": (Goal, goal_to_dict),
+    "transactions": (Transaction, transaction_to_dict),
+    "alerts": (SecurityAlert, alert_to_dict),
+    "lots": (Lot, lot_to_dict),
+}
+_ENTITY_NAMES = {model: name for name, (model, _) in SYNCED_ENTITIES.items()}
+
+@event.listens_for(SessionLocal, "after_flush")
+def record_changes(session, flush_context):
+    """
+    Append a change row for every flushed write to a synced entity, in the
+    same transaction as the write. Bulk Query.delete() calls bypass the ORM
+    and are not recorded.
+    """
+    changed = [(obj, "upsert") for obj in session.new]
+    changed += [(obj, "upsert") for obj in session.dirty if session.is_modified(obj)]
+    changed += [(obj, "delete") for obj in session.deleted]
+    rows = [
+        {"user_id": obj.user_id, "entity": _ENTITY_NAMES[type(obj)], "entity_id": obj.id, "op": op}
+        for obj, op in changed
+        if type(obj) in _ENTITY_NAMES
+    ]
+    if rows:
+        session.execute(insert(Change), rows)
+
+def record_change(db: Session, user_id: int, entity: str, entity_id: int, op: str = "upsert"):
+    """Log a change made with a Core statement that the flush listener cannot see"""
+    db.execute(insert(Change).values(user_id=user_id, entity=entity, entity_id=entity_id, op=op))
+
+# ==================== INCREMENTAL SUMMARIES ====================
+
+_SUMMARY_KINDS = {Expense: "expense", Goal: "goal", Transaction: "transaction"}
+
+@event.listens_for(SessionLocal, "after_flush")
+def update_summaries(session, flush_context):
+    """Apply each flush's effect on per-user totals in the same transaction"""
+    for user_id, deltas in flush_deltas(session, _SUMMARY_KINDS).items():
+        apply_summary_deltas(session, user_id, deltas)
+
+def apply_summary_deltas(db: Session, user_id: int, deltas: dict):
+    db.execute(
+        update(UserSummary)
+        .where(UserSummary.user_id == user_id)
+        .values({field: getattr(UserSummary, field) + delta for field, delta in deltas.items()})
+    )
+
+def get_summary(db: Session, user_id: int) -> UserSummary:
+    """The user's running totals, built with one aggregate pass the first time"""
+    summary = db.get(UserSummary, user_id)
+    if summary is None:
+        build_summary(user_id)
+        summary = db.get(UserSummary, user_id)
+    return summary
+
+def build_summary(user_id: int):
+    """
+    Insert a user's summary row from their committed rows.
+
+    Runs in its own session, so a read never commits whatever the caller's
+    session has pending.
+    """
+    with SessionLocal() as db:
+        total_expenses, expense_count = db.query(
+            func.coalesce(func.sum(Expense.amount).filter(Expense.currency.is_(None)), 0),
+            func.count(Expense.id),
+        ).filter(Expense.user_id == user_id).one()
+        total_income, transaction_count = db.query(
+            func.coalesce(func.sum(Transaction.amount).filter(Transaction.type == "income"), 0),
+            func.count(Transaction.id),
+        ).filter(Transaction.user_id == user_id).one()
+        goal_target, goal_current, goal_count, active_goals = db.query(
+            func.coalesce(func.sum(Goal.target_amount), 0),
+            func.coalesce(func.sum(Goal.current_amount), 0),
+            func.count(Goal.id),
+            func.count(Goal.id).filter(Goal.status == "Active"),
+        ).filter(Goal.user_id == user_id).one()
+        db.execute(
+            sqlite_insert(UserSummary)
+            .values(
+                user_id=user_id,
+                total_expenses=total_expenses,
+                expense_count=expense_count,
+                total_income=total_income,
+                transaction_count=transaction_count,
+                goal_target=goal_target,
+                goal_current=goal_current,
+                goal_count=goal_count,
+                active_goals=active_goals,
+            )
+            .on_conflict_do_nothing()
+        )
+        db.commit()
+
+def user_totals(db: Session, user_id: int) -> dict:
+    """
+    Dashboard totals in the user's base currency.
+
+    The summary row covers base-currency expenses. Foreign-currency ones are
+    added from one SQL pass over the user's foreign rows, through a partial
+    index, so users without any pay nothing extra.
+    """
+    totals = summary_to_dict(get_summary(db, user_id))
+    base = base_currency(db, user_id)
+    foreign, unconverted = db.execute(FOREIGN_EXPENSES_SQL, {"user_id": user_id, "base": base}).one()
+    if foreign:
+        totals["total_expenses"] = from_cents(to_cents(totals["total_expenses"]) + foreign)
+        totals["balance"] = from_cents(to_cents(totals["balance"]) - foreign)
+    totals["currency"] = base
+    totals["unconverted_expenses"] = unconverted  # foreign expenses dated before their currency's first rate
+    return totals
+
+def wants_representation(prefer) -> bool:
+    """Clients opt in to full mutation responses with `Prefer: return=representation`"""
+    return prefer is not None and "return=representation" in prefer
+
+# ==================== BUDGETS ====================
+
+@event.listens_for(SessionLocal, "after_flush")
+def update_budget_spend(session, flush_context):
+    """Apply each flush's expense changes to the monthly spend counters"""
+    for (user_id, category_id, month), delta in spend_deltas(session, Expense, "category_id").items():
+        if category_id is not None:
+            add_spend(session, user_id, category_id, month, delta)
+
+def add_spend(db: Session, user_id: int, category_id: int, month: str, delta: float):
+    updated = db.execute(
+        update(Budget)
+        .where(Budget.user_id == user_id, Budget.category_id == category_id, Budget.month == month)
+        .values(spent=Budget.spent + delta)
+    ).rowcount
+    if not updated:
+        roll_budgets_forward(db, user_id, month)
+        db.execute(
+            sqlite_insert(Budget)
+            .values(user_id=user_id, category_id=category_id, month=month, spent=delta)
+            .on_conflict_do_update(index_elements=["user_id", "category_id", "month"], set_={"spent": Budget.spent + delta})
+        )
+
+def roll_budgets_forward(db: Session, user_id: int, month: str):
+    """
+    Carry limits from the user's latest earlier month into a month's first row.
+
+    Called whenever a month gains a row, so every month with rows holds the
+    full set of limits and the next one can copy from it.
+    """
+    db.execute(
+        text(
+            "INSERT OR IGNORE INTO budgets (user_id, category_id, month, limit_amount, spent) "
+            "SELECT user_id, category_id, :month, limit_amount, 0 FROM budgets "
+            "WHERE user_id = :user_id AND limit_amount IS NOT NULL "
+            "AND month = (SELECT MAX(month) FROM budgets WHERE user_id = :user_id AND month < :month)"
+        ),
+        {"user_id": user_id, "month": month},
+    )
+
+# This month's rows, plus limits that will roll forward from the latest earlier month
+BUDGET_STATUS_SQL = text("""
+    SELECT category_id, limit_amount, spent FROM budgets
+    WHERE user_id = :user_id AND month = :month
+    UNION ALL
+    SELECT category_id, limit_amount, 0 FROM budgets AS prev
+    WHERE user_id = :user_id AND limit_amount IS NOT NULL
+      AND month = (SELECT MAX(month) FROM budgets WHERE user_id = :user_id AND month < :month)
+      AND NOT EXISTS (
+        SELECT 1 FROM budgets AS cur
+        WHERE cur.user_id = :user_id AND cur.month = :month AND cur.category_id IS prev.category_id
+      )
+""").columns(category_id=Integer, limit_amount=Money, spent=Money)
+
+def get_budget_status(db: Session, user_id: int, month: str = None):
+    month = month or month_key()
+    rows = db.execute(BUDGET_STATUS_SQL, {"user_id": user_id, "month": month}).all()
+    # The counters hold base-currency spend; add the month's foreign spend, converted in SQL
+    foreign = dict(db.execute(FOREIGN_SPEND_SQL, {"user_id": user_id, "month": month, "base": base_currency(db, user_id)}).all())
+    if foreign:
+        rows = [
+            (category_id, limit, from_cents(to_cents(spent or 0) + (foreign.pop(category_id, 0) or 0)) if category_id is not None else spent)
+            for category_id, limit, spent in rows
+        ] + [(category_id, None, from_cents(total or 0)) for category_id, total in foreign.items()]
+    return budget_status(month, [(categories.name(category_id), limit, spent) for category_id, limit, spent in rows])
+
+# ==================== LEDGER ====================
+
+SNAPSHOT_EVERY = 100
+
+# Signed effect of a ledger entry on the balance, in integer cents
+signed_cents = case((Transaction.type == "income", cents(Transaction.amount)), else_=-cents(Transaction.amount))
+
+def latest_snapshot(db: Session, user_id: int, as_of: datetime = None):
+    query = db.query(BalanceSnapshot).filter(BalanceSnapshot.user_id == user_id)
+    if as_of is not None:
+        query = query.filter(BalanceSnapshot.as_of <= as_of)
+    return query.order_by(BalanceSnapshot.last_txn_id.desc()).first()
+
+def ledger_balance(db: Session, user_id: int, as_of: datetime = None):
+    """Balance from the nearest snapshot plus the ledger entries after it"""
+    snapshot = latest_snapshot(db, user_id, as_of)
+    tail = db.query(func.coalesce(func.sum(signed_cents), 0), func.count(Transaction.id)).filter(
+        Transaction.user_id == user_id,
+        Transaction.id > (snapshot.last_txn_id if snapshot else 0),
+    )
+    if as_of is not None:
+        tail = tail.filter(Transaction.date <= as_of)
+    total, scanned = tail.one()
+    return {
+        "balance": from_cents((to_cents(snapshot.balance) if snapshot else 0) + total),
+        "as_of": as_of,
+        "snapshot_id": snapshot.id if snapshot else None,
+        "entries_scanned": scanned,
+    }
+
+def snapshot_ledger(db: Session, user_id: int):
+    """Snapshot the running balance once SNAPSHOT_EVERY entries or a new month have accumulated"""
+    last = latest_snapshot(db, user_id)
+    total, count, last_id, last_date = db.query(
+        func.coalesce(func.sum(signed_cents), 0),
+        func.count(Transaction.id),
+        func.max(Transaction.id),
+        func.max(Transaction.date),
+    ).filter(Transaction.user_id == user_id, Transaction.id > (last.last_txn_id if last else 0)).one()
+    if not count:
+        return None
+    last_date = datetime.fromisoformat(str(last_date))
+    new_month = last is None or (last_date.year, last_date.month) != (last.as_of.year, last.as_of.month)
+    if count < SNAPSHOT_EVERY and not new_month:
+        return None
+    snapshot = BalanceSnapshot(
+        user_id=user_id,
+        last_txn_id=last_id,
+        as_of=max(last_date, last.as_of) if last else last_date,
+        balance=from_cents((to_cents(last.balance) if last else 0) + total),
+        entries=(last.entries if last else 0) + count,
+    )
+    db.add(snapshot)
+    db.commit()
+    return snapshot
+
+def verify_ledger(db: Session, user_id: int):
+    """Replay the whole ledger and check every snapshot against it"""
+    snapshots = {
+        s.last_txn_id: s
+        for s in db.query(BalanceSnapshot).filter(BalanceSnapshot.user_id == user_id)
+    }
+    balance, entries, mismatches = 0, 0, []
+    for txn_id, amount in db.query(Transaction.id, signed_cents).filter(Transaction.user_id == user_id).order_by(Transaction.id):
+        balance += amount
+        entries += 1
+        snapshot = snapshots.get(txn_id)
+        if snapshot and (to_cents(snapshot.balance) != balance or snapshot.entries != entries):
+            mismatches.append({"snapshot_id": snapshot.id, "expected": from_cents(balance), "recorded": snapshot.balance})
+    current = ledger_balance(db, user_id)["balance"]
+    return {
+        "ok": not mismatches and to_cents(current) == balance,
+        "entries": entries,
+        "replayed_balance": from_cents(balance),
+        "snapshot_balance": current,
+        "snapshots_checked": len(snapshots),
+        "mismatches": mismatches,
+    }
+
+# ==================== SEARCH ====================
+
+def fts_query(q: str):
+    """
+    Turn free text into an FTS5 query where every word must match. Only the
+    last word is a prefix (search as you type): exact terms can skip through
+    their doclists, prefix terms have to merge every matching token's list.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+# Expense matches plus income entries from the ledger (expense entries
+# there mirror the expenses table). user_id is an FTS column, so the user
+# filter is resolved inside the index rather than by a join.
+SEARCH_SQL = text("""
+    SELECT 'expense' AS kind, e.id, e.description, e.amount / 100.0 AS amount, e.date, c.name AS label,
+           highlight(expenses_fts, 1, '[', ']') AS snippet, bm25(expenses_fts, 0.0, 1.0) AS rank
+    FROM expenses_fts JOIN expenses e ON e.id = expenses_fts.rowid
+    LEFT JOIN categories c ON c.id = e.category_id
+    WHERE expenses_fts MATCH :expense_match
+    UNION ALL
+    SELECT 'transaction' AS kind, t.id, t.description, t.amount / 100.0 AS amount, t.date, t.type AS label,
+           highlight(transactions_fts, 2, '[', ']') AS snippet, bm25(transactions_fts, 0.0, 0.0, 1.0) AS rank
+    FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid
+    WHERE transactions_fts MATCH :transaction_match
+    ORDER BY rank
+    LIMIT :limit OFFSET :offset
+""")
+
+def search_descriptions(db: Session, user_id: int, q: str, page: int, page_size: int):
+    match = fts_query(q)
+    if match is None:
+        return [], False
+    rows = db.execute(SEARCH_SQL, {
+        "expense_match": f"user_id:{user_id} AND description:({match})",
+        "transaction_match": f"user_id:{user_id} AND type:income AND description:({match})",
+        "limit": page_size + 1,
+        "offset": (page - 1) * page_size,
+    }).mappings().all()
+    return [dict(r) for r in rows[:page_size]], len(rows) > page_size
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -126,112 +1197,692 @@ def get_db():
     finally:
         db.close()
 
+# ==================== DATA VERSIONS ====================
+
+# Per-user counter bumped on every write; derived results are cached against it
+_data_versions = {}
+_forecast_cache = {}
+
+def data_version(user_id: int) -> int:
+    return _data_versions.get(user_id, 0)
+
+def bump_data_version(user_id: int):
+    _data_versions[user_id] = data_version(user_id) + 1
+
+def monthly_net_savings(db: Session, user_id: int):
+    """Net savings (income - expenses) per calendar month, oldest first"""
+    month = func.strftime("%Y-%m", Transaction.date)
+    income = dict(
+        db.query(month, func.sum(Transaction.amount))
+        .filter(Transaction.user_id == user_id, Transaction.type == "income")
+        .group_by(month)
+        .all()
+    )
+    # Expenses in the base currency, foreign ones converted in the same pass (cents)
+    spent = dict(db.execute(MONTHLY_SPEND_SQL, {"user_id": user_id, "base": base_currency(db, user_id)}).all())
+    months = sorted(set(income) | set(spent))
+    return [(income.get(m) or 0) - from_cents(spent.get(m) or 0) for m in months]
+
+def goal_forecasts(db: Session, user_id: int, goals):
+    """Forecasts for all of a user's goals, cached until their data changes"""
+    key = (data_version(user_id), datetime.utcnow().date())
+    cached = _forecast_cache.get(user_id)
+    if cached and cached[0] == key:
+        return cached[1]
+    forecasts = forecast_goals(
+        [g.id for g in goals],
+        [g.target_amount or 0 for g in goals],
+        [g.current_amount or 0 for g in goals],
+        monthly_net_savings(db, user_id),
+    )
+    _forecast_cache[user_id] = (key, forecasts)
+    return forecasts
+
+# ==================== FRAUD DETECTOR ====================
+
+detector = ExpenseAnomalyDetector()
+
+def load_detector_state():
+    """Load persisted statistics, bootstrapping them from expense history on first run"""
+    db = SessionLocal()
+    try:
+        rows = db.query(ExpenseStat.user_id, ExpenseStat.category, ExpenseStat.count, ExpenseStat.mean, ExpenseStat.m2).all()
+        if not rows:
+            # Amounts in each user's base currency, as cents
+            history = db.execute(EXPENSE_HISTORY_SQL).all()
+            rows = [
+                (user_id, categories.name(category_id), n, total / n / 100, max(sum_sq / 10000 - total * total / n / 10000, 0.0))
+                for user_id, category_id, n, total, sum_sq in history
+                if n
+            ]
+            db.add_all(ExpenseStat(user_id=u, category=c, count=n, mean=m, m2=m2) for u, c, n, m, m2 in rows)
+            db.commit()
+        detector.load(rows)
+    finally:
+        db.close()
+
+def persist_detector_state(db: Session):
+    for user_id, category, count, mean, m2 in detector.drain_dirty():
+        db.merge(ExpenseStat(user_id=user_id, category=category, count=count, mean=mean, m2=m2))
+    db.commit()
+
+def score_expense(db: Session, expense: Expense, amount: float):
+    """Run the detector on a new expense, given its base-currency amount, and stage any alerts on the session"""
+    alerts = [
+        SecurityAlert(user_id=expense.user_id, alert_type=alert_type, message=message)
+        for alert_type, message in detector.observe(expense.user_id, expense.category, amount)
+    ]
+    db.add_all(alerts)
+    return alerts
+
+# ==================== RECURRING TRANSACTIONS ====================
+
+RECURRING_BATCH = 500  # rules per transaction
+RECURRING_CATCHUP = 400  # occurrences per rule per transaction; a rule still due is picked up by the next batch of the same run
+RECURRING_INTERVAL = 60.0
+
+# Statements over one batch of claimed occurrences, joined to their rules
+_CLAIMED = "FROM recurring_occurrences o JOIN recurring_rules r ON r.id = o.rule_id WHERE o.batch = :batch"
+POST_EXPENSES_SQL = text(
+    "INSERT INTO expenses (user_id, category_id, description, amount, date, status) "
+    f"SELECT r.user_id, r.category_id, r.description, r.amount, o.occurs_at, 'Completed' {_CLAIMED} "
+    "AND r.kind = 'expense' ORDER BY o.occurs_at RETURNING id, user_id"
+)
+POST_TRANSACTIONS_SQL = text(
+    "INSERT INTO transactions (user_id, type, amount, date, description) "
+    f"SELECT r.user_id, r.kind, r.amount, o.occurs_at, r.description {_CLAIMED} "
+    "ORDER BY o.occurs_at RETURNING id, user_id"
+)
+POSTED_TOTALS_SQL = text(
+    f"SELECT r.user_id, r.kind, COUNT(*), SUM(r.amount) {_CLAIMED} GROUP BY r.user_id, r.kind"
+)
+POSTED_SPEND_SQL = text(
+    f"SELECT r.user_id, r.category_id, substr(o.occurs_at, 1, 7), SUM(r.amount) {_CLAIMED} "
+    "AND r.kind = 'expense' AND r.category_id IS NOT NULL GROUP BY 1, 2, 3"
+)
+
+def materialize_recurring(now: datetime = None):
+    """
+    Post every due occurrence of every active rule, catching up on periods
+    missed while the server was down.
+
+    Due rules are handled a batch at a time, each batch in one transaction.
+    Occurrence keys are claimed with INSERT OR IGNORE under a batch token,
+    and the claimed ones are posted with set-based INSERT .. SELECT into
+    expenses and transactions. Those statements bypass the flush listeners,
+    so the batch writes its own change-log rows, summary deltas and budget
+    spend. A crash before the commit leaves next_run untouched and the next
+    run posts the same periods; a duplicate run finds the keys taken.
+    """
+    now = now or datetime.utcnow()
+    posted_users = {}
+    db = SessionLocal()
+    try:
+        while True:
+            rules = (
+                db.query(RecurringRule)
+                .filter(RecurringRule.active == True, RecurringRule.next_run <= now)  # noqa: E712
+                .order_by(RecurringRule.next_run, RecurringRule.id)
+                .limit(RECURRING_BATCH)
+                .all()
+            )
+            if not rules:
+                break
+            batch = {"batch": uuid.uuid4().hex}
+            claims = []
+            for rule in rules:
+                cadence = Cadence(rule.cadence)
+                end = min(now, rule.end_date) if rule.end_date else now
+                times = cadence.occurrences(rule.next_run, end, limit=RECURRING_CATCHUP)
+                claims += [{"rule_id": rule.id, "occurs_at": t, "posted_at": now, **batch} for t in times]
+                if times:
+                    rule.last_run = times[-1]
+                rule.next_run = cadence.next_after(times[-1] if times else now)
+                if rule.next_run is None or (rule.end_date and rule.next_run > rule.end_date):
+                    rule.active = False
+            if claims:
+                db.execute(RecurringOccurrence.__table__.insert().prefix_with("OR IGNORE"), claims)
+
+                changes = [
+                    {"user_id": user_id, "entity": "expenses", "entity_id": row_id, "op": "upsert"}
+                    for row_id, user_id in db.execute(POST_EXPENSES_SQL, batch)
+                ]
+                changes += [
+                    {"user_id": user_id, "entity": "transactions", "entity_id": row_id, "op": "upsert"}
+                    for row_id, user_id in db.execute(POST_TRANSACTIONS_SQL, batch)
+                ]
+                if changes:
+                    db.execute(Change.__table__.insert(), changes)
+
+                for user_id, kind, count, total in db.execute(POSTED_TOTALS_SQL, batch).all():
+                    deltas = {"transaction_count": count}
+                    if kind == "expense":
+                        deltas.update(total_expenses=from_cents(total), expense_count=count)
+                    else:
+                        deltas["total_income"] = from_cents(total)
+                    apply_summary_deltas(db, user_id, deltas)
+                    posted_users[user_id] = posted_users.get(user_id, 0) + count
+                for user_id, category_id, month, total in db.execute(POSTED_SPEND_SQL, batch).all():
+                    add_spend(db, user_id, category_id, month, from_cents(total))
+            db.commit()
+    finally:
+        db.close()
+
+    for user_id, count in posted_users.items():
+        jobs.enqueue("snapshot_ledger", user_id=user_id)
+        after_write(user_id, "recurring_posted", {"count": count})
+    return {"users": len(posted_users), "posted": sum(posted_users.values())}
+
+# ==================== BATCH MUTATIONS ====================
+
+# Every statement names the owner next to the ids, so ids belonging to
+# another user match no rows. Ids arrive as one JSON array parameter.
+_OWNED = "user_id = :user_id AND id IN (SELECT value FROM json_each(:ids))"
+REVERSE_EXPENSES_SQL = text(
+    "INSERT INTO transactions (user_id, type, amount, date, description) "
+    f"SELECT user_id, 'expense', -({_IN_BASE}), :now, 'Reversal: ' || COALESCE(description, '') FROM expenses e WHERE {_OWNED} "
+    "ORDER BY id RETURNING id"
+).bindparams(bindparam("now", type_=DateTime))
+# Summaries and budget counters hold base-currency amounts only
+EXPENSE_SPEND_SQL = text(
+    "SELECT category_id, substr(date, 1, 7), SUM(CASE WHEN currency IS NULL THEN amount ELSE 0 END), COUNT(*) "
+    f"FROM expenses WHERE {_OWNED} GROUP BY 1, 2"
+)
+MOVED_SPEND_SQL = text(
+    f"SELECT category_id, substr(date, 1, 7), SUM(amount) FROM expenses WHERE {_OWNED} "
+    "AND currency IS NULL AND category_id IS NOT :category_id GROUP BY 1, 2"
+)
+DELETE_EXPENSES_SQL = text(f"DELETE FROM expenses WHERE {_OWNED} RETURNING id")
+UPDATE_EXPENSES_SQL = text(
+    "UPDATE expenses SET category_id = COALESCE(:category_id, category_id), status = COALESCE(:status, status) "
+    f"WHERE {_OWNED} RETURNING id"
+)
+GOAL_TOTALS_SQL = text(
+    "SELECT COUNT(*), COALESCE(SUM(target_amount), 0), COALESCE(SUM(current_amount), 0), COALESCE(SUM(status = 'Active'), 0) "
+    f"FROM goals WHERE {_OWNED}"
+)
+DELETE_GOAL_CONTRIBUTIONS_SQL = text(f"DELETE FROM goal_contributions WHERE goal_id IN (SELECT id FROM goals WHERE {_OWNED})")
+DELETE_GOALS_SQL = text(f"DELETE FROM goals WHERE {_OWNED} RETURNING id")
+STATUS_CHANGES_SQL = text(
+    f"SELECT COUNT(*), COALESCE(SUM(status = 'Active'), 0) FROM goals WHERE {_OWNED} AND status IS NOT :status"
+)
+UPDATE_GOALS_SQL = text(f"UPDATE goals SET status = :status WHERE {_OWNED} RETURNING id")
+# Amounts arrive as one JSON object of goal id -> cents
+_ADJUSTMENTS = "(SELECT CAST(key AS INTEGER) AS goal_id, value AS amount FROM json_each(:amounts))"
+ADJUSTMENT_CONTRIBUTIONS_SQL = text(
+    "INSERT INTO goal_contributions (goal_id, user_id, amount, note, date) "
+    f"SELECT a.goal_id, g.user_id, a.amount, 'Adjustment', :now FROM {_ADJUSTMENTS} AS a "
+    "JOIN goals g ON g.id = a.goal_id AND g.user_id = :user_id RETURNING goal_id, amount"
+).bindparams(bindparam("now", type_=DateTime))
+ADJUST_GOALS_SQL = text(
+    f"UPDATE goals SET current_amount = COALESCE(current_amount, 0) + a.amount FROM {_ADJUSTMENTS} AS a "
+    "WHERE goals.id = a.goal_id AND goals.user_id = :user_id"
+)
+
+EXPENSE_BATCH_OPS = {"delete", "update"}
+GOAL_BATCH_OPS = {"delete", "update", "adjust"}
+
+def check_batch(operations, allowed, categorized):
+    """Reject the whole batch before any statement runs"""
+    for operation in operations:
+        if operation.op not in allowed:
+            raise HTTPException(status_code=400, detail=f"Unknown batch operation: {operation.op}")
+        if operation.op == "update" and operation.category is not None and not categorized:
+            raise HTTPException(status_code=400, detail="Goals have no category")
+        if operation.op == "update" and operation.category is None and operation.status is None:
+            raise HTTPException(status_code=400, detail="update needs a category or a status")
+
+def batch_result(operation, requested, affected):
+    return {"op": operation.op, "requested": len(requested), "affected": len(affected), "missing": sorted(set(requested) - set(affected))}
+
+def batch_expenses(db: Session, user_id: int, operations):
+    """
+    Apply delete and update operations to a user's expenses as set-based
+    statements inside the caller's transaction.
+
+    The statements bypass the flush listeners, so this writes the ledger
+    reversals, change-log rows, summary deltas and budget spend itself,
+    the way materialize_recurring does.
+    """
+    now = datetime.utcnow()
+    results, changes, deltas = [], [], {}
+    for operation in operations:
+        params = {"user_id": user_id, "ids": json.dumps(operation.ids)}
+        if operation.op == "delete":
+            # The ledger is append-only, so deletions post reversing entries
+            reversals = db.execute(REVERSE_EXPENSES_SQL, {**params, "now": now, "base": base_currency(db, user_id)}).scalars().all()
+            spend = db.execute(EXPENSE_SPEND_SQL, params).all()
+            affected = db.execute(DELETE_EXPENSES_SQL, params).scalars().all()
+            removed = 0
+            for category_id, month, total, count in spend:
+                removed += total
+                if category_id is not None and total:
+                    add_spend(db, user_id, category_id, month, -from_cents(total))
+            deltas["total_expenses"] = deltas.get("total_expenses", 0) - from_cents(removed)
+            deltas["expense_count"] = deltas.get("expense_count", 0) - len(affected)
+            deltas["transaction_count"] = deltas.get("transaction_count", 0) + len(reversals)
+            changes += [("expenses", row_id, "delete") for row_id in affected]
+            changes += [("transactions", row_id, "upsert") for row_id in reversals]
+        else:
+            category_id = categories.id_for(db, operation.category) if operation.category is not None else None
+            if category_id is not None:
+                for old_id, month, total in db.execute(MOVED_SPEND_SQL, {**params, "category_id": category_id}).all():
+                    if old_id is not None:
+                        add_spend(db, user_id, old_id, month, -from_cents(total))
+                    add_spend(db, user_id, category_id, month, from_cents(total))
+            affected = db.execute(UPDATE_EXPENSES_SQL, {**params, "category_id": category_id, "status": operation.status}).scalars().all()
+            changes += [("expenses", row_id, "upsert") for row_id in affected]
+        results.append(batch_result(operation, operation.ids, affected))
+    if changes:
+        db.execute(insert(Change), [{"user_id": user_id, "entity": entity, "entity_id": row_id, "op": op} for entity, row_id, op in changes])
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        apply_summary_deltas(db, user_id, deltas)
+    return results
+
+def batch_goals(db: Session, user_id: int, operations):
+    """Apply delete, status update and amount adjustment operations to a user's goals in the caller's transaction"""
+    now = datetime.utcnow()
+    results, changes, deltas = [], [], {}
+    for operation in operations:
+        params = {"user_id": user_id, "ids": json.dumps(operation.ids)}
+        if operation.op == "delete":
+            count, target, current, active = db.execute(GOAL_TOTALS_SQL, params).one()
+            db.execute(DELETE_GOAL_CONTRIBUTIONS_SQL, params)
+            affected = db.execute(DELETE_GOALS_SQL, params).scalars().all()
+            for field, delta in (("goal_count", -count), ("goal_target", -from_cents(target)), ("goal_current", -from_cents(current)), ("active_goals", -active)):
+                deltas[field] = deltas.get(field, 0) + delta
+            changes += [(row_id, "delete") for row_id in affected]
+            requested = operation.ids
+        elif operation.op == "update":
+            changing, was_active = db.execute(STATUS_CHANGES_SQL, {**params, "status": operation.status}).one()
+            deltas["active_goals"] = deltas.get("active_goals", 0) + (changing if operation.status == "Active" else 0) - was_active
+            affected = db.execute(UPDATE_GOALS_SQL, {**params, "status": operation.status}).scalars().all()
+            changes += [(row_id, "upsert") for row_id in affected]
+            requested = operation.ids
+        else:
+            amounts = json.dumps({goal_id: to_cents(amount) for goal_id, amount in operation.amounts.items() if amount})
+            added = db.execute(ADJUSTMENT_CONTRIBUTIONS_SQL, {"user_id": user_id, "amounts": amounts, "now": now}).all()
+            db.execute(ADJUST_GOALS_SQL, {"user_id": user_id, "amounts": amounts})
+            deltas["goal_current"] = deltas.get("goal_current", 0) + from_cents(sum(amount for _, amount in added))
+            affected = [goal_id for goal_id, _ in added]
+            changes += [(goal_id, "upsert") for goal_id in affected]
+            requested = list(operation.amounts)
+        results.append(batch_result(operation, requested, affected))
+    if changes:
+        db.execute(insert(Change), [{"user_id": user_id, "entity": "goals", "entity_id": row_id, "op": op} for row_id, op in changes])
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        apply_summary_deltas(db, user_id, deltas)
+    return results
+
+# ==================== SECURITY ALERTS ====================
+
+ALERT_RETENTION_DAYS = 90  # resolved alerts older than this are folded into monthly counts
+ALERT_COMPACT_INTERVAL = 6 * 3600.0
+
+# The literal `resolved = 0` lets SQLite pick the partial index; a bound parameter would not
+OPEN_ALERT_COUNT_SQL = text("SELECT COUNT(*) FROM security_alerts WHERE user_id = :user_id AND resolved = 0")
+RECENT_ALERTS_SQL = text("""
+    SELECT id, alert_type, message, timestamp FROM security_alerts
+    WHERE user_id = :user_id AND resolved = 0
+    ORDER BY timestamp DESC LIMIT 5
+""").columns(id=Integer, alert_type=String, message=String, timestamp=DateTime)
+RESOLVED_ALERT_COUNT_SQL = text("""
+    SELECT (SELECT COUNT(*) FROM security_alerts WHERE user_id = :user_id AND resolved = 1)
+         + (SELECT COALESCE(SUM(count), 0) FROM security_alert_counts WHERE user_id = :user_id)
+""")
+
+_EXPIRED = "FROM security_alerts WHERE resolved = 1 AND timestamp < :cutoff"
+COMPACT_ALERTS_SQL = [
+    text(
+        "INSERT INTO security_alert_counts (user_id, month, alert_type, count) "
+        f"SELECT user_id, substr(timestamp, 1, 7), alert_type, COUNT(*) {_EXPIRED} GROUP BY 1, 2, 3 "
+        "ON CONFLICT (user_id, month, alert_type) DO UPDATE SET count = count + excluded.count"
+    ),
+    text(f"INSERT INTO changes (user_id, entity, entity_id, op) SELECT user_id, 'alerts', id, 'delete' {_EXPIRED}"),
+    text(f"DELETE {_EXPIRED}"),
+]
+
+def security_overview(db: Session, user_id: int):
+    params = {"user_id": user_id}
+    unresolved = db.execute(OPEN_ALERT_COUNT_SQL, params).scalar()
+    return {
+        "security_status": "Excellent" if unresolved == 0 else "Warning",
+        "total_alerts": unresolved + db.execute(RESOLVED_ALERT_COUNT_SQL, params).scalar(),
+        "unresolved_alerts": unresolved,
+        "two_factor_enabled": True,
+        "recent_alerts": [
+            {"id": a.id, "type": a.alert_type, "message": a.message, "timestamp": a.timestamp}
+            for a in db.execute(RECENT_ALERTS_SQL, params)
+        ],
+    }
+
+def compact_alerts(now: datetime = None):
+    """
+    Fold resolved alerts older than the retention window into per-month
+    counts and delete them, in one transaction. Sync clients get a delete
+    change for each, so they drop them too.
+    """
+    cutoff = (now or datetime.utcnow()) - timedelta(days=ALERT_RETENTION_DAYS)
+    params = {"cutoff": cutoff.strftime("%Y-%m-%d %H:%M:%S.%f")}
+    with engine.begin() as conn:
+        for statement in COMPACT_ALERTS_SQL:
+            result = conn.execute(statement, params)
+    return {"compacted": result.rowcount}
+
+# ==================== BACKGROUND JOBS ====================
+
+jobs = JobQueue()
+hub = EventHub()
+hasher = PasswordHasher(cost=PASSWORD_HASH_COST, workers=PASSWORD_HASH_WORKERS)
+
+@jobs.handler("persist_detector")
+def persist_detector_job():
+    db = SessionLocal()
+    try:
+        persist_detector_state(db)
+    finally:
+        db.close()
+
+@jobs.handler("snapshot_ledger")
+def snapshot_ledger_job(user_id: int):
+    db = SessionLocal()
+    try:
+        snapshot_ledger(db, user_id)
+    finally:
+        db.close()
+
+@jobs.handler("warm_forecasts")
+def warm_forecasts_job(user_id: int):
+    db = SessionLocal()
+    try:
+        goal_forecasts(db, user_id, db.query(Goal).filter(Goal.user_id == user_id).all())
+    finally:
+        db.close()
+
+@jobs.handler("materialize_recurring")
+def materialize_recurring_job():
+    materialize_recurring()
+
+jobs.every("materialize_recurring", RECURRING_INTERVAL)
+
+@jobs.handler("load_rates")
+def load_rates_job():
+    load_rates()
+
+jobs.every("load_rates", RATES_RELOAD_INTERVAL)
+
+@jobs.handler("load_prices")
+def load_prices_job():
+    load_prices()
+
+jobs.every("load_prices", PRICES_RELOAD_INTERVAL)
+
+@jobs.handler("compact_alerts")
+def compact_alerts_job():
+    compact_alerts()
+
+jobs.every("compact_alerts", ALERT_COMPACT_INTERVAL)
+
+def after_write(user_id: int, event: str, data: dict):
+    """Invalidate a user's derived data, notify live clients and schedule follow-up work"""
+    bump_data_version(user_id)
+    hub.publish(user_id, event, data)
+    jobs.enqueue("warm_forecasts", user_id=user_id)
+
+# ==================== RATE LIMITS ====================
+
+ip_limiter = RateLimiter(path=RATE_LIMIT_DB, **LOGIN_IP_LIMIT)
+email_limiter = RateLimiter(path=RATE_LIMIT_DB, **LOGIN_EMAIL_LIMIT)
+
+def limit_login_attempts(request: Request, email: str):
+    """Refuse with 429 before the attempt touches the database or the hashing pool"""
+    retry_after = check_login_limits(ip_limiter, email_limiter, request.client.host if request.client else None, email)
+    if retry_after:
+        raise HTTPException(status_code=429, detail="Too many attempts, try again later", headers={"Retry-After": str(retry_after)})
+
+# ==================== IDEMPOTENCY ====================
+
+idempotency = IdempotencyStore(engine.begin, ttl=IDEMPOTENCY_TTL)
+
+@app.middleware("http")
+async def idempotent_posts(request: Request, call_next):
+    """Replay the stored response when a POST is retried with the same Idempotency-Key"""
+    key = request.headers.get("idempotency-key")
+    if not key or request.method != "POST" or request.url.path.startswith("/api/auth/"):
+        return await call_next(request)
+    # Create paths carry the user id, so scoping by path keeps users' keys apart
+    scope = request.url.path
+    fingerprint = request_fingerprint(request.method, scope, await request.body())
+    try:
+        stored = await run_in_threadpool(idempotency.begin, scope, key, fingerprint)
+    except KeyInProgress as e:
+        return JSONResponse(status_code=409, content={"detail": str(e)}, headers={"Retry-After": "1"})
+    except KeyReused as e:
+        return JSONResponse(status_code=422, content={"detail": str(e)})
+    if stored is not None:
+        return Response(status_code=stored.status, content=stored.body, media_type=stored.content_type, headers={"Idempotent-Replayed": "true"})
+
+    try:
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+    except BaseException:
+        await run_in_threadpool(idempotency.release, scope, key)
+        raise
+    await run_in_threadpool(idempotency.finish, scope, key, fingerprint, response.status_code, body, response.headers.get("content-type"))
+    return Response(status_code=response.status_code, content=body, headers=dict(response.headers))
+
+# ==================== STARTUP & SHUTDOWN ====================
+
+@app.on_event("startup")
+def startup():
+    load_rates(force=True)
+    load_detector_state()
+    load_category_rules()
+    load_prices(force=True)
+    jobs.start(engine.url.database)
+
+@app.on_event("shutdown")
+def shutdown():
+    jobs.stop()
+    hasher.shutdown()
+    persist_detector_job()
+
 # ==================== API ENDPOINTS ====================
 
 # Auth Endpoints
 @app.post("/api/auth/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
+def register(user: UserCreate, request: Request, db: Session = Depends(get_db)):
+    limit_login_attempts(request, user.email)
     existing_user = db.query(User).filter(User.email == user.email).first()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    db_user = User(email=user.email, password=user.password, name=user.name)
+    base = user.base_currency.strip().upper()
+    if base not in rate_cache.currencies():
+        raise HTTPException(status_code=400, detail=f"No exchange rates for {base}")
+    
+    try:
+        password = hasher.hash(user.password)
+    except PoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+    db_user = User(email=user.email, password=password, name=user.name, base_currency=base)
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
-    return {"id": db_user.id, "email": db_user.email, "name": db_user.name}
+    return {"id": db_user.id, "email": db_user.email, "name": db_user.name, "base_currency": db_user.base_currency}
 
 @app.post("/api/auth/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
+def login(user: UserLogin, request: Request, db: Session = Depends(get_db)):
+    limit_login_attempts(request, user.email)
     db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or db_user.password != user.password:
+    try:
+        matches, needs_rehash = hasher.verify(user.password, db_user.password) if db_user else hasher.verify_absent(user.password)
+        if needs_rehash:
+            db_user.password = hasher.upgrade(user.password)
+            db.commit()
+    except PoolBusy:
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+    if not matches:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    return {"id": db_user.id, "email": db_user.email, "name": db_user.name}
+    return {"id": db_user.id, "email": db_user.email, "name": db_user.name, "base_currency": db_user.base_currency}
 
 # Dashboard Endpoints
 @app.get("/api/dashboard/{user_id}")
 def get_dashboard(user_id: int, db: Session = Depends(get_db)):
-    expenses = db.query(Expense).filter(Expense.user_id == user_id).all()
-    transactions = db.query(Transaction).filter(Transaction.user_id == user_id).all()
-    goals = db.query(Goal).filter(Goal.user_id == user_id).all()
-    
-    total_expenses = sum(e.amount for e in expenses)
-    total_income = sum(t.amount for t in transactions if t.type == "income")
-    balance = total_income - total_expenses
-    
-    goal_progress = sum(g.current_amount for g in goals) / sum(g.target_amount for g in goals) * 100 if goals else 0
-    
-    return {
-        "balance": balance,
-        "total_expenses": total_expenses,
-        "total_income": total_income,
-        "goal_progress": round(goal_progress, 1),
-        "active_goals": len([g for g in goals if g.status == "Active"]),
-        "recent_transactions": len(transactions),
-    }
+    return {**user_totals(db, user_id), "investments": portfolio_valuation(db, user_id)["market_value"]}
 
 # Expense Endpoints
 @app.get("/api/expenses/{user_id}")
 def get_expenses(user_id: int, db: Session = Depends(get_db)):
     expenses = db.query(Expense).filter(Expense.user_id == user_id).order_by(Expense.date.desc()).all()
-    total = sum(e.amount for e in expenses)
+    totals = user_totals(db, user_id)
     return {
-        "total": total,
-        "expenses": [
-            {
-                "id": e.id,
-                "category": e.category,
-                "description": e.description,
-                "amount": e.amount,
-                "date": e.date,
-                "status": e.status,
-            }
-            for e in expenses
-        ]
+        "total": totals["total_expenses"],
+        "currency": totals["currency"],
+        "expenses": [expense_to_dict(e) for e in expenses]
     }
 
 @app.post("/api/expenses/{user_id}")
-def create_expense(user_id: int, expense: ExpenseCreate, db: Session = Depends(get_db)):
+def create_expense(user_id: int, expense: ExpenseCreate, prefer: str = Header(None), db: Session = Depends(get_db)):
     db_expense = Expense(
         user_id=user_id,
-        category=expense.category,
+        category=categorize(user_id, [expense])[0],
         description=expense.description,
         amount=expense.amount,
+        currency=stored_currency(db, user_id, expense.currency),
         date=expense.date or datetime.utcnow(),
     )
+    # The ledger is kept in the base currency, booked at the rate for the expense's date
+    amount = in_base(db, user_id, db_expense.amount, db_expense.currency, db_expense.date)
     db.add(db_expense)
+    db.add(Transaction(
+        user_id=user_id,
+        type="expense",
+        amount=amount,
+        date=db_expense.date,
+        description=db_expense.description,
+    ))
+    alerts = score_expense(db, db_expense, amount)
     db.commit()
     db.refresh(db_expense)
+    jobs.enqueue("snapshot_ledger", user_id=user_id)
+    after_write(user_id, "expense_added", {"id": db_expense.id, "category": db_expense.category, "amount": db_expense.amount})
+    for a in alerts:
+        hub.publish(user_id, "alert_raised", {"id": a.id, "type": a.alert_type, "message": a.message})
+    if detector.should_persist():
+        jobs.enqueue("persist_detector")
+    if wants_representation(prefer):
+        return {
+            "id": db_expense.id,
+            "message": "Expense created",
+            "expense": expense_to_dict(db_expense),
+            "summary": user_totals(db, user_id),
+        }
     return {"id": db_expense.id, "message": "Expense created"}
 
+@app.post("/api/expenses/{user_id}/import")
+def import_expenses(user_id: int, expenses: list[ExpenseCreate], prefer: str = Header(None), db: Session = Depends(get_db)):
+    """Bulk import; rows without a category are classified in one batch"""
+    now = datetime.utcnow()
+    db_expenses = [
+        Expense(
+            user_id=user_id,
+            category=category,
+            description=e.description,
+            amount=e.amount,
+            currency=stored_currency(db, user_id, e.currency),
+            date=e.date or now,
+        )
+        for e, category in zip(expenses, categorize(user_id, expenses))
+    ]
+    ledger = [
+        Transaction(user_id=user_id, type="expense", amount=in_base(db, user_id, e.amount, e.currency, e.date), date=e.date, description=e.description)
+        for e in db_expenses
+    ]
+    db.add_all(db_expenses)
+    db.add_all(ledger)
+    db.commit()
+    jobs.enqueue("snapshot_ledger", user_id=user_id)
+    after_write(user_id, "expenses_imported", {"count": len(db_expenses)})
+    response = {
+        "message": "Expenses imported",
+        "imported": len(db_expenses),
+        "auto_categorized": sum(1 for e in expenses if not e.category),
+    }
+    if wants_representation(prefer):
+        response["expenses"] = [expense_to_dict(e) for e in db_expenses]
+        response["summary"] = user_totals(db, user_id)
+    return response
+
+@app.patch("/api/expenses/{expense_id}")
+def recategorize_expense(expense_id: int, expense_update: ExpenseUpdate, prefer: str = Header(None), db: Session = Depends(get_db)):
+    """Change an expense's category and learn a rule from the correction"""
+    expense = db.query(Expense).filter(Expense.id == expense_id).first()
+    if not expense:
+        raise HTTPException(status_code=404, detail="Expense not found")
+    keyword = categorizer.learn(expense.user_id, expense.description, expense_update.category)
+    expense.category = expense_update.category
+    if keyword:
+        category_id = categories.id_for(db, expense_update.category)
+        db.execute(
+            sqlite_insert(CategoryRule)
+            .values(user_id=expense.user_id, keyword=keyword, category_id=category_id)
+            .on_conflict_do_update(index_elements=["user_id", "keyword"], set_={"category_id": category_id})
+        )
+    db.commit()
+    if keyword:
+        categorizer.add_rule(expense.user_id, keyword, expense_update.category)
+    after_write(expense.user_id, "expense_updated", {"id": expense.id, "category": expense.category})
+    response = {"message": "Expense updated", "learned_rule": keyword}
+    if wants_representation(prefer):
+        response["expense"] = expense_to_dict(expense)
+    return response
+
 @app.delete("/api/expenses/{expense_id}")
-def delete_expense(expense_id: int, db: Session = Depends(get_db)):
+def delete_expense(expense_id: int, prefer: str = Header(None), db: Session = Depends(get_db)):
     expense = db.query(Expense).filter(Expense.id == expense_id).first()
     if not expense:
         raise HTTPException(status_code=404, detail="Expense not found")
+    # The ledger is append-only, so a deletion posts a reversing entry
+    db.add(Transaction(
+        user_id=expense.user_id,
+        type="expense",
+        amount=-in_base(db, expense.user_id, expense.amount, expense.currency, expense.date),
+        description=f"Reversal: {expense.description}",
+    ))
     db.delete(expense)
     db.commit()
+    jobs.enqueue("snapshot_ledger", user_id=expense.user_id)
+    after_write(expense.user_id, "expense_deleted", {"id": expense_id})
+    if wants_representation(prefer):
+        return {"message": "Expense deleted", "summary": user_totals(db, expense.user_id)}
     return {"message": "Expense deleted"}
 
+@app.post("/api/expenses/{user_id}/batch")
+def batch_update_expenses(user_id: int, batch: BatchRequest, prefer: str = Header(None), db: Session = Depends(get_db)):
+    """Delete or update many expenses in one transaction; ids the user does not own are reported as missing"""
+    check_batch(batch.operations, EXPENSE_BATCH_OPS, categorized=True)
+    results = batch_expenses(db, user_id, batch.operations)
+    db.commit()
+    if any(r["op"] == "delete" and r["affected"] for r in results):
+        jobs.enqueue("snapshot_ledger", user_id=user_id)
+    after_write(user_id, "expenses_batch", {"affected": sum(r["affected"] for r in results)})
+    response = {"message": "Batch applied", "results": results}
+    if wants_representation(prefer):
+        response["summary"] = user_totals(db, user_id)
+    return response
+
 # Goals Endpoints
 @app.get("/api/goals/{user_id}")
 def get_goals(user_id: int, db: Session = Depends(get_db)):
     goals = db.query(Goal).filter(Goal.user_id == user_id).all()
-    return [
-        {
-            "id": g.id,
-            "name": g.name,
-            "description": g.description,
-            "target_amount": g.target_amount,
-            "current_amount": g.current_amount,
-            "progress": round(g.current_amount / g.target_amount * 100, 1) if g.target_amount > 0 else 0,
-            "status": g.status,
-        }
-        for g in goals
-    ]
+    forecasts = goal_forecasts(db, user_id, goals)
+    return [{**goal_to_dict(g), "forecast": forecasts.get(g.id)} for g in goals]
 
 @app.post("/api/goals/{user_id}")
-def create_goal(user_id: int, goal: GoalCreate, db: Session = Depends(get_db)):
+def create_goal(user_id: int, goal: GoalCreate, prefer: str = Header(None), db: Session = Depends(get_db)):
     db_goal = Goal(
         user_id=user_id,
         name=goal.name,
@@ -241,46 +1892,254 @@ def create_goal(user_id: int, goal: GoalCreate, db: Session = Depends(get_db)):
     db.add(db_goal)
     db.commit()
     db.refresh(db_goal)
+    after_write(user_id, "goal_created", {"id": db_goal.id, "name": db_goal.name})
+    if wants_representation(prefer):
+        return {
+            "id": db_goal.id,
+            "message": "Goal created",
+            "goal": goal_to_dict(db_goal),
+            "summary": user_totals(db, user_id),
+        }
     return {"id": db_goal.id, "message": "Goal created"}
 
 @app.patch("/api/goals/{goal_id}")
-def update_goal(goal_id: int, goal_update: GoalUpdate, db: Session = Depends(get_db)):
+def update_goal(goal_id: int, goal_update: GoalUpdate, prefer: str = Header(None), db: Session = Depends(get_db)):
     goal = db.query(Goal).filter(Goal.id == goal_id).first()
     if not goal:
         raise HTTPException(status_code=404, detail="Goal not found")
     
-    if goal_update.current_amount is not None:
+    if goal_update.current_amount is not None and goal_update.current_amount != goal.current_amount:
+        # Keep the ledger in step with absolute edits
+        db.add(GoalContribution(
+            goal_id=goal.id,
+            user_id=goal.user_id,
+            amount=goal_update.current_amount - (goal.current_amount or 0),
+            note="Adjustment",
+        ))
         goal.current_amount = goal_update.current_amount
     if goal_update.status is not None:
         goal.status = goal_update.status
     
     db.commit()
     db.refresh(goal)
+    after_write(goal.user_id, "goal_updated", {"id": goal.id, "current_amount": goal.current_amount, "status": goal.status})
+    if wants_representation(prefer):
+        return {"message": "Goal updated", "goal": goal_to_dict(goal), "summary": user_totals(db, goal.user_id)}
     return {"message": "Goal updated", "goal": goal}
 
 @app.delete("/api/goals/{goal_id}")
-def delete_goal(goal_id: int, db: Session = Depends(get_db)):
+def delete_goal(goal_id: int, prefer: str = Header(None), db: Session = Depends(get_db)):
     goal = db.query(Goal).filter(Goal.id == goal_id).first()
     if not goal:
         raise HTTPException(status_code=404, detail="Goal not found")
+    db.query(GoalContribution).filter(GoalContribution.goal_id == goal_id).delete()
     db.delete(goal)
     db.commit()
+    after_write(goal.user_id, "goal_deleted", {"id": goal_id})
+    if wants_representation(prefer):
+        return {"message": "Goal deleted", "summary": user_totals(db, goal.user_id)}
     return {"message": "Goal deleted"}
 
+@app.post("/api/goals/{goal_id}/contributions")
+def contribute_to_goal(goal_id: int, contribution: GoalContributionCreate, prefer: str = Header(None), db: Session = Depends(get_db)):
+    """Atomically add to a goal and append the contribution to its ledger"""
+    row = db.execute(
+        update(Goal)
+        .where(Goal.id == goal_id)
+        .values(current_amount=func.coalesce(Goal.current_amount, 0) + contribution.amount)
+        .returning(Goal.user_id, Goal.current_amount, Goal.target_amount)
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    user_id, current_amount, target_amount = row[0], float(row[1]), row[2]
+    db.execute(insert(GoalContribution).values(
+        goal_id=goal_id,
+        user_id=user_id,
+        amount=contribution.amount,
+        note=contribution.note,
+        date=datetime.utcnow(),
+    ))
+    apply_summary_deltas(db, user_id, {"goal_current": contribution.amount})
+    record_change(db, user_id, "goals", goal_id)
+    db.commit()
+    after_write(user_id, "goal_updated", {"id": goal_id, "current_amount": current_amount})
+    response = {
+        "message": "Contribution added",
+        "goal_id": goal_id,
+        "current_amount": current_amount,
+        "progress": round(current_amount / target_amount * 100, 1) if target_amount > 0 else 0,
+    }
+    if wants_representation(prefer):
+        response["summary"] = user_totals(db, user_id)
+    return response
+
+@app.post("/api/goals/{user_id}/batch")
+def batch_update_goals(user_id: int, batch: BatchRequest, prefer: str = Header(None), db: Session = Depends(get_db)):
+    """Delete goals, set their status or adjust their amounts in one transaction"""
+    check_batch(batch.operations, GOAL_BATCH_OPS, categorized=False)
+    results = batch_goals(db, user_id, batch.operations)
+    db.commit()
+    after_write(user_id, "goals_batch", {"affected": sum(r["affected"] for r in results)})
+    response = {"message": "Batch applied", "results": results}
+    if wants_representation(prefer):
+        response["summary"] = user_totals(db, user_id)
+    return response
+
+@app.get("/api/goals/{goal_id}/history")
+def get_goal_history(goal_id: int, db: Session = Depends(get_db)):
+    """Contribution ledger with running totals, for goal history charts"""
+    goal = db.get(Goal, goal_id)
+    if not goal:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    running = func.sum(cents(GoalContribution.amount)).over(order_by=(GoalContribution.date, GoalContribution.id))
+    rows = (
+        db.query(GoalContribution.date, GoalContribution.amount, GoalContribution.note, running)
+        .filter(GoalContribution.goal_id == goal_id)
+        .order_by(GoalContribution.date, GoalContribution.id)
+        .all()
+    )
+    # Whatever was saved before the ledger existed
+    baseline = to_cents(goal.current_amount or 0) - (rows[-1][3] if rows else 0)
+    return {
+        "goal_id": goal_id,
+        "baseline": from_cents(baseline),
+        "history": [
+            {"date": date, "amount": amount, "note": note, "total": from_cents(baseline + total)}
+            for date, amount, note, total in rows
+        ],
+    }
+
+# Search Endpoints
+@app.get("/api/search/{user_id}")
+def search(user_id: int, q: str, page: int = 1, page_size: int = 20, db: Session = Depends(get_db)):
+    """Full-text search over expense and income descriptions, best matches first"""
+    page, page_size = max(page, 1), min(max(page_size, 1), 100)
+    results, has_more = search_descriptions(db, user_id, q, page, page_size)
+    return {"query": q, "page": page, "page_size": page_size, "has_more": has_more, "results": results}
+
+# Portfolio Endpoints
+@app.get("/api/portfolio/{user_id}")
+def get_portfolio(user_id: int, db: Session = Depends(get_db)):
+    return portfolio_valuation(db, user_id)
+
+@app.get("/api/portfolio/{user_id}/lots")
+def get_lots(user_id: int, symbol: str = None, db: Session = Depends(get_db)):
+    query = db.query(Holding.symbol, Lot).join(Holding, Holding.id == Lot.holding_id).filter(Lot.user_id == user_id)
+    if symbol:
+        query = query.filter(Holding.symbol == symbol.strip().upper())
+    return [{"symbol": s, **lot_to_dict(l)} for s, l in query.order_by(Lot.date.desc(), Lot.id.desc())]
+
+@app.post("/api/portfolio/{user_id}/lots")
+def add_lot(user_id: int, lot: LotCreate, prefer: str = Header(None), db: Session = Depends(get_db)):
+    db_lot = book_lot(db, user_id, lot)
+    db.commit()
+    after_write(user_id, "lot_added", {"id": db_lot.id, "holding_id": db_lot.holding_id})
+    response = {"id": db_lot.id, "message": "Lot added"}
+    if wants_representation(prefer):
+        response["lot"] = lot_to_dict(db_lot)
+        response["portfolio"] = portfolio_valuation(db, user_id)
+    return response
+
+# Ledger Endpoints
+@app.get("/api/ledger/{user_id}/balance")
+def get_balance(user_id: int, as_of: datetime = None, db: Session = Depends(get_db)):
+    """Current balance, or the balance as of a point in time"""
+    return ledger_balance(db, user_id, as_of)
+
+@app.get("/api/ledger/{user_id}/verify")
+def verify_user_ledger(user_id: int, db: Session = Depends(get_db)):
+    return verify_ledger(db, user_id)
+
+# Budget Endpoints
+@app.get("/api/budgets/{user_id}")
+def get_budgets(user_id: int, month: str = None, db: Session = Depends(get_db)):
+    if month and not re.fullmatch(r"\d{4}-\d{2}", month):
+        raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+    return get_budget_status(db, user_id, month)
+
+@app.put("/api/budgets/{user_id}")
+def set_budget(user_id: int, budget: BudgetSet, prefer: str = Header(None), db: Session = Depends(get_db)):
+    """Set or clear a category's (or the overall) limit for a month; months started later inherit it"""
+    month = budget.month or month_key()
+    if not re.fullmatch(r"\d{4}-\d{2}", month):
+        raise HTTPException(status_code=400, detail="month must be YYYY-MM")
+    category_id = categories.id_for(db, budget.category) if budget.category else None
+    roll_budgets_forward(db, user_id, month)
+    db.execute(
+        sqlite_insert(Budget)
+        .values(user_id=user_id, category_id=category_id, month=month, limit_amount=budget.limit, spent=0)
+        .on_conflict_do_update(
+            index_elements=["user_id", "category_id", "month"] if category_id else ["user_id", "month"],
+            index_where=None if category_id else Budget.category_id.is_(None),
+            set_={"limit_amount": budget.limit},
+        )
+    )
+    db.commit()
+    after_write(user_id, "budget_updated", {"category": budget.category, "month": month, "limit": budget.limit})
+    if wants_representation(prefer):
+        return {"message": "Budget updated", "budget": get_budget_status(db, user_id, month)}
+    return {"message": "Budget updated"}
+
+# Recurring Transaction Endpoints
+@app.get("/api/recurring/{user_id}")
+def get_recurring_rules(user_id: int, db: Session = Depends(get_db)):
+    rules = db.query(RecurringRule).filter(RecurringRule.user_id == user_id).order_by(RecurringRule.id).all()
+    return [recurring_rule_to_dict(r) for r in rules]
+
+@app.post("/api/recurring/{user_id}")
+def create_recurring_rule(user_id: int, rule: RecurringRuleCreate, db: Session = Depends(get_db)):
+    if rule.kind not in ("expense", "income"):
+        raise HTTPException(status_code=400, detail="kind must be expense or income")
+    try:
+        cadence = Cadence(rule.cadence)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cadence: {e}")
+    start = rule.start_date or datetime.utcnow()
+    next_run = cadence.first_from(start)
+    if next_run is None:
+        raise HTTPException(status_code=400, detail="Cadence never occurs")
+    category = categorize(user_id, [rule])[0] if rule.kind == "expense" else None
+    db_rule = RecurringRule(
+        user_id=user_id,
+        kind=rule.kind,
+        cadence=rule.cadence,
+        amount=rule.amount,
+        category_id=categories.id_for(db, category) if category else None,
+        description=rule.description,
+        start_date=start,
+        end_date=rule.end_date,
+        next_run=next_run,
+        active=rule.end_date is None or next_run <= rule.end_date,
+    )
+    db.add(db_rule)
+    db.commit()
+    # Post anything already due (a start date in the past) right away
+    jobs.enqueue("materialize_recurring")
+    return {"id": db_rule.id, "message": "Recurring rule created", "next_run": db_rule.next_run}
+
+@app.delete("/api/recurring/{rule_id}")
+def stop_recurring_rule(rule_id: int, db: Session = Depends(get_db)):
+    """Stop future postings; entries already posted stay in the ledger"""
+    rule = db.query(RecurringRule).filter(RecurringRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Recurring rule not found")
+    rule.active = False
+    db.commit()
+    return {"message": "Recurring rule stopped"}
+
 # Analytics Endpoints
 @app.get("/api/analytics/{user_id}")
 def get_analytics(user_id: int, db: Session = Depends(get_db)):
-    expenses = db.query(Expense).filter(Expense.user_id == user_id).all()
-    transactions = db.query(Transaction).filter(Transaction.user_id == user_id).all()
-    
-    total_expenses = sum(e.amount for e in expenses)
-    total_income = sum(t.amount for t in transactions if t.type == "income")
-    net_savings = total_income - total_expenses
+    totals = user_totals(db, user_id)
+    total_expenses = totals["total_expenses"]
+    total_income = totals["total_income"]
+    net_savings = totals["balance"]
     
-    # Expenses by category
-    category_breakdown = {}
-    for e in expenses:
-        category_breakdown[e.category] = category_breakdown.get(e.category, 0) + e.amount
+    # Expenses by category, grouped on the integer id and converted to the base currency in the same pass
+    category_breakdown = {
+        categories.name(category_id): from_cents(total or 0)
+        for category_id, total in db.execute(CATEGORY_TOTALS_SQL, {"user_id": user_id, "base": totals["currency"]})
+    }
     
     return {
         "total_income": total_income,
@@ -288,43 +2147,94 @@ def get_analytics(user_id: int, db: Session = Depends(get_db)):
         "net_savings": net_savings,
         "savings_rate": round(net_savings / total_income * 100, 1) if total_income > 0 else 0,
         "category_breakdown": category_breakdown,
-        "expense_count": len(expenses),
+        "expense_count": totals["expense_count"],
+        "currency": totals["currency"],
     }
 
 # Security Endpoints
 @app.get("/api/security/{user_id}")
 def get_security(user_id: int, db: Session = Depends(get_db)):
-    alerts = db.query(SecurityAlert).filter(SecurityAlert.user_id == user_id).all()
-    unresolved = [a for a in alerts if not a.resolved]
-    
-    return {
-        "security_status": "Excellent" if len(unresolved) == 0 else "Warning",
-        "total_alerts": len(alerts),
-        "unresolved_alerts": len(unresolved),
-        "two_factor_enabled": True,
-        "recent_alerts": [
-            {
-                "id": a.id,
-                "type": a.alert_type,
-                "message": a.message,
-                "timestamp": a.timestamp,
-            }
-            for a in unresolved[-5:]
-        ],
-    }
+    return security_overview(db, user_id)
 
 @app.post("/api/security/alert/{user_id}")
 def create_alert(user_id: int, alert_type: str, message: str, db: Session = Depends(get_db)):
     db_alert = SecurityAlert(user_id=user_id, alert_type=alert_type, message=message)
     db.add(db_alert)
     db.commit()
+    hub.publish(user_id, "alert_raised", {"id": db_alert.id, "type": alert_type, "message": message})
     return {"message": "Alert created"}
 
+@app.post("/api/security/alert/{alert_id}/resolve")
+def resolve_alert(alert_id: int, db: Session = Depends(get_db)):
+    db_alert = db.query(SecurityAlert).filter(SecurityAlert.id == alert_id).first()
+    if not db_alert:
+        raise HTTPException(status_code=404, detail="Alert not found")
+    db_alert.resolved = True
+    db.commit()
+    hub.publish(db_alert.user_id, "alert_resolved", {"id": alert_id})
+    return {"message": "Alert resolved"}
+
+# Delta sync
+@app.get("/api/changes/{user_id}")
+def get_changes(user_id: int, since: int = 0, db: Session = Depends(get_db)):
+    """Rows inserted, updated or deleted after sequence number `since`"""
+    latest = (
+        db.query(Change.entity, Change.entity_id, func.max(Change.seq), Change.op)
+        .filter(Change.user_id == user_id, Change.seq > since)
+        .group_by(Change.entity, Change.entity_id)
+        .all()
+    )
+    seq = max((row[2] for row in latest), default=since)
+    result = {name: {"upserted": [], "deleted": []} for name in SYNCED_ENTITIES}
+    upserts = {}
+    for entity, entity_id, _, op in latest:
+        if op == "delete":
+            result[entity]["deleted"].append(entity_id)
+        else:
+            upserts.setdefault(entity, []).append(entity_id)
+    for entity, ids in upserts.items():
+        model, serialize = SYNCED_ENTITIES[entity]
+        result[entity]["upserted"] = [serialize(row) for row in db.query(model).filter(model.id.in_(ids)).all()]
+    return {"seq": seq, "changes": result}
+
+# Live updates
+@app.get("/api/events/{user_id}")
+async def stream_events(user_id: int):
+    return StreamingResponse(
+        hub.stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # Health check
 @app.get("/api/health")
 def health_check():
     return {"status": "ok", "message": "GryffinTwin API is running"}
 
+@app.get("/api/metrics/jobs")
+def job_metrics():
+    return jobs.metrics()
+
+@app.get("/api/metrics/passwords")
+def password_metrics():
+    return hasher.metrics()
+
+@app.get("/api/metrics/ratelimits")
+def rate_limit_metrics():
+    return {"ip": ip_limiter.metrics(), "email": email_limiter.metrics()}
+
+@app.get("/api/metrics/rates")
+def rate_metrics():
+    return rate_cache.metrics()
+
+@app.get("/api/metrics/portfolio")
+def portfolio_metrics():
+    return {**price_book.metrics(), "cached_valuations": len(_valuation_cache)}
+
+@app.get("/api/metrics/idempotency")
+def idempotency_metrics():
+    return idempotency.metrics()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -3,21 +3,65 @@ GryffinTwin Flask Backend
 Financial Management System with SQLite3
 """
 
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, g, make_response, render_template, request, jsonify, session, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, delete, event, func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from collections import namedtuple
 from datetime import datetime, timedelta
+import atexit
 import os
 import json
+import math
+
+from categorize import Categorizer, FALLBACK_CATEGORY
+from idempotency import IdempotencyStore, KeyInProgress, KeyReused, request_fingerprint
+from jobs import JobQueue
+from money import Money, cents, from_cents, migrate_money_columns, to_cents
+from passwords import PasswordHasher, PoolBusy
+from ratelimit import RateLimiter, check_login_limits
+from session_store import ServerSessionInterface, SqliteSessionStore
+from summary import flush_deltas, summary_to_dict
 
 # Initialize Flask App
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-this-in-production'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///gryfftwin.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['PASSWORD_HASH_COST'] = 15  # log2 of the scrypt work factor
+app.config['PASSWORD_HASH_WORKERS'] = 2
+app.config['RATE_LIMIT_DB'] = None  # a file path shares the login buckets between workers
+app.config['SESSION_DB'] = 'sessions.db'  # None keeps sessions in signed cookies
+app.config['IDEMPOTENCY_TTL'] = 24 * 3600  # seconds a stored response is replayed to retries
+app.config.from_prefixed_env()  # FLASK_<KEY> environment variables override the defaults above
 
 # Initialize Database
 db = SQLAlchemy(app)
 
+# Sessions live server-side; the cookie only carries an opaque id
+if app.config['SESSION_DB']:
+    session_store = SqliteSessionStore(app.config['SESSION_DB'])
+    app.session_interface = ServerSessionInterface(session_store)
+else:
+    session_store = None
+
+# Background jobs for side work that should not run inside request handlers
+jobs = JobQueue()
+
+# Responses to POSTs sent with an Idempotency-Key, replayed to their retries
+idempotency = IdempotencyStore(lambda: db.engine.begin(), ttl=app.config['IDEMPOTENCY_TTL'])
+
+# Password hashing runs in worker processes, a bounded number at a time
+hasher = PasswordHasher(cost=app.config['PASSWORD_HASH_COST'], workers=app.config['PASSWORD_HASH_WORKERS'])
+
+# Login and registration attempts per client IP and per email
+ip_limiter = RateLimiter(rate=10 / 60, burst=10, path=app.config['RATE_LIMIT_DB'])
+email_limiter = RateLimiter(rate=1 / 60, burst=5, path=app.config['RATE_LIMIT_DB'])
+
+# Keyword rules for expenses added without a category
+categorizer = Categorizer()
+
 # ==================== DATABASE MODELS ====================
 
 class User(db.Model):
@@ -41,7 +85,7 @@ class Expense(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     category = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(255), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     status = db.Column(db.String(50), default='Completed')
 
@@ -52,23 +96,37 @@ class Goal(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     name = db.Column(db.String(120), nullable=False)
     description = db.Column(db.String(255), nullable=False)
-    target_amount = db.Column(db.Float, nullable=False)
-    current_amount = db.Column(db.Float, default=0)
+    target_amount = db.Column(Money, nullable=False)
+    current_amount = db.Column(Money, default=0)
     status = db.Column(db.String(50), default='Active')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class GoalContribution(db.Model):
+    __tablename__ = 'goal_contributions'
+    __table_args__ = (db.Index('ix_goal_contributions_goal_date', 'goal_id', 'date'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    goal_id = db.Column(db.Integer, db.ForeignKey('goals.id', ondelete='CASCADE'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    amount = db.Column(Money, nullable=False)
+    note = db.Column(db.String(255), default='')
+    date = db.Column(db.DateTime, default=datetime.utcnow)
+
 class Transaction(db.Model):
     __tablename__ = 'transactions'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     type = db.Column(db.String(50), nullable=False)  # income or expense
-    amount = db.Column(db.Float, nullable=False)
+    amount = db.Column(Money, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     description = db.Column(db.String(255))
 
 class SecurityAlert(db.Model):
     __tablename__ = 'security_alerts'
+    __table_args__ = (
+        db.Index('ix_security_alerts_unresolved', 'user_id', 'timestamp', sqlite_where=db.text('resolved = 0')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
@@ -77,14 +135,129 @@ class SecurityAlert(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     resolved = db.Column(db.Boolean, default=False)
 
+class UserSummary(db.Model):
+    __tablename__ = 'user_summaries'
+    
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    total_expenses = db.Column(Money, default=0)
+    expense_count = db.Column(db.Integer, default=0)
+    total_income = db.Column(Money, default=0)
+    transaction_count = db.Column(db.Integer, default=0)
+    goal_target = db.Column(Money, default=0)
+    goal_current = db.Column(Money, default=0)
+    goal_count = db.Column(db.Integer, default=0)
+    active_goals = db.Column(db.Integer, default=0)
+
+class IdempotencyKey(db.Model):
+    __tablename__ = 'idempotency_keys'
+    
+    scope = db.Column(db.String(255), primary_key=True)  # user id and path
+    key = db.Column(db.String(255), primary_key=True)
+    fingerprint = db.Column(db.String(64))  # hash of method, path and body
+    status = db.Column(db.Integer)  # NULL while the first request is running
+    body = db.Column(db.LargeBinary)
+    content_type = db.Column(db.String(100))
+    expires_at = db.Column(db.Float, index=True)  # Unix time
+
+# ==================== INCREMENTAL SUMMARIES ====================
+
+_SUMMARY_KINDS = {Expense: 'expense', Goal: 'goal', Transaction: 'transaction'}
+
+@event.listens_for(db.session, 'after_flush')
+def update_summaries(session, flush_context):
+    """Apply each flush's effect on per-user totals in the same transaction"""
+    for user_id, deltas in flush_deltas(session, _SUMMARY_KINDS).items():
+        apply_summary_deltas(session, user_id, deltas)
+
+def apply_summary_deltas(session, user_id, deltas):
+    session.execute(
+        update(UserSummary)
+        .where(UserSummary.user_id == user_id)
+        .values({field: getattr(UserSummary, field) + delta for field, delta in deltas.items()})
+    )
+
+def get_summary(user_id):
+    """The user's running totals, built with one aggregate pass the first time; never flushes the request's session"""
+    with db.session.no_autoflush:
+        summary = db.session.get(UserSummary, user_id)
+        if summary is None:
+            build_summary(user_id)
+            summary = db.session.get(UserSummary, user_id)
+    return summary
+
+def build_summary(user_id):
+    """Insert a user's summary row from their committed rows, in its own session so the request's is never committed"""
+    with Session(db.engine) as build:
+        total_expenses, expense_count = build.query(
+            func.coalesce(func.sum(Expense.amount), 0), func.count(Expense.id)
+        ).filter(Expense.user_id == user_id).one()
+        total_income, transaction_count = build.query(
+            func.coalesce(func.sum(Transaction.amount).filter(Transaction.type == 'income'), 0),
+            func.count(Transaction.id)
+        ).filter(Transaction.user_id == user_id).one()
+        goal_target, goal_current, goal_count, active_goals = build.query(
+            func.coalesce(func.sum(Goal.target_amount), 0),
+            func.coalesce(func.sum(Goal.current_amount), 0),
+            func.count(Goal.id),
+            func.count(Goal.id).filter(Goal.status == 'Active')
+        ).filter(Goal.user_id == user_id).one()
+        build.execute(sqlite_insert(UserSummary).values(
+            user_id=user_id,
+            total_expenses=total_expenses,
+            expense_count=expense_count,
+            total_income=total_income,
+            transaction_count=transaction_count,
+            goal_target=goal_target,
+            goal_current=goal_current,
+            goal_count=goal_count,
+            active_goals=active_goals
+        ).on_conflict_do_nothing())
+        build.commit()
+
+def wants_representation():
+    """Clients opt in to full mutation responses with `Prefer: return=representation`"""
+    return 'return=representation' in request.headers.get('Prefer', '')
+
+# ==================== BACKGROUND JOBS ====================
+
+@jobs.handler('warm_summary')
+def warm_summary_job(user_id):
+    """Build a user's summary row off the request path, so their first dashboard read is a lookup"""
+    with app.app_context():
+        get_summary(user_id)
+
 # ==================== HELPER FUNCTIONS ====================
 
+# What views know about the logged-in user. The claims live in the session,
+# so resolving them needs no users query.
+Identity = namedtuple('Identity', ['id', 'email', 'name'])
+
+def sign_in(user):
+    """Store the user's claims in a fresh session"""
+    session.clear()
+    session['user_id'] = user.id
+    session['email'] = user.email
+    session['name'] = user.name
+    g.user = Identity(user.id, user.email, user.name)
+
 def check_login():
-    """Check if user is logged in"""
+    """The logged-in user's identity, or None; resolved once per request and kept on `g`"""
+    if 'user' not in g:
+        g.user = load_identity()
+    return g.user
+
+def load_identity():
     if 'user_id' not in session:
         return None
-    user = User.query.get(session['user_id'])
-    return user
+    if 'email' in session:
+        return Identity(session['user_id'], session['email'], session.get('name'))
+    # Sessions from before the claims were stored: look the user up once and keep them
+    user = db.session.get(User, session['user_id'])
+    if user is None:
+        session.clear()
+        return None
+    sign_in(user)
+    return g.user
 
 def login_required(f):
     """Decorator for routes that require login"""
@@ -98,6 +271,85 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def read_batch(allowed, categorized):
+    """
+    The operations of a batch request, or an error message naming the bad
+    operation. Everything is checked before any statement runs; ids come
+    back as ints and amounts as nonzero floats keyed by goal id.
+    """
+    body = request.get_json(silent=True)
+    operations = body.get('operations') if isinstance(body, dict) else None
+    if not isinstance(operations, list):
+        return None, 'operations must be a list'
+    parsed = []
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict):
+            return None, f'Operation {index}: must be an object'
+        if op.get('op') not in allowed:
+            return None, f"Operation {index}: unknown batch operation {op.get('op')}"
+        if op['op'] == 'update' and op.get('category') is not None and not categorized:
+            return None, f'Operation {index}: goals have no category'
+        if op['op'] == 'update' and op.get('category') is None and op.get('status') is None:
+            return None, f'Operation {index}: update needs a category or a status'
+        if any(op.get(key) is not None and not isinstance(op[key], str) for key in ('category', 'status')):
+            return None, f'Operation {index}: category and status must be strings'
+        ids, amounts = op.get('ids') or [], op.get('amounts') or {}
+        if not isinstance(ids, list) or not isinstance(amounts, dict):
+            return None, f'Operation {index}: ids must be a list and amounts an object'
+        try:
+            ids = [int(i) for i in ids]
+            amounts = {int(goal_id): float(amount) for goal_id, amount in amounts.items()}
+        except (TypeError, ValueError):
+            return None, f'Operation {index}: ids and amounts must be numbers'
+        if not all(math.isfinite(amount) for amount in amounts.values()):
+            return None, f'Operation {index}: amounts must be finite'
+        parsed.append({**op, 'ids': ids, 'amounts': {goal_id: amount for goal_id, amount in amounts.items() if amount}})
+    return parsed, None
+
+def batch_result(op, requested, affected):
+    return {'op': op, 'requested': len(requested), 'affected': len(affected), 'missing': sorted(set(requested) - set(affected))}
+
+# ==================== IDEMPOTENCY ====================
+
+# Login and register are never replayed; their responses carry sessions
+_NOT_IDEMPOTENT = {'login', 'register'}
+
+@app.before_request
+def replay_idempotent_request():
+    """Answer a retried POST with the stored response instead of running it again"""
+    key = request.headers.get('Idempotency-Key')
+    if not key or request.method != 'POST' or request.endpoint in _NOT_IDEMPOTENT:
+        return None
+    scope = f"{session.get('user_id', '')}:{request.path}"
+    fingerprint = request_fingerprint(request.method, request.path, request.get_data())
+    try:
+        stored = idempotency.begin(scope, key, fingerprint)
+    except KeyInProgress as e:
+        return jsonify({'success': False, 'error': str(e)}), 409, {'Retry-After': '1'}
+    except KeyReused as e:
+        return jsonify({'success': False, 'error': str(e)}), 422
+    if stored is not None:
+        response = make_response(stored.body, stored.status)
+        response.content_type = stored.content_type
+        response.headers['Idempotent-Replayed'] = 'true'
+        return response
+    g.idempotency = (scope, key, fingerprint)
+    return None
+
+@app.after_request
+def store_idempotent_response(response):
+    claim = g.pop('idempotency', None)
+    if claim is not None:
+        idempotency.finish(*claim, response.status_code, response.get_data(), response.content_type)
+    return response
+
+@app.teardown_request
+def release_idempotency_key(error):
+    # Only still set when the request failed before after_request ran
+    claim = g.pop('idempotency', None)
+    if claim is not None:
+        idempotency.release(*claim[:2])
+
 # ==================== AUTHENTICATION ROUTES ====================
 
 @app.route('/')
@@ -112,11 +364,22 @@ def login():
         data = request.get_json() if request.is_json else request.form
         email = data.get('email')
         password = data.get('password')
+        retry_after = check_login_limits(ip_limiter, email_limiter, request.remote_addr, email)
+        if retry_after:
+            return rate_limited_response(retry_after)
         
         user = User.query.filter_by(email=email).first()
+        try:
+            matches, needs_rehash = hasher.verify(password or '', user.password) if user else hasher.verify_absent(password or '')
+            if needs_rehash:
+                user.password = hasher.upgrade(password)
+                db.session.commit()
+        except PoolBusy:
+            return busy_response()
         
-        if user and user.password == password:  # In production, use bcrypt!
-            session['user_id'] = user.id
+        if matches:
+            sign_in(user)
+            jobs.enqueue('warm_summary', user_id=user.id)
             if request.is_json:
                 return jsonify({'success': True, 'user': {
                     'id': user.id,
@@ -138,17 +401,23 @@ def register():
         email = data.get('email')
         password = data.get('password')
         name = data.get('name')
+        retry_after = check_login_limits(ip_limiter, email_limiter, request.remote_addr, email)
+        if retry_after:
+            return rate_limited_response(retry_after)
         
         if User.query.filter_by(email=email).first():
             if request.is_json:
                 return jsonify({'success': False, 'error': 'Email already registered'}), 400
             return render_template('login.html', error='Email already registered')
         
-        user = User(email=email, password=password, name=name)  # In production, use bcrypt!
+        try:
+            user = User(email=email, password=hasher.hash(password or ''), name=name)
+        except PoolBusy:
+            return busy_response()
         db.session.add(user)
         db.session.commit()
         
-        session['user_id'] = user.id
+        sign_in(user)
         if request.is_json:
             return jsonify({'success': True, 'user': {
                 'id': user.id,
@@ -159,6 +428,19 @@ def register():
     
     return render_template('login.html')
 
+def busy_response():
+    """503 for a login or registration the hashing pool had no room for"""
+    if request.is_json:
+        return jsonify({'success': False, 'error': 'Server busy, try again'}), 503, {'Retry-After': '1'}
+    return render_template('login.html', error='Server busy, try again'), 503, {'Retry-After': '1'}
+
+def rate_limited_response(retry_after):
+    """429 for a login or registration over the per-IP or per-email limit"""
+    headers = {'Retry-After': str(retry_after)}
+    if request.is_json:
+        return jsonify({'success': False, 'error': 'Too many attempts, try again later'}), 429, headers
+    return render_template('login.html', error='Too many attempts, try again later'), 429, headers
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -197,28 +479,7 @@ def security():
 @login_required
 def api_dashboard():
     user = check_login()
-    expenses = Expense.query.filter_by(user_id=user.id).all()
-    goals = Goal.query.filter_by(user_id=user.id).all()
-    transactions = Transaction.query.filter_by(user_id=user.id).all()
-    
-    total_expenses = sum(e.amount for e in expenses)
-    total_income = sum(t.amount for t in transactions if t.type == 'income')
-    balance = total_income - total_expenses
-    
-    goal_progress = 0
-    if goals:
-        total_goal = sum(g.target_amount for g in goals)
-        current_total = sum(g.current_amount for g in goals)
-        goal_progress = round((current_total / total_goal * 100), 1) if total_goal > 0 else 0
-    
-    return jsonify({
-        'balance': balance,
-        'total_expenses': total_expenses,
-        'total_income': total_income,
-        'goal_progress': goal_progress,
-        'active_goals': len([g for g in goals if g.status == 'Active']),
-        'recent_transactions': len(transactions)
-    })
+    return jsonify(summary_to_dict(get_summary(user.id)))
 
 # ==================== API ROUTES - EXPENSES ====================
 
@@ -227,7 +488,8 @@ def api_dashboard():
 def api_get_expenses():
     user = check_login()
     expenses = Expense.query.filter_by(user_id=user.id).order_by(Expense.date.desc()).all()
-    total = sum(e.amount for e in expenses)
+    # Integer-cent SUM in SQLite, returned in currency units by the Money type
+    total = db.session.query(func.coalesce(func.sum(Expense.amount), 0)).filter(Expense.user_id == user.id).scalar()
     
     return jsonify({
         'total': total,
@@ -249,13 +511,27 @@ def api_add_expense():
     
     expense = Expense(
         user_id=user.id,
-        category=data.get('category'),
+        category=data.get('category') or categorizer.classify(user.id, data.get('description')) or FALLBACK_CATEGORY,
         description=data.get('description'),
         amount=float(data.get('amount'))
     )
     db.session.add(expense)
     db.session.commit()
     
+    if wants_representation():
+        return jsonify({
+            'success': True,
+            'id': expense.id,
+            'expense': {
+                'id': expense.id,
+                'category': expense.category,
+                'description': expense.description,
+                'amount': expense.amount,
+                'date': expense.date.strftime('%Y-%m-%d'),
+                'status': expense.status
+            },
+            'summary': summary_to_dict(get_summary(user.id))
+        }), 201
     return jsonify({'success': True, 'id': expense.id}), 201
 
 @app.route('/api/expenses/<int:expense_id>', methods=['DELETE'])
@@ -269,8 +545,45 @@ def api_delete_expense(expense_id):
     
     db.session.delete(expense)
     db.session.commit()
+    if wants_representation():
+        return jsonify({'success': True, 'summary': summary_to_dict(get_summary(user.id))})
     return jsonify({'success': True})
 
+@app.route('/api/expenses/batch', methods=['POST'])
+@login_required
+def api_batch_expenses():
+    """Delete or update many expenses in one transaction; the owner check is part of every statement"""
+    user = check_login()
+    operations, error = read_batch({'delete', 'update'}, categorized=True)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    results = []
+    deltas = {'total_expenses': 0, 'expense_count': 0}
+    for op in operations:
+        ids = op['ids']
+        owned = (Expense.user_id == user.id, Expense.id.in_(ids))
+        if op['op'] == 'delete':
+            # Bulk statements bypass the summary listener, so take the totals first
+            count, total = db.session.query(func.count(Expense.id), func.coalesce(func.sum(Expense.amount), 0)).filter(*owned).one()
+            affected = db.session.execute(delete(Expense).where(*owned).returning(Expense.id)).scalars().all()
+            deltas['total_expenses'] -= total
+            deltas['expense_count'] -= count
+        else:
+            values = {key: op[key] for key in ('category', 'status') if op.get(key) is not None}
+            affected = db.session.execute(update(Expense).where(*owned).values(values).returning(Expense.id)).scalars().all()
+        results.append(batch_result(op['op'], ids, affected))
+    
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        apply_summary_deltas(db.session, user.id, deltas)
+    db.session.commit()
+    
+    response = {'success': True, 'results': results}
+    if wants_representation():
+        response['summary'] = summary_to_dict(get_summary(user.id))
+    return jsonify(response)
+
 # ==================== API ROUTES - GOALS ====================
 
 @app.route('/api/goals', methods=['GET'])
@@ -304,6 +617,8 @@ def api_add_goal():
     db.session.add(goal)
     db.session.commit()
     
+    if wants_representation():
+        return jsonify({'success': True, 'id': goal.id, 'summary': summary_to_dict(get_summary(user.id))}), 201
     return jsonify({'success': True, 'id': goal.id}), 201
 
 @app.route('/api/goals/<int:goal_id>', methods=['PATCH'])
@@ -316,12 +631,21 @@ def api_update_goal(goal_id):
         return jsonify({'error': 'Not found'}), 404
     
     data = request.get_json()
-    if 'current_amount' in data:
+    if 'current_amount' in data and float(data['current_amount']) != goal.current_amount:
+        # Keep the ledger in step with absolute edits
+        db.session.add(GoalContribution(
+            goal_id=goal.id,
+            user_id=user.id,
+            amount=float(data['current_amount']) - (goal.current_amount or 0),
+            note='Adjustment'
+        ))
         goal.current_amount = float(data['current_amount'])
     if 'status' in data:
         goal.status = data['status']
     
     db.session.commit()
+    if wants_representation():
+        return jsonify({'success': True, 'summary': summary_to_dict(get_summary(user.id))})
     return jsonify({'success': True})
 
 @app.route('/api/goals/<int:goal_id>', methods=['DELETE'])
@@ -333,27 +657,171 @@ def api_delete_goal(goal_id):
     if not goal or goal.user_id != user.id:
         return jsonify({'error': 'Not found'}), 404
     
+    GoalContribution.query.filter_by(goal_id=goal.id).delete()
     db.session.delete(goal)
     db.session.commit()
+    if wants_representation():
+        return jsonify({'success': True, 'summary': summary_to_dict(get_summary(user.id))})
     return jsonify({'success': True})
 
+@app.route('/api/goals/<int:goal_id>/contributions', methods=['POST'])
+@login_required
+def api_contribute_goal(goal_id):
+    """Atomically add to a goal and append the contribution to its ledger"""
+    user = check_login()
+    data = request.get_json()
+    amount = float(data.get('amount'))
+    
+    row = db.session.execute(
+        update(Goal)
+        .where(Goal.id == goal_id, Goal.user_id == user.id)
+        .values(current_amount=func.coalesce(Goal.current_amount, 0) + amount)
+        .returning(Goal.current_amount, Goal.target_amount)
+    ).first()
+    if row is None:
+        db.session.rollback()
+        return jsonify({'error': 'Not found'}), 404
+    current_amount, target_amount = float(row[0]), row[1]
+    
+    db.session.execute(insert(GoalContribution).values(
+        goal_id=goal_id,
+        user_id=user.id,
+        amount=amount,
+        note=data.get('note', ''),
+        date=datetime.utcnow()
+    ))
+    apply_summary_deltas(db.session, user.id, {'goal_current': amount})
+    db.session.commit()
+    
+    response = {
+        'success': True,
+        'current_amount': current_amount,
+        'progress': round((current_amount / target_amount * 100), 1) if target_amount > 0 else 0
+    }
+    if wants_representation():
+        response['summary'] = summary_to_dict(get_summary(user.id))
+    return jsonify(response), 201
+
+@app.route('/api/goals/batch', methods=['POST'])
+@login_required
+def api_batch_goals():
+    """Delete goals, set their status or adjust their amounts in one transaction"""
+    user = check_login()
+    operations, error = read_batch({'delete', 'update', 'adjust'}, categorized=False)
+    if error:
+        return jsonify({'success': False, 'error': error}), 400
+    
+    now = datetime.utcnow()
+    results = []
+    deltas = {'goal_count': 0, 'goal_target': 0, 'goal_current': 0, 'active_goals': 0}
+    for op in operations:
+        if op['op'] == 'adjust':
+            amounts = op['amounts']
+            requested = list(amounts)
+            affected = []
+            if amounts:
+                # One UPDATE adds each goal's own amount; CASE takes raw cents like the column
+                adjustment = case({goal_id: to_cents(amount) for goal_id, amount in amounts.items()}, value=Goal.id)
+                affected = db.session.execute(
+                    update(Goal)
+                    .where(Goal.user_id == user.id, Goal.id.in_(requested))
+                    .values(current_amount=func.coalesce(Goal.current_amount, 0) + adjustment)
+                    .returning(Goal.id)
+                ).scalars().all()
+            if affected:
+                db.session.execute(insert(GoalContribution), [
+                    {'goal_id': goal_id, 'user_id': user.id, 'amount': amounts[goal_id], 'note': 'Adjustment', 'date': now}
+                    for goal_id in affected
+                ])
+                deltas['goal_current'] += from_cents(sum(to_cents(amounts[goal_id]) for goal_id in affected))
+            results.append(batch_result('adjust', requested, affected))
+            continue
+        
+        ids = op['ids']
+        owned = (Goal.user_id == user.id, Goal.id.in_(ids))
+        if op['op'] == 'delete':
+            count, target, current, active = db.session.query(
+                func.count(Goal.id),
+                func.coalesce(func.sum(Goal.target_amount), 0),
+                func.coalesce(func.sum(Goal.current_amount), 0),
+                func.count(Goal.id).filter(Goal.status == 'Active'),
+            ).filter(*owned).one()
+            db.session.execute(delete(GoalContribution).where(GoalContribution.goal_id.in_(select(Goal.id).where(*owned))))
+            affected = db.session.execute(delete(Goal).where(*owned).returning(Goal.id)).scalars().all()
+            deltas['goal_count'] -= count
+            deltas['goal_target'] -= target
+            deltas['goal_current'] -= current
+            deltas['active_goals'] -= active
+        else:
+            status = op['status']
+            changing, was_active = db.session.query(
+                func.count(Goal.id), func.count(Goal.id).filter(Goal.status == 'Active')
+            ).filter(*owned, Goal.status.is_distinct_from(status)).one()
+            affected = db.session.execute(update(Goal).where(*owned).values(status=status).returning(Goal.id)).scalars().all()
+            deltas['active_goals'] += (changing if status == 'Active' else 0) - was_active
+        results.append(batch_result(op['op'], ids, affected))
+    
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        apply_summary_deltas(db.session, user.id, deltas)
+    db.session.commit()
+    
+    response = {'success': True, 'results': results}
+    if wants_representation():
+        response['summary'] = summary_to_dict(get_summary(user.id))
+    return jsonify(response)
+
+@app.route('/api/goals/<int:goal_id>/history', methods=['GET'])
+@login_required
+def api_goal_history(goal_id):
+    """Contribution ledger with running totals, for goal history charts"""
+    user = check_login()
+    goal = Goal.query.get(goal_id)
+    
+    if not goal or goal.user_id != user.id:
+        return jsonify({'error': 'Not found'}), 404
+    
+    running = func.sum(cents(GoalContribution.amount)).over(order_by=(GoalContribution.date, GoalContribution.id))
+    rows = db.session.query(GoalContribution.date, GoalContribution.amount, GoalContribution.note, running) \
+        .filter(GoalContribution.goal_id == goal_id) \
+        .order_by(GoalContribution.date, GoalContribution.id).all()
+    baseline = to_cents(goal.current_amount or 0) - (rows[-1][3] if rows else 0)
+    
+    return jsonify({
+        'goal_id': goal_id,
+        'baseline': from_cents(baseline),
+        'history': [{
+            'date': d.strftime('%Y-%m-%d %H:%M:%S'),
+            'amount': amount,
+            'note': note,
+            'total': from_cents(baseline + total)
+        } for d, amount, note, total in rows]
+    })
+
 # ==================== API ROUTES - ANALYTICS ====================
 
 @app.route('/api/analytics', methods=['GET'])
 @login_required
 def api_analytics():
     user = check_login()
-    expenses = Expense.query.filter_by(user_id=user.id).all()
-    transactions = Transaction.query.filter_by(user_id=user.id).all()
-    
-    total_expenses = sum(e.amount for e in expenses)
-    total_income = sum(t.amount for t in transactions if t.type == 'income')
-    net_savings = total_income - total_expenses
+    # Totals are integer-cent SUMs in SQLite, so they add up exactly
+    expense_cents, expense_count = db.session.query(
+        func.coalesce(func.sum(cents(Expense.amount)), 0), func.count(Expense.id)
+    ).filter(Expense.user_id == user.id).one()
+    income_cents = db.session.query(func.coalesce(func.sum(cents(Transaction.amount)), 0)).filter(
+        Transaction.user_id == user.id, Transaction.type == 'income'
+    ).scalar()
+    total_expenses = from_cents(expense_cents)
+    total_income = from_cents(income_cents)
+    net_savings = from_cents(income_cents - expense_cents)
     
     # Expenses by category
-    category_breakdown = {}
-    for e in expenses:
-        category_breakdown[e.category] = category_breakdown.get(e.category, 0) + e.amount
+    category_breakdown = dict(
+        db.session.query(Expense.category, func.sum(Expense.amount))
+        .filter(Expense.user_id == user.id)
+        .group_by(Expense.category)
+        .all()
+    )
     
     return jsonify({
         'total_income': total_income,
@@ -361,7 +829,7 @@ def api_analytics():
         'net_savings': net_savings,
         'savings_rate': round((net_savings / total_income * 100), 1) if total_income > 0 else 0,
         'category_breakdown': category_breakdown,
-        'expense_count': len(expenses)
+        'expense_count': expense_count
     })
 
 # ==================== API ROUTES - SECURITY ====================
@@ -370,20 +838,21 @@ def api_analytics():
 @login_required
 def api_security():
     user = check_login()
-    alerts = SecurityAlert.query.filter_by(user_id=user.id).all()
-    unresolved = [a for a in alerts if not a.resolved]
+    open_alerts = SecurityAlert.query.filter_by(user_id=user.id, resolved=False)
+    unresolved = open_alerts.count()
+    recent = open_alerts.order_by(SecurityAlert.timestamp.desc()).limit(5).all()
     
     return jsonify({
-        'security_status': 'Excellent' if len(unresolved) == 0 else 'Warning',
-        'total_alerts': len(alerts),
-        'unresolved_alerts': len(unresolved),
+        'security_status': 'Excellent' if unresolved == 0 else 'Warning',
+        'total_alerts': SecurityAlert.query.filter_by(user_id=user.id).count(),
+        'unresolved_alerts': unresolved,
         'two_factor_enabled': True,
         'recent_alerts': [{
             'id': a.id,
             'type': a.alert_type,
             'message': a.message,
             'timestamp': a.timestamp.strftime('%Y-%m-%d %H:%M:%S')
-        } for a in unresolved[-5:]]
+        } for a in recent]
     })
 
 @app.route('/api/security/alert', methods=['POST'])
@@ -408,6 +877,26 @@ def api_add_alert():
 def health_check():
     return jsonify({'status': 'ok', 'message': 'GryffinTwin Flask API is running'})
 
+@app.route('/api/metrics/jobs', methods=['GET'])
+def job_metrics():
+    return jsonify(jobs.metrics())
+
+@app.route('/api/metrics/passwords', methods=['GET'])
+def password_metrics():
+    return jsonify(hasher.metrics())
+
+@app.route('/api/metrics/ratelimits', methods=['GET'])
+def rate_limit_metrics():
+    return jsonify({'ip': ip_limiter.metrics(), 'email': email_limiter.metrics()})
+
+@app.route('/api/metrics/idempotency', methods=['GET'])
+def idempotency_metrics():
+    return jsonify(idempotency.metrics())
+
+@app.route('/api/metrics/sessions', methods=['GET'])
+def session_metrics():
+    return jsonify(session_store.metrics() if session_store else {'backend': 'cookie'})
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
@@ -418,13 +907,29 @@ def not_found(error):
 def server_error(error):
     return jsonify({'error': 'Server error'}), 500
 
-# ==================== CREATE TABLES AND RUN ====================
+# ==================== CREATE TABLES ====================
+
+# Runs at import, so WSGI servers and tests get the schema and a running job queue too
+with app.app_context():
+    db.create_all()
+    with db.engine.begin() as conn:
+        migrate_money_columns(conn, {
+            'expenses': ['amount'],
+            'goals': ['target_amount', 'current_amount'],
+            'transactions': ['amount'],
+            'goal_contributions': ['amount'],
+            'user_summaries': ['total_expenses', 'total_income', 'goal_target', 'goal_current'],
+        })
+        conn.exec_driver_sql(
+            'CREATE INDEX IF NOT EXISTS ix_security_alerts_unresolved '
+            'ON security_alerts (user_id, timestamp) WHERE resolved = 0'
+        )
+    jobs.start(db.engine.url.database)
+atexit.register(jobs.stop)
+
+# ==================== RUN ====================
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
-        print("✓ Database tables created")
-    
     print("🚀 Starting GryffinTwin Flask Server...")
     print("📍 Open http://localhost:5000 in your browser")
     app.run(debug=True, host='0.0.0.0', port=5000)
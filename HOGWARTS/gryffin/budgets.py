@@ -0,0 +1,92 @@
+"""
+GryffinTwin Budgets
+Per-category monthly spend counters maintained from ORM flushes
+
+A budgets row per (user, category, month) carries the month's limit and
+the amount spent so far. Expense writes add their deltas to `spent` in
+the same transaction, so a status check reads one row per category
+instead of scanning expenses.
+"""
+
+from datetime import datetime
+
+from money import from_cents, to_cents
+from summary import attr_value
+
+
+def month_key(date=None):
+    return (date or datetime.utcnow()).strftime("%Y-%m")
+
+
+def spend_deltas(session, model, category_attr):
+    """
+    Spend changes for every `model` row pending in a flush.
+
+    Returns {(user_id, category, month): delta} with zero deltas dropped.
+    Moving an expense to another category or month shows up as a negative
+    delta on the old key and a positive one on the new key.
+    """
+    deltas = {}
+
+    def apply(obj, sign, old=False):
+        if hasattr(obj, "currency") and attr_value(obj, "currency", old):
+            return  # foreign-currency spend is converted when the status is read
+        key = (
+            attr_value(obj, "user_id", old),
+            attr_value(obj, category_attr, old),
+            month_key(attr_value(obj, "date", old)),
+        )
+        deltas[key] = deltas.get(key, 0) + sign * to_cents(attr_value(obj, "amount", old) or 0)
+
+    for obj in session.new:
+        if isinstance(obj, model):
+            apply(obj, 1)
+    for obj in session.deleted:
+        if isinstance(obj, model):
+            apply(obj, -1, old=True)
+    for obj in session.dirty:
+        if isinstance(obj, model) and session.is_modified(obj):
+            apply(obj, -1, old=True)
+            apply(obj, 1)
+
+    return {key: from_cents(delta) for key, delta in deltas.items() if delta}
+
+
+def _line(limit, spent):
+    remaining = from_cents(to_cents(limit) - to_cents(spent)) if limit is not None else None
+    return {
+        "limit": limit,
+        "spent": spent,
+        "remaining": remaining,
+        "percentage": round(spent / limit * 100, 1) if limit else 0,
+        "over_budget": limit is not None and spent > limit,
+    }
+
+
+def budget_status(month, rows):
+    """
+    Status for one month from its budget rows as (category, limit, spent).
+
+    The row with category None holds the overall monthly limit; without
+    one, the overall limit is the sum of the category limits.
+    """
+    overall_limit = None
+    category_limits = 0
+    spent_cents = 0
+    lines = []
+    for category, limit, spent in rows:
+        if category is None:
+            overall_limit = limit
+            continue
+        spent_cents += to_cents(spent or 0.0)
+        if limit is not None:
+            category_limits += to_cents(limit)
+        lines.append({"category": category, **_line(limit, spent or 0.0)})
+    if overall_limit is None and category_limits:
+        overall_limit = from_cents(category_limits)
+    lines.sort(key=lambda line: line["spent"], reverse=True)
+    return {
+        "month": month,
+        "total": _line(overall_limit, from_cents(spent_cents)),
+        "categories": lines,
+    }
@@ -0,0 +1,207 @@
+"""
+GryffinTwin Categorizer
+Keyword rules compiled into Aho-Corasick automata: one for the global
+rules, shared by everyone, and one per user with rules of their own
+"""
+
+import re
+import threading
+
+FALLBACK_CATEGORY = "🎮 Other"
+
+# Global merchant/keyword rules, shared by every user
+DEFAULT_RULES = {
+    "starbucks": "🍔 Food & Dining",
+    "mcdonald": "🍔 Food & Dining",
+    "restaurant": "🍔 Food & Dining",
+    "cafe": "🍔 Food & Dining",
+    "coffee": "🍔 Food & Dining",
+    "pizza": "🍔 Food & Dining",
+    "grocer": "🍔 Food & Dining",
+    "whole foods": "🍔 Food & Dining",
+    "doordash": "🍔 Food & Dining",
+    "uber eats": "🍔 Food & Dining",
+    "uber": "🚗 Transportation",
+    "lyft": "🚗 Transportation",
+    "taxi": "🚗 Transportation",
+    "fuel": "🚗 Transportation",
+    "gas station": "🚗 Transportation",
+    "parking": "🚗 Transportation",
+    "metro": "🚗 Transportation",
+    "amazon": "🛒 Shopping",
+    "walmart": "🛒 Shopping",
+    "target": "🛒 Shopping",
+    "ikea": "🛒 Shopping",
+    "netflix": "🎬 Entertainment",
+    "spotify": "🎬 Entertainment",
+    "cinema": "🎬 Entertainment",
+    "pharmacy": "💊 Healthcare",
+    "doctor": "💊 Healthcare",
+    "dental": "💊 Healthcare",
+    "hospital": "💊 Healthcare",
+    "tuition": "📚 Education",
+    "udemy": "📚 Education",
+    "coursera": "📚 Education",
+    "books": "📚 Education",
+    "electric": "📱 Utilities",
+    "water bill": "📱 Utilities",
+    "internet": "📱 Utilities",
+    "verizon": "📱 Utilities",
+    "phone bill": "📱 Utilities",
+}
+
+# Words that say nothing about the merchant when learning a rule
+STOPWORDS = {"the", "and", "for", "pos", "card", "payment", "purchase", "debit", "credit", "online", "store", "inc", "ltd", "llc"}
+LEARN_WORDS = 2
+
+_non_word = re.compile(r"[^a-z0-9]+")
+
+
+def normalize(text):
+    """Lowercase words separated by single spaces, with a leading space so keywords match at word starts"""
+    return " " + _non_word.sub(" ", (text or "").lower()).strip() + " "
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over a fixed set of keywords.
+
+    Failure links are folded into a complete transition table when the
+    automaton is built, so matching is one dict lookup per character and
+    never backtracks. Each state carries the best rule ending there
+    (highest priority, then longest keyword), including rules reached
+    through failure links.
+    """
+
+    def __init__(self, rules):
+        """`rules` maps keyword -> (priority, category)"""
+        goto = [{}]
+        best = [None]
+        for keyword, (priority, category) in rules.items():
+            pattern = normalize(keyword).rstrip()
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    best.append(None)
+                state = nxt
+            candidate = (priority, len(pattern), category)
+            if best[state] is None or candidate > best[state]:
+                best[state] = candidate
+
+        # Breadth-first: resolve failure links and complete the transition table
+        fail = [0] * len(goto)
+        delta = [dict(edges) for edges in goto]
+        queue = list(goto[0].values())
+        for state in queue:
+            for ch, nxt in goto[state].items():
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if best[fail[nxt]] is not None and (best[nxt] is None or best[fail[nxt]] > best[nxt]):
+                    best[nxt] = best[fail[nxt]]
+                queue.append(nxt)
+            for ch, nxt in delta[fail[state]].items():
+                delta[state].setdefault(ch, nxt)
+
+        self.delta = delta
+        self.best = best
+
+    def match(self, text):
+        """The category of the best rule found in already-normalized text, or None"""
+        delta, best = self.delta, self.best
+        state, found = 0, None
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            hit = best[state]
+            if hit is not None and (found is None or hit > found):
+                found = hit
+        return found[2] if found else None
+
+
+class Categorizer:
+    """
+    Global and per-user keyword rules, compiled lazily.
+
+    The global rules form one shared automaton, and each user with rules
+    of their own gets a second one holding only those. A user's match
+    outranks the global one, so the global automaton is consulted only
+    when the user's finds nothing. Adding a rule only drops the compiled
+    automaton it affects; the next classification rebuilds it.
+    """
+
+    def __init__(self, global_rules=DEFAULT_RULES):
+        self.global_rules = dict(global_rules)
+        self.user_rules = {}
+        self.global_automaton = None
+        self.automata = {}
+        self.lock = threading.Lock()
+
+    def load(self, rows):
+        """Load persisted rules from (user_id, keyword, category) rows; user_id None is global"""
+        with self.lock:
+            for user_id, keyword, category in rows:
+                if user_id is None:
+                    self.global_rules[keyword] = category
+                else:
+                    self.user_rules.setdefault(user_id, {})[keyword] = category
+            self.global_automaton = None
+            self.automata.clear()
+
+    def add_rule(self, user_id, keyword, category):
+        with self.lock:
+            if user_id is None:
+                self.global_rules[keyword] = category
+                self.global_automaton = None
+            else:
+                self.user_rules.setdefault(user_id, {})[keyword] = category
+                self.automata.pop(user_id, None)
+
+    def _automata(self, user_id):
+        """The global automaton and the user's own, which is None for users without rules"""
+        shared = self.global_automaton
+        if shared is None:
+            with self.lock:
+                rules = {keyword: (0, category) for keyword, category in self.global_rules.items()}
+                shared = self.global_automaton = Automaton(rules)
+        own = self.automata.get(user_id)
+        if own is None and user_id in self.user_rules:
+            with self.lock:
+                rules = {keyword: (0, category) for keyword, category in self.user_rules[user_id].items()}
+                own = self.automata[user_id] = Automaton(rules)
+        return shared, own
+
+    def classify(self, user_id, description):
+        shared, own = self._automata(user_id)
+        text = normalize(description)
+        return (own.match(text) if own else None) or shared.match(text)
+
+    def classify_many(self, user_id, descriptions):
+        """Classify a batch; repeated descriptions (the same merchant) are matched once"""
+        shared, own = self._automata(user_id)
+        seen = {}
+        results = []
+        for description in descriptions:
+            text = normalize(description)
+            if text not in seen:
+                seen[text] = (own.match(text) if own else None) or shared.match(text)
+            results.append(seen[text])
+        return results
+
+    def learn(self, user_id, description, category):
+        """
+        The user rule a manual recategorization teaches, as a keyword.
+
+        The keyword is the leading merchant words of the description, with
+        numbers and filler words dropped. Returns None when the description
+        has none or the rules already give this category. The caller stores
+        the rule and then registers it with `add_rule`.
+        """
+        words = [w for w in normalize(description).split() if len(w) > 1 and not w.isdigit() and w not in STOPWORDS]
+        if not words or self.classify(user_id, description) == category:
+            return None
+        return " ".join(words[:LEARN_WORDS])
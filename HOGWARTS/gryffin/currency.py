@@ -0,0 +1,103 @@
+"""
+GryffinTwin Currencies
+Daily exchange rates from local files, with a date-indexed in-memory cache
+
+Every rate is quoted against one reference currency (USD): `rate` is the
+reference-currency value of one unit. Converting from A to B on a day
+multiplies by rate(A) and divides by rate(B). A day without a quote uses
+the latest earlier one, which covers weekends and holidays.
+
+Rate files are CSV with `date,currency,rate` rows and ISO dates. The
+backend keeps the rates in an `exchange_rates` table, where aggregate
+queries join them in SQL. It also keeps them in a `RateCache`, which
+converts single amounts at write time with a bisect over each currency's
+sorted days. Both round the converted cents the way SQLite's ROUND()
+does, so a write-time conversion matches the SQL one exactly.
+"""
+
+from bisect import bisect_right
+import csv
+import glob
+import math
+import os
+import threading
+
+REFERENCE = "USD"
+EPOCH = "0001-01-01"  # day of the reference currency's only rate row
+
+
+class UnknownRate(Exception):
+    """Raised when a currency has no rate on or before a day"""
+
+
+def rate_files(path):
+    """(file, mtime) for the CSV files in a directory, or for a single file"""
+    files = sorted(glob.glob(os.path.join(path, "*.csv"))) if os.path.isdir(path) else [path] if os.path.isfile(path) else []
+    return [(f, os.path.getmtime(f)) for f in files]
+
+
+def read_rate_files(files):
+    """(currency, day, rate) rows from rate files; header and blank lines are skipped"""
+    rows = []
+    for name in files:
+        with open(name, newline="") as f:
+            for record in csv.reader(f):
+                if len(record) < 3 or record[0].strip().lower() == "date":
+                    continue
+                day, currency, rate = (field.strip() for field in record[:3])
+                rows.append((currency.upper(), day[:10], float(rate)))
+    return rows
+
+
+def convert_cents(cents, rate_from, rate_to):
+    """Cents in one currency to cents in another, rounded half away from zero like ROUND()"""
+    value = cents * rate_from / rate_to
+    return int(math.copysign(math.floor(abs(value) + 0.5), value))
+
+
+class RateCache:
+    """Rates per currency as parallel sorted lists of days and rates"""
+
+    def __init__(self):
+        self.days = {REFERENCE: [EPOCH]}
+        self.rates = {REFERENCE: [1.0]}
+        self.lock = threading.Lock()
+        self.stats = {"lookups": 0, "misses": 0}
+
+    def load(self, rows):
+        """Replace the cache with (currency, day, rate) rows sorted by currency and day"""
+        days, rates = {}, {}
+        for currency, day, rate in rows:
+            days.setdefault(currency, []).append(day)
+            rates.setdefault(currency, []).append(rate)
+        with self.lock:
+            self.days, self.rates = days, rates
+
+    def rate(self, currency, day):
+        """The rate in effect on `day` (YYYY-MM-DD)"""
+        with self.lock:
+            self.stats["lookups"] += 1
+            days = self.days.get(currency)
+            index = bisect_right(days, day) - 1 if days else -1
+            if index < 0:
+                self.stats["misses"] += 1
+                raise UnknownRate(f"No exchange rate for {currency} on {day}")
+            return self.rates[currency][index]
+
+    def convert(self, cents, currency, base, day):
+        if currency == base:
+            return cents
+        return convert_cents(cents, self.rate(currency, day), self.rate(base, day))
+
+    def currencies(self):
+        with self.lock:
+            return set(self.days)
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "currencies": len(self.days),
+                "rates": sum(len(days) for days in self.days.values()),
+                "latest": max((days[-1] for days in self.days.values()), default=None),
+                **self.stats,
+            }
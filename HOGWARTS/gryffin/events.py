@@ -0,0 +1,79 @@
+"""
+GryffinTwin Event Hub
+In-process pub/sub for pushing per-user change events over Server-Sent Events
+"""
+
+import asyncio
+import json
+
+SUBSCRIBER_BUFFER = 100
+KEEPALIVE_SECONDS = 15
+
+
+class EventHub:
+    """
+    Fan-out of small change events to every open stream for a user.
+
+    Each subscriber is a bounded asyncio.Queue, so an idle connection costs
+    one queue and one suspended coroutine, not a thread. `publish` may be
+    called from worker threads (sync endpoints run in a thread pool); it
+    hands delivery to the event loop with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.loop = None
+
+    def subscribe(self, user_id):
+        self.loop = asyncio.get_running_loop()
+        q = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER)
+        self.subscribers.setdefault(user_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, user_id, q):
+        queues = self.subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(q)
+            if not queues:
+                del self.subscribers[user_id]
+
+    def connection_count(self):
+        return sum(len(queues) for queues in self.subscribers.values())
+
+    def publish(self, user_id, event, data):
+        if self.loop is None or user_id not in self.subscribers:
+            return
+        message = {"type": event, "data": data}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            self._deliver(user_id, message)
+        elif not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._deliver, user_id, message)
+
+    def _deliver(self, user_id, message):
+        for q in tuple(self.subscribers.get(user_id, ())):
+            if q.full():
+                # Slow consumer: drop its backlog and tell it to refetch
+                while not q.empty():
+                    q.get_nowait()
+                q.put_nowait({"type": "resync", "data": {}})
+            else:
+                q.put_nowait(message)
+
+    async def stream(self, user_id):
+        """Async generator of SSE-formatted messages for one client"""
+        q = self.subscribe(user_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(q.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message['data'], default=str)}\n\n"
+        finally:
+            self.unsubscribe(user_id, q)
@@ -0,0 +1,64 @@
+"""
+GryffinTwin Goal Forecasting
+Projects goal completion dates from a user's monthly net savings history
+"""
+
+from datetime import datetime, timedelta
+import math
+
+DAYS_PER_MONTH = 30.44
+
+
+def savings_stats(monthly_net):
+    """Mean and sample standard deviation of monthly net savings"""
+    n = len(monthly_net)
+    if n == 0:
+        return 0.0, 0.0, 0
+    mean = sum(monthly_net) / n
+    if n == 1:
+        return mean, 0.0, n
+    variance = sum((x - mean) ** 2 for x in monthly_net) / (n - 1)
+    return mean, math.sqrt(variance), n
+
+
+def _months_to_date(today, months):
+    if months is None:
+        return None
+    return (today + timedelta(days=months * DAYS_PER_MONTH)).date().isoformat()
+
+
+def forecast_goals(goal_ids, targets, currents, monthly_net, today=None):
+    """
+    Forecast completion for a batch of goals in a single pass.
+
+    goal_ids, targets and currents are parallel sequences; monthly_net is the
+    user's net savings per calendar month, oldest first. The savings statistics
+    are computed once and applied to every goal, so the cost is one pass over
+    the history plus one pass over the goals.
+
+    Returns {goal_id: forecast dict}. Dates are None when the projected rate
+    never reaches the target (zero or negative savings).
+    """
+    today = today or datetime.utcnow()
+    mean, std, n = savings_stats(monthly_net)
+    # One-sigma band around the expected monthly savings rate
+    rates = (mean, mean + std, mean - std)
+
+    remaining = [max(t - c, 0.0) for t, c in zip(targets, currents)]
+    months = [
+        tuple(0.0 if r == 0 else (r / rate if rate > 0 else None) for rate in rates)
+        for r in remaining
+    ]
+
+    return {
+        goal_id: {
+            "remaining": round(r, 2),
+            "monthly_savings": round(mean, 2),
+            "months_to_target": round(expected, 1) if expected is not None else None,
+            "projected_date": _months_to_date(today, expected),
+            "earliest_date": _months_to_date(today, optimistic),
+            "latest_date": _months_to_date(today, pessimistic),
+            "history_months": n,
+        }
+        for goal_id, r, (expected, optimistic, pessimistic) in zip(goal_ids, remaining, months)
+    }
@@ -0,0 +1,164 @@
+"""
+GryffinTwin Idempotency Keys
+Stored responses for retried POSTs, so a retry never repeats the insert
+
+Clients send the same `Idempotency-Key` header on every retry of a
+request. The first request with a key claims it in the
+`idempotency_keys` table before the handler runs, and its response is
+stored when the handler finishes. A retry gets that response back without
+running the handler again. A retry that arrives while the first request is
+still running is refused with `KeyInProgress`, and a key reused for a
+different request body with `KeyReused`.
+
+Finished responses are also kept in a small in-process LRU, so most
+retries never reach the database. Keys expire after `ttl` seconds and
+expired rows are deleted in batches at most once a minute. A 5xx response
+is not stored: it releases the key, so the client can retry.
+
+Both backends define the `idempotency_keys` table; this module only reads
+and writes it.
+"""
+
+from collections import OrderedDict, namedtuple
+import hashlib
+import threading
+import time
+
+from sqlalchemy import text
+
+StoredResponse = namedtuple("StoredResponse", ["status", "body", "content_type"])
+
+LEASE = 60.0  # seconds a claim blocks retries if its request never finishes
+SWEEP_INTERVAL = 60.0
+SWEEP_BATCH = 500
+
+# Claim a new key, or take over one that has expired
+CLAIM_SQL = text("""
+INSERT INTO idempotency_keys (scope, key, fingerprint, expires_at) VALUES (:scope, :key, :fingerprint, :lease)
+ON CONFLICT (scope, key) DO UPDATE SET
+    fingerprint = excluded.fingerprint, status = NULL, body = NULL, content_type = NULL, expires_at = excluded.expires_at
+WHERE idempotency_keys.expires_at <= :now
+""")
+STORED_SQL = text("SELECT fingerprint, status, body, content_type, expires_at FROM idempotency_keys WHERE scope = :scope AND key = :key")
+FINISH_SQL = text("""
+UPDATE idempotency_keys SET status = :status, body = :body, content_type = :content_type, expires_at = :expires_at
+WHERE scope = :scope AND key = :key
+""")
+RELEASE_SQL = text("DELETE FROM idempotency_keys WHERE scope = :scope AND key = :key AND status IS NULL")
+SWEEP_SQL = text("""
+DELETE FROM idempotency_keys WHERE rowid IN (SELECT rowid FROM idempotency_keys WHERE expires_at <= :now LIMIT :batch)
+""")
+
+
+class KeyInProgress(Exception):
+    """Raised when a request with the same key is still running"""
+
+
+class KeyReused(Exception):
+    """Raised when a key comes back with a different request"""
+
+
+def request_fingerprint(method, path, body):
+    return hashlib.sha256(b"%s %s\n%s" % (method.encode(), path.encode(), body or b"")).hexdigest()
+
+
+class IdempotencyStore:
+    """
+    Claims and stored responses for idempotency keys.
+
+    `connect` returns a transaction context for the backend's database,
+    e.g. `engine.begin`. Keys are unique within a `scope`, which the
+    backend chooses (the user and path a request belongs to).
+    """
+
+    def __init__(self, connect, ttl=24 * 3600, cache_size=1024):
+        self.connect = connect
+        self.ttl = ttl
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.swept_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"claimed": 0, "replayed": 0, "cache_hits": 0, "in_progress": 0, "reused": 0, "released": 0}
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def _cached(self, scope, key, now):
+        with self.lock:
+            entry = self.cache.get((scope, key))
+            if entry is None:
+                return None
+            if entry[2] <= now:
+                del self.cache[(scope, key)]
+                return None
+            self.cache.move_to_end((scope, key))
+            return entry
+
+    def begin(self, scope, key, fingerprint):
+        """The stored response for a retry, or None after claiming the key for this request"""
+        now = time.time()
+        entry = self._cached(scope, key, now)
+        if entry is not None:
+            if entry[0] != fingerprint:
+                self._count("reused")
+                raise KeyReused("Idempotency-Key was already used for a different request")
+            self._count("cache_hits")
+            self._count("replayed")
+            return entry[1]
+
+        with self.connect() as conn:
+            if now - self.swept_at >= SWEEP_INTERVAL:
+                self.swept_at = now
+                while conn.execute(SWEEP_SQL, {"now": now, "batch": SWEEP_BATCH}).rowcount == SWEEP_BATCH:
+                    pass
+            claimed = conn.execute(CLAIM_SQL, {"scope": scope, "key": key, "fingerprint": fingerprint, "lease": now + LEASE, "now": now}).rowcount
+            row = None if claimed else conn.execute(STORED_SQL, {"scope": scope, "key": key}).first()
+
+        if row is None:
+            self._count("claimed")
+            return None
+        if row.fingerprint != fingerprint:
+            self._count("reused")
+            raise KeyReused("Idempotency-Key was already used for a different request")
+        if row.status is None:
+            self._count("in_progress")
+            raise KeyInProgress("A request with this Idempotency-Key is still in progress")
+        self._count("replayed")
+        stored = StoredResponse(row.status, row.body, row.content_type)
+        self._remember(scope, key, fingerprint, stored, row.expires_at)
+        return stored
+
+    def finish(self, scope, key, fingerprint, status, body, content_type):
+        """Store the response of a claimed request; a 5xx releases the key instead"""
+        if status >= 500:
+            self.release(scope, key)
+            return
+        expires_at = time.time() + self.ttl
+        with self.connect() as conn:
+            conn.execute(FINISH_SQL, {
+                "scope": scope,
+                "key": key,
+                "status": status,
+                "body": body,
+                "content_type": content_type,
+                "expires_at": expires_at,
+            })
+        self._remember(scope, key, fingerprint, StoredResponse(status, body, content_type), expires_at)
+
+    def _remember(self, scope, key, fingerprint, stored, expires_at):
+        with self.lock:
+            self.cache[(scope, key)] = (fingerprint, stored, expires_at)
+            self.cache.move_to_end((scope, key))
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def release(self, scope, key):
+        """Drop the claim of a request that failed, so a retry runs it again"""
+        with self.connect() as conn:
+            conn.execute(RELEASE_SQL, {"scope": scope, "key": key})
+        self._count("released")
+
+    def metrics(self):
+        with self.lock:
+            return {"cached": len(self.cache), "capacity": self.cache_size, "ttl": self.ttl, **self.stats}
@@ -0,0 +1,210 @@
+"""
+GryffinTwin Background Jobs
+In-process worker pool for side work that should not block request handlers
+
+Jobs are written to a SQLite `jobs` table before they are queued, so pending
+work survives a restart. A dispatcher thread moves due jobs from the table
+into a bounded in-memory queue and a small thread pool executes them.
+Failed jobs are retried with exponential backoff. Jobs registered with
+`every` are enqueued by the dispatcher on a fixed interval.
+"""
+
+from datetime import datetime
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    enqueued_at REAL NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_run_at ON jobs (status, run_at);
+"""
+
+
+class JobQueue:
+    """
+    Bounded background job queue backed by a SQLite table.
+
+    Register handlers with the `handler` decorator, call `start(db_path)` at
+    startup and `enqueue(name, **payload)` from request handlers. Until the
+    queue is started, jobs run inline so scripts and tests behave the same.
+    """
+
+    def __init__(self, workers=2, maxsize=1000, max_attempts=3, retry_delay=2.0):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.handlers = {}
+        self.periodic = {}
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.conn = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.threads = []
+        self.stats = {"completed": 0, "failed": 0, "retried": 0, "wait_total": 0.0, "run_total": 0.0, "run_max": 0.0}
+
+    def handler(self, name):
+        def register(f):
+            self.handlers[name] = f
+            return f
+        return register
+
+    def every(self, name, seconds, **payload):
+        """Enqueue a job every `seconds` while the queue is running, the first time at start"""
+        self.periodic[name] = [seconds, 0.0, payload]
+
+    # ---------- lifecycle ----------
+
+    def start(self, db_path):
+        if self.running:
+            return
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.executescript(SCHEMA)
+        # Jobs that were in flight when the process stopped are picked up again
+        self.conn.execute("UPDATE jobs SET status = 'pending' WHERE status IN ('queued', 'running')")
+        self.running = True
+        self.threads = [threading.Thread(target=self._dispatch, name="jobs-dispatcher", daemon=True)]
+        self.threads += [
+            threading.Thread(target=self._work, name=f"jobs-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in self.threads:
+            t.start()
+
+    def stop(self, timeout=5.0):
+        if not self.running:
+            return
+        self.running = False
+        self.wakeup.set()
+        for t in self.threads:
+            t.join(timeout)
+        self.threads = []
+        self.conn.close()
+        self.conn = None
+
+    # ---------- producer ----------
+
+    def enqueue(self, name, **payload):
+        """Persist a job and wake the dispatcher. Returns the job id, or None if run inline."""
+        if name not in self.handlers:
+            raise KeyError(f"No handler registered for job '{name}'")
+        if not self.running:
+            self.handlers[name](**payload)
+            return None
+        now = time.time()
+        with self.lock:
+            cur = self.conn.execute(
+                "INSERT INTO jobs (name, payload, run_at, enqueued_at) VALUES (?, ?, ?, ?)",
+                (name, json.dumps(payload), now, now),
+            )
+        self.wakeup.set()
+        return cur.lastrowid
+
+    # ---------- consumers ----------
+
+    def _enqueue_periodic(self):
+        now = time.time()
+        for name, entry in self.periodic.items():
+            seconds, due_at, payload = entry
+            if due_at <= now:
+                entry[1] = now + seconds
+                self.enqueue(name, **payload)
+
+    def _dispatch(self):
+        while self.running:
+            self._enqueue_periodic()
+            free = self.queue.maxsize - self.queue.qsize()
+            if free > 0:
+                with self.lock:
+                    rows = self.conn.execute(
+                        "SELECT id, name, payload, attempts, enqueued_at FROM jobs "
+                        "WHERE status = 'pending' AND run_at <= ? ORDER BY run_at, id LIMIT ?",
+                        (time.time(), free),
+                    ).fetchall()
+                    if rows:
+                        self.conn.executemany("UPDATE jobs SET status = 'queued' WHERE id = ?", [(r[0],) for r in rows])
+                for row in rows:
+                    self.queue.put(row)
+                if len(rows) == free:
+                    continue
+            self.wakeup.wait(1.0)
+            self.wakeup.clear()
+
+    def _work(self):
+        while self.running:
+            try:
+                job_id, name, payload, attempts, enqueued_at = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            started = time.time()
+            with self.lock:
+                self.conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (job_id,))
+            try:
+                self.handlers[name](**json.loads(payload))
+            except Exception as e:
+                self._fail(job_id, name, attempts + 1, e)
+            else:
+                with self.lock:
+                    self.conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                    elapsed = time.time() - started
+                    self.stats["completed"] += 1
+                    self.stats["wait_total"] += started - enqueued_at
+                    self.stats["run_total"] += elapsed
+                    self.stats["run_max"] = max(self.stats["run_max"], elapsed)
+            finally:
+                self.queue.task_done()
+
+    def _fail(self, job_id, name, attempts, error):
+        logger.warning("Job %s (%s) failed on attempt %d: %s", job_id, name, attempts, error)
+        with self.lock:
+            if attempts < self.max_attempts:
+                self.stats["retried"] += 1
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'pending', attempts = ?, run_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + self.retry_delay * 2 ** (attempts - 1), repr(error), job_id),
+                )
+            else:
+                self.stats["failed"] += 1
+                self.conn.execute(
+                    "UPDATE jobs SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                    (attempts, repr(error), job_id),
+                )
+        self.wakeup.set()
+
+    # ---------- metrics ----------
+
+    def metrics(self):
+        counts = {}
+        if self.conn is not None:
+            with self.lock:
+                counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        with self.lock:
+            completed = self.stats["completed"]
+            return {
+                "running": self.running,
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "pending": counts.get("pending", 0),
+                "in_flight": counts.get("queued", 0) + counts.get("running", 0),
+                "failed": counts.get("failed", 0),
+                "completed": completed,
+                "retried": self.stats["retried"],
+                "avg_wait_ms": round(self.stats["wait_total"] / completed * 1000, 2) if completed else 0,
+                "avg_run_ms": round(self.stats["run_total"] / completed * 1000, 2) if completed else 0,
+                "max_run_ms": round(self.stats["run_max"] * 1000, 2),
+                "as_of": datetime.utcnow().isoformat(),
+            }
@@ -0,0 +1,89 @@
+"""
+GryffinTwin Money
+Amounts are stored as 64-bit integer minor units (cents)
+
+The `Money` column type converts at the database boundary: the API and the
+rest of the code keep working in currency units, while SQLite stores and
+aggregates exact integers. SUM() over a Money column is integer math and
+its result comes back converted, because SQLAlchemy gives the aggregate
+the column's type.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+import re
+
+from sqlalchemy import Integer, type_coerce
+from sqlalchemy.types import TypeDecorator
+
+CENTS = 100
+
+
+def to_cents(amount):
+    """Currency units to integer cents, rounding half up"""
+    return int((Decimal(str(amount)) * CENTS).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return cents / CENTS
+
+
+def cents(column):
+    """A Money expression read as raw integer cents, for exact arithmetic in Python"""
+    return type_coerce(column, Integer)
+
+
+class Money(TypeDecorator):
+    """Integer cents in the database, currency units in Python"""
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_cents(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_cents(value)
+
+
+def migrate_money_columns(conn, money_columns):
+    """
+    Rebuild tables whose money columns are still REAL/FLOAT so the values
+    become INTEGER cents with INTEGER affinity.
+
+    `money_columns` maps table name to its money column names. SQLite cannot
+    change a column's type in place, so this follows the create-copy-drop-
+    rename procedure and re-creates the table's indexes and triggers.
+    """
+    for table, columns in money_columns.items():
+        info = conn.exec_driver_sql(f"PRAGMA table_info({table})").all()
+        declared = {row[1]: row[2].upper() for row in info}
+        stale = [c for c in columns if c in declared and declared[c] != "INTEGER"]
+        if not stale:
+            continue
+
+        create_sql = conn.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).scalar()
+        dependents = [
+            row[0]
+            for row in conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE tbl_name = ? AND type IN ('index', 'trigger') AND sql IS NOT NULL",
+                (table,),
+            )
+        ]
+
+        new_table = f"{table}__cents"
+        new_sql = re.sub(rf'^CREATE TABLE\s+"?{table}"?', f"CREATE TABLE {new_table}", create_sql)
+        for column in stale:
+            new_sql = re.sub(rf'(\b{column}"?\s+)(FLOAT|REAL|DOUBLE|NUMERIC)\b', r"\1INTEGER", new_sql, flags=re.I)
+
+        names = [row[1] for row in info]
+        select = ", ".join(
+            f"CAST(ROUND({name} * {CENTS}) AS INTEGER)" if name in stale else name for name in names
+        )
+        conn.exec_driver_sql(new_sql)
+        conn.exec_driver_sql(f"INSERT INTO {new_table} ({', '.join(names)}) SELECT {select} FROM {table}")
+        conn.exec_driver_sql(f"DROP TABLE {table}")
+        conn.exec_driver_sql(f"ALTER TABLE {new_table} RENAME TO {table}")
+        for sql in dependents:
+            conn.exec_driver_sql(sql)
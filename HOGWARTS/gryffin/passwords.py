@@ -0,0 +1,170 @@
+"""
+GryffinTwin Password Hashing
+scrypt hashing and verification in a bounded process pool
+
+A password hash costs tens of milliseconds of CPU on purpose. That work
+runs in worker processes, so it neither holds the GIL nor keeps a request
+thread busy for long. Only `max_pending` jobs are admitted at once. Past
+that, `PoolBusy` is raised and the endpoint can answer 503 right away. A
+login storm therefore queues on the pool, not on the threads that serve
+every other endpoint.
+
+Hashes use the same `scrypt:N:r:p$salt$hex` format as Werkzeug. Werkzeug
+`pbkdf2:hash:iterations` hashes are still checked, so older accounts can
+sign in. A stored value with neither prefix is a legacy plaintext
+password: `verify` accepts it once and reports that it needs a rehash,
+as it does for pbkdf2 hashes and hashes made at an older cost.
+
+A login for an unknown email calls `verify_absent`, which runs a full
+scrypt check against a throwaway hash. Both paths cost the same, so the
+response time does not reveal which emails have accounts.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import hashlib
+import hmac
+import secrets
+import string
+import threading
+import time
+
+SALT_CHARS = string.ascii_letters + string.digits
+HASH_METHODS = ("scrypt", "pbkdf2")
+
+
+class PoolBusy(Exception):
+    """Raised when the hashing pool has no room for another job"""
+
+
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p).hex()
+
+
+def hash_password(password, cost):
+    """`scrypt:N:8:1$salt$hash` with N = 2**cost"""
+    n, r, p = 2 ** cost, 8, 1
+    salt = "".join(secrets.choice(SALT_CHARS) for _ in range(16))
+    return f"scrypt:{n}:{r}:{p}${salt}${_scrypt(password, salt, n, r, p)}"
+
+
+def _pbkdf2(password, salt, name, iterations):
+    return hashlib.pbkdf2_hmac(name, password.encode(), salt.encode(), iterations).hex()
+
+
+def check_password(password, stored):
+    try:
+        method, salt, expected = stored.split("$", 2)
+        kind, *params = method.split(":")
+        if kind == "pbkdf2":
+            name, iterations = params
+            actual = _pbkdf2(password, salt, name, int(iterations))
+        else:
+            n, r, p = params
+            actual = _scrypt(password, salt, int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def is_hashed(stored):
+    method, sep, _ = (stored or "").partition("$")
+    return bool(sep) and method.split(":")[0] in HASH_METHODS
+
+
+def _timed(fn, *args):
+    """Run in a worker: the result and the CPU time it took"""
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+
+class PasswordHasher:
+    """
+    Process pool for password hashing with bounded admission.
+
+    `cost` is log2 of the scrypt work factor. Each step doubles the time a
+    hash takes. The pool starts on first use.
+    """
+
+    def __init__(self, cost=15, workers=2, max_pending=None):
+        self.cost = cost
+        self.workers = workers
+        self.max_pending = max_pending or workers * 4
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.pool = None
+        self.lock = threading.Lock()
+        self.stats = {"completed": 0, "rejected": 0, "upgraded": 0, "pending": 0, "wait_total": 0.0, "wait_max": 0.0, "run_total": 0.0}
+
+    def _run(self, fn, *args):
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.stats["rejected"] += 1
+            raise PoolBusy("Too many password checks in progress")
+        try:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ProcessPoolExecutor(max_workers=self.workers)
+                self.stats["pending"] += 1
+            submitted = time.perf_counter()
+            result, elapsed = self.pool.submit(_timed, fn, *args).result()
+            waited = time.perf_counter() - submitted - elapsed
+        finally:
+            with self.lock:
+                self.stats["pending"] -= 1
+            self.slots.release()
+        with self.lock:
+            self.stats["completed"] += 1
+            self.stats["run_total"] += elapsed
+            self.stats["wait_total"] += waited
+            self.stats["wait_max"] = max(self.stats["wait_max"], waited)
+        return result
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.cost)
+
+    def verify(self, password, stored):
+        """(matches, needs_rehash) for a password against a stored hash or legacy plaintext"""
+        if not stored:
+            return False, False
+        if not is_hashed(stored):
+            matches = hmac.compare_digest(password.encode(), stored.encode())
+            return matches, matches
+        matches = self._run(check_password, password, stored)
+        return matches, matches and not stored.startswith(f"scrypt:{2 ** self.cost}:")
+
+    def verify_absent(self, password):
+        """(False, False) for a login without an account, after the same work as a real check"""
+        salt = "".join(secrets.choice(SALT_CHARS) for _ in range(16))
+        self._run(check_password, password, f"scrypt:{2 ** self.cost}:8:1${salt}${'0' * 128}")
+        return False, False
+
+    def upgrade(self, password):
+        """A fresh hash for a login whose stored password needed a rehash"""
+        stored = self.hash(password)
+        with self.lock:
+            self.stats["upgraded"] += 1
+        return stored
+
+    def shutdown(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown()
+
+    def metrics(self):
+        with self.lock:
+            completed = self.stats["completed"]
+            return {
+                "workers": self.workers,
+                "cost": self.cost,
+                "pending": self.stats["pending"],
+                "capacity": self.max_pending,
+                "queued": max(0, self.stats["pending"] - self.workers),
+                "completed": completed,
+                "rejected": self.stats["rejected"],
+                "upgraded": self.stats["upgraded"],
+                "avg_wait_ms": round(self.stats["wait_total"] / completed * 1000, 2) if completed else 0,
+                "max_wait_ms": round(self.stats["wait_max"] * 1000, 2),
+                "avg_run_ms": round(self.stats["run_total"] / completed * 1000, 2) if completed else 0,
+                "as_of": datetime.utcnow().isoformat(),
+            }
@@ -0,0 +1,123 @@
+"""
+GryffinTwin Portfolio Valuation
+Market value, cost basis and returns for a user's holdings, priced from local files
+
+Every buy or sell is kept as a lot, and each holding keeps running totals
+of its lots: quantity, cost basis at average cost and realized gain. A
+valuation therefore reads one row per holding, however many lots there
+are, and values them all in a single pass over parallel sequences.
+
+Prices are quoted in USD and come from CSV files with `date,symbol,price`
+rows, the same layout as the exchange rate files. `PriceBook` keeps the
+latest price per symbol and bumps its `epoch` whenever a load changes
+one, so a valuation can be cached until either the prices or the
+holdings change.
+"""
+
+import threading
+
+from money import from_cents, to_cents
+
+
+class PriceBook:
+    """Latest price per symbol, with an epoch that moves on every change"""
+
+    def __init__(self):
+        self.latest = {}  # symbol -> (day, price)
+        self.epoch = 0
+        self.lock = threading.Lock()
+        self.stats = {"loads": 0}
+
+    def load(self, rows):
+        """Keep the latest of (symbol, day, price) rows; returns the number of symbols that changed"""
+        latest = {}
+        for symbol, day, price in rows:
+            if symbol not in latest or day >= latest[symbol][0]:
+                latest[symbol] = (day, price)
+        with self.lock:
+            changed = {symbol: quote for symbol, quote in latest.items() if self.latest.get(symbol) != quote}
+            if changed:
+                self.latest = {**self.latest, **changed}
+                self.epoch += 1
+            self.stats["loads"] += 1
+            return len(changed)
+
+    def snapshot(self):
+        """(epoch, prices) as of one moment; the prices dict is never mutated afterwards"""
+        with self.lock:
+            return self.epoch, self.latest
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "symbols": len(self.latest),
+                "epoch": self.epoch,
+                "latest": max((day for day, _ in self.latest.values()), default=None),
+                **self.stats,
+            }
+
+
+def value_holdings(symbols, quantities, costs, realized, prices, fx=1.0):
+    """
+    Value a user's holdings in a single pass.
+
+    symbols, quantities, costs and realized are parallel sequences, one
+    entry per holding, with costs and realized gains in USD cents. prices
+    maps symbol to (day, price). fx converts USD into the currency the
+    result is reported in.
+
+    Holdings without a price are listed in `unpriced` with their quantity
+    and cost basis, and left out of the other totals, so the return is
+    never computed against a partial value. Their cost adds up to
+    `unpriced_cost_basis`.
+    """
+    rows = []
+    unpriced = []
+    market_total = cost_total = unpriced_cost = 0
+    as_of = None
+    for symbol, quantity, cost in zip(symbols, quantities, costs):
+        if not quantity:
+            continue  # fully sold; only its realized gain remains
+        quote = prices.get(symbol)
+        if quote is None:
+            cost = round(cost * fx)
+            unpriced_cost += cost
+            unpriced.append({"symbol": symbol, "quantity": quantity, "cost_basis": from_cents(cost)})
+            continue
+        day, price = quote
+        value = round(quantity * to_cents(price) * fx)
+        cost = round(cost * fx)
+        market_total += value
+        cost_total += cost
+        as_of = max(as_of or day, day)
+        rows.append({
+            "symbol": symbol,
+            "quantity": quantity,
+            "price": round(price * fx, 4),
+            "price_date": day,
+            "market_value": value,
+            "cost_basis": cost,
+        })
+
+    for row in rows:
+        value, cost = row["market_value"], row["cost_basis"]
+        row.update(
+            market_value=from_cents(value),
+            cost_basis=from_cents(cost),
+            unrealized_gain=from_cents(value - cost),
+            return_pct=round((value - cost) / cost * 100, 2) if cost > 0 else 0,
+            weight=round(value / market_total * 100, 2) if market_total > 0 else 0,
+        )
+    rows.sort(key=lambda row: row["market_value"], reverse=True)
+
+    return {
+        "market_value": from_cents(market_total),
+        "cost_basis": from_cents(cost_total),
+        "unrealized_gain": from_cents(market_total - cost_total),
+        "return_pct": round((market_total - cost_total) / cost_total * 100, 2) if cost_total > 0 else 0,
+        "realized_gain": from_cents(round(sum(realized) * fx)),
+        "as_of": as_of,
+        "holdings": rows,
+        "unpriced": unpriced,
+        "unpriced_cost_basis": from_cents(unpriced_cost),
+    }
@@ -0,0 +1,144 @@
+"""
+GryffinTwin Rate Limiting
+Token buckets per key (client IP, email) for the login and register endpoints
+
+Each bucket is stored as a single float, its "theoretical arrival time":
+the moment it will be full again. Taking a token pushes that moment one
+interval later. A request is refused when that would put it more than
+`burst` intervals ahead of now. This is the GCRA form of a token bucket.
+
+In memory, buckets sit in a dict and a time wheel drops each one as soon
+as it has refilled, so idle clients cost nothing. The dict is also capped
+at `max_keys`. Several worker processes can share buckets through a
+SQLite file instead, where one UPSERT takes the token atomically.
+"""
+
+import math
+import sqlite3
+import threading
+import time
+
+WHEEL_SLOTS = 256  # one-second slots; buckets further out wait a full turn
+
+
+class MemoryBuckets:
+    """Per-process buckets with time-wheel expiry and a hard key limit"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.tat = {}
+        self.wheel = [set() for _ in range(WHEEL_SLOTS)]
+        self.tick = int(time.time())
+        self.lock = threading.Lock()
+
+    def take(self, key, now, interval, window):
+        with self.lock:
+            self._advance(now)
+            new_tat = max(self.tat.get(key, now), now) + interval
+            if new_tat - now > window:
+                return False, new_tat - now - window
+            if key not in self.tat and len(self.tat) >= self.max_keys:
+                self._evict()
+            self.tat[key] = new_tat
+            self.wheel[math.ceil(new_tat) % WHEEL_SLOTS].add(key)
+            return True, 0.0
+
+    def _advance(self, now):
+        """Drop every bucket that has refilled by now"""
+        current = int(now)
+        if current - self.tick >= WHEEL_SLOTS:
+            self.tick = current - WHEEL_SLOTS
+        while self.tick < current:
+            self.tick += 1
+            index = self.tick % WHEEL_SLOTS
+            keep = set()
+            for key in self.wheel[index]:
+                tat = self.tat.get(key)
+                if tat is None:
+                    continue
+                if tat <= now:
+                    del self.tat[key]
+                elif math.ceil(tat) % WHEEL_SLOTS == index:
+                    keep.add(key)  # due on a later turn of the wheel
+                # otherwise the key was pushed later and sits in another slot
+            self.wheel[index] = keep
+
+    def _evict(self):
+        """Make room by dropping the buckets that are closest to full anyway"""
+        for offset in range(1, WHEEL_SLOTS + 1):
+            slot = self.wheel[(self.tick + offset) % WHEEL_SLOTS]
+            while slot and len(self.tat) >= self.max_keys:
+                self.tat.pop(slot.pop(), None)
+            if len(self.tat) < self.max_keys:
+                return
+
+    def __len__(self):
+        return len(self.tat)
+
+
+class SqliteBuckets:
+    """Buckets in a SQLite file, shared by every process that opens it"""
+
+    def __init__(self, path, sweep_every=60.0):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID")
+        self.sweep_every = sweep_every
+        self.swept_at = 0.0
+        self.lock = threading.Lock()
+
+    def take(self, key, now, interval, window):
+        with self.lock:
+            if now - self.swept_at >= self.sweep_every:
+                self.swept_at = now
+                self.conn.execute("DELETE FROM rate_limits WHERE tat <= ?", (now,))
+            # The WHERE clause refuses the update when the bucket is empty, so no row comes back
+            row = self.conn.execute(
+                "INSERT INTO rate_limits (key, tat) VALUES (:key, :now + :interval) "
+                "ON CONFLICT (key) DO UPDATE SET tat = MAX(tat, :now) + :interval "
+                "WHERE MAX(tat, :now) + :interval - :now <= :window RETURNING tat",
+                {"key": key, "now": now, "interval": interval, "window": window},
+            ).fetchone()
+            if row is not None:
+                return True, 0.0
+            tat = self.conn.execute("SELECT tat FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            return False, max(tat[0] if tat else now, now) + interval - now - window
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rate_limits").fetchone()[0]
+
+
+class RateLimiter:
+    """
+    `rate` attempts per second per key, with bursts of up to `burst`.
+
+    Pass `path` to keep the buckets in a SQLite file shared across worker
+    processes; otherwise they live in this process.
+    """
+
+    def __init__(self, rate, burst, path=None, max_keys=100000):
+        self.interval = 1.0 / rate
+        self.window = burst * self.interval
+        self.buckets = SqliteBuckets(path) if path else MemoryBuckets(max_keys)
+        self.lock = threading.Lock()
+        self.stats = {"allowed": 0, "limited": 0}
+
+    def hit(self, key):
+        """Take a token for `key`. Returns seconds to wait before retrying, or 0 if allowed."""
+        allowed, retry_after = self.buckets.take(key, time.time(), self.interval, self.window)
+        with self.lock:
+            self.stats["allowed" if allowed else "limited"] += 1
+        return 0 if allowed else max(1, math.ceil(retry_after))
+
+    def metrics(self):
+        with self.lock:
+            return {"keys": len(self.buckets), **self.stats}
+
+
+def check_login_limits(ip_limiter, email_limiter, ip, email):
+    """Seconds until the client may try again, or 0; checks the IP first so floods never reach email buckets"""
+    retry_after = ip_limiter.hit(f"ip:{ip}")
+    if retry_after or not email:
+        return retry_after
+    return email_limiter.hit(f"email:{email.strip().lower()}")
@@ -0,0 +1,113 @@
+"""
+GryffinTwin Recurring Rules
+Cron-style cadences for salaries, rent and subscriptions
+
+A cadence is a five-field cron expression (minute hour day-of-month month
+day-of-week) or one of the @daily/@weekly/@monthly/@yearly aliases. Fields
+accept `*`, numbers, lists, ranges and steps; day-of-month also accepts `L`
+for the last day of the month, so rent can be due on month end.
+"""
+
+from calendar import monthrange
+from datetime import timedelta
+
+ALIASES = {
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+
+# (name, low, high) for each field
+FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+# How far ahead to look for the next occurrence before giving up ("0 0 30 2 *")
+SEARCH_DAYS = 366 * 5
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(","):
+        body, _, step = part.partition("/")
+        try:
+            step = int(step) if step else 1
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                start, end = (int(v) for v in body.split("-", 1))
+            else:
+                start = int(body)
+                end = high if step > 1 else start
+        except ValueError:
+            raise ValueError(f"{name} field '{part}' is not a number, range or list") from None
+        if not (low <= start <= end <= high) or step < 1:
+            raise ValueError(f"{name} field '{part}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cadence:
+    """A parsed cron expression that can list its occurrences in a time range"""
+
+    def __init__(self, expr):
+        self.expr = expr.strip()
+        fields = ALIASES.get(self.expr.lower(), self.expr).split()
+        if len(fields) != len(FIELDS):
+            raise ValueError("cadence needs 5 fields: minute hour day-of-month month day-of-week")
+        day_field = fields[2]
+        self.last_day = "L" in day_field.upper().split(",")
+        if self.last_day:
+            day_field = ",".join(p for p in day_field.upper().split(",") if p != "L") or None
+        parsed = []
+        for text, (name, low, high) in zip(fields, FIELDS):
+            if name == "day":
+                text = day_field
+            parsed.append(_parse_field(text, name, low, high) if text else set())
+        minutes, hours, days, months, weekdays = parsed
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = days
+        self.months = months
+        self.weekdays = {d % 7 for d in weekdays}  # 0 and 7 are both Sunday
+        # As in cron, a restricted day-of-month and day-of-week match either one
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _matches_day(self, day):
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days or (self.last_day and day.day == monthrange(day.year, day.month)[1])
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def occurrences(self, start, end, limit=None):
+        """Occurrence times t with start <= t <= end, oldest first, at most `limit` of them"""
+        found = []
+        day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day <= end:
+            if self._matches_day(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        t = day.replace(hour=hour, minute=minute)
+                        if start <= t <= end:
+                            found.append(t)
+                            if limit and len(found) >= limit:
+                                return found
+            day += timedelta(days=1)
+        return found
+
+    def next_after(self, after):
+        """The first occurrence strictly after `after`, or None if there is none within five years"""
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        found = self.occurrences(start, start + timedelta(days=SEARCH_DAYS), limit=1)
+        return found[0] if found else None
+
+    def first_from(self, start):
+        """The first occurrence at or after `start`, or None"""
+        found = self.occurrences(start, start + timedelta(days=SEARCH_DAYS), limit=1)
+        return found[0] if found else None
@@ -1,4 +1,4 @@
-from app import SessionLocal, User, Expense, Goal, Transaction, SecurityAlert
+from app import SessionLocal, User, Expense, Goal, Transaction, SecurityAlert, UserSummary
 from datetime import datetime, timedelta
 import random
 
@@ -13,13 +13,19 @@ def seed():
 
         print(f"Seeding data for user: {user.email}")
 
-        # Clear existing data for this user to avoid duplicates if run multiple times
-        db.query(Transaction).filter(Transaction.user_id == user.id).delete()
-        db.query(Expense).filter(Expense.user_id == user.id).delete()
+        # Clear existing data for this user to avoid duplicates if run multiple times.
+        # The transactions ledger is append-only, so cleared expenses are reversed instead,
+        # and they are deleted through the ORM so the budget spend counters follow.
+        for e in db.query(Expense).filter(Expense.user_id == user.id):
+            db.add(Transaction(user_id=user.id, type="expense", amount=-e.amount, description=f"Reversal: {e.description}"))
+            db.delete(e)
         db.query(Goal).filter(Goal.user_id == user.id).delete()
+        # Bulk deletes bypass the ORM, so let the running totals be rebuilt
+        db.query(UserSummary).filter(UserSummary.user_id == user.id).delete()
 
-        # 1. Add Income (Transactions) - Needed for Balance Calculation
-        incomes = [
+        # 1. Add Income (Transactions) - Needed for Balance Calculation, once per user
+        has_income = db.query(Transaction).filter(Transaction.user_id == user.id, Transaction.type == "income").first()
+        incomes = [] if has_income else [
             Transaction(user_id=user.id, type="income", amount=5000.00, description="Monthly Salary", date=datetime.utcnow() - timedelta(days=2)),
             Transaction(user_id=user.id, type="income", amount=1500.00, description="Freelance Project", date=datetime.utcnow() - timedelta(days=10)),
             Transaction(user_id=user.id, type="income", amount=200.00, description="Dividend Income", date=datetime.utcnow() - timedelta(days=15))
@@ -38,6 +44,10 @@ def seed():
                 date=datetime.utcnow() - timedelta(days=random.randint(0, 30))
             ))
         db.add_all(expenses)
+        db.add_all(
+            Transaction(user_id=user.id, type="expense", amount=e.amount, description=e.description, date=e.date)
+            for e in expenses
+        )
 
         # 3. Add Goals
         goals = [
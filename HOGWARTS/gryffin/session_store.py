@@ -0,0 +1,190 @@
+"""
+GryffinTwin Server-Side Sessions
+Flask sessions kept in SQLite behind an in-process LRU, with opaque cookie ids
+
+The cookie carries only a random session id. The session data stays on
+the server, so requests skip the signed-cookie HMAC, responses stop
+echoing the payload, and deleting a row revokes the session. A session is
+written only when it changes, or when less than half its lifetime is
+left. Expired rows are removed in batches at most once a minute.
+
+Any object with `load(sid)`, `save(sid, data, expires_at)` and
+`delete(sid)` can stand in for `SqliteSessionStore`.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SecureCookieSession, SessionInterface, session_json_serializer
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_sessions_expires_at ON sessions (expires_at);
+"""
+
+SWEEP_INTERVAL = 60.0
+SWEEP_BATCH = 500
+
+
+class SqliteSessionStore:
+    """
+    Sessions in a SQLite file, fronted by an LRU of recently used ones.
+
+    Cached entries are trusted for `cache_ttl` seconds. That bounds how
+    long another worker process can keep serving a session this one has
+    deleted.
+    """
+
+    def __init__(self, path, cache_size=1024, cache_ttl=30.0):
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.swept_at = 0.0
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "deleted": 0, "swept": 0}
+
+    def _remember(self, sid, data, expires_at):
+        self.cache[sid] = (data, expires_at, time.time() + self.cache_ttl)
+        self.cache.move_to_end(sid)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def load(self, sid):
+        """(data, expires_at) for a live session, or None"""
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(sid)
+            if entry is not None and entry[2] > now:
+                self.cache.move_to_end(sid)
+                self.stats["hits"] += 1
+                data, expires_at, _ = entry
+            else:
+                self.stats["misses"] += 1
+                row = self.conn.execute("SELECT data, expires_at FROM sessions WHERE id = ?", (sid,)).fetchone()
+                if row is None:
+                    self.cache.pop(sid, None)
+                    return None
+                data, expires_at = session_json_serializer.loads(row[0]), row[1]
+                self._remember(sid, data, expires_at)
+        if expires_at <= now:
+            return None
+        return dict(data), expires_at
+
+    def save(self, sid, data, expires_at):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (sid, session_json_serializer.dumps(data), expires_at),
+            )
+            self._remember(sid, dict(data), expires_at)
+            self.stats["writes"] += 1
+            if now - self.swept_at >= SWEEP_INTERVAL:
+                self.swept_at = now
+                self._sweep(now)
+
+    def delete(self, sid):
+        with self.lock:
+            self.conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            self.cache.pop(sid, None)
+            self.stats["deleted"] += 1
+
+    def _sweep(self, now):
+        """Delete expired sessions a batch at a time, so no single statement holds the lock long"""
+        while True:
+            deleted = self.conn.execute(
+                "DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                (now, SWEEP_BATCH),
+            ).rowcount
+            self.stats["swept"] += deleted
+            if deleted < SWEEP_BATCH:
+                return
+
+    def metrics(self):
+        with self.lock:
+            stored = self.conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                "stored": stored,
+                "cached": len(self.cache),
+                "capacity": self.cache_size,
+                **self.stats,
+                "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0,
+            }
+
+
+class ServerSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.cleared = False
+
+    def clear(self):
+        # A cleared session gets a fresh id when saved, so an id from before login is never reused
+        self.cleared = True
+        super().clear()
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface that keeps only an opaque id in the cookie"""
+
+    session_class = ServerSession
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            found = self.store.load(sid)
+            if found is not None:
+                data, expires_at = found
+                return self.session_class(data, sid=sid, expires_at=expires_at)
+        return self.session_class()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.sid and (session.cleared or not session):
+            self.store.delete(session.sid)
+            session.sid = None
+        if not session:
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        renew = session.expires_at is not None and session.expires_at - now < lifetime / 2
+        if session.sid and not session.modified and not renew:
+            return
+
+        sid = session.sid or secrets.token_urlsafe(32)
+        expires_at = now + lifetime
+        self.store.save(sid, dict(session), expires_at)
+        response.set_cookie(
+            name,
+            sid,
+            expires=datetime.fromtimestamp(expires_at, timezone.utc) if session.permanent else None,
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
@@ -0,0 +1,97 @@
+"""
+GryffinTwin Incremental Summaries
+Per-user running totals maintained from ORM flushes instead of rescans
+
+Both backends keep a `user_summaries` row per user and apply the deltas
+computed here inside the same transaction as the write, so dashboard
+totals and mutation responses never need to scan expenses or goals.
+"""
+
+from sqlalchemy import inspect
+
+from money import from_cents, to_cents
+
+SUMMARY_FIELDS = (
+    "total_expenses",
+    "expense_count",
+    "total_income",
+    "transaction_count",
+    "goal_target",
+    "goal_current",
+    "goal_count",
+    "active_goals",
+)
+
+
+def attr_value(obj, attr, old):
+    """Current attribute value, or the value before this flush when old=True"""
+    if old:
+        history = inspect(obj).attrs[attr].history
+        if history.deleted:
+            return history.deleted[0]
+    return getattr(obj, attr)
+
+
+def contribution(kind, obj, old=False):
+    """The amounts a single row adds to its owner's summary"""
+    if kind == "expense":
+        if hasattr(obj, "currency") and attr_value(obj, "currency", old):
+            # Foreign-currency amounts are converted when totals are read
+            return {"expense_count": 1}
+        return {"total_expenses": attr_value(obj, "amount", old) or 0, "expense_count": 1}
+    if kind == "transaction":
+        income = (attr_value(obj, "amount", old) or 0) if attr_value(obj, "type", old) == "income" else 0
+        return {"total_income": income, "transaction_count": 1}
+    return {
+        "goal_target": attr_value(obj, "target_amount", old) or 0,
+        "goal_current": attr_value(obj, "current_amount", old) or 0,
+        "goal_count": 1,
+        "active_goals": 1 if attr_value(obj, "status", old) == "Active" else 0,
+    }
+
+
+def flush_deltas(session, kinds):
+    """
+    Collect summary deltas for everything pending in a flush.
+
+    `kinds` maps model classes to "expense", "goal" or "transaction".
+    Returns {user_id: {field: delta}} with zero deltas dropped.
+    """
+    deltas = {}
+
+    def apply(obj, sign, old=False):
+        kind = kinds.get(type(obj))
+        if kind is None:
+            return
+        totals = deltas.setdefault(attr_value(obj, "user_id", old), {})
+        for field, amount in contribution(kind, obj, old).items():
+            totals[field] = totals.get(field, 0) + sign * amount
+
+    for obj in session.new:
+        apply(obj, 1)
+    for obj in session.deleted:
+        apply(obj, -1, old=True)
+    for obj in session.dirty:
+        if type(obj) in kinds and session.is_modified(obj):
+            apply(obj, -1, old=True)
+            apply(obj, 1)
+
+    return {
+        user_id: {field: delta for field, delta in totals.items() if delta}
+        for user_id, totals in deltas.items()
+        if any(totals.values())
+    }
+
+
+def summary_to_dict(row):
+    """Dashboard-shaped totals from a summary row"""
+    goal_progress = row.goal_current / row.goal_target * 100 if row.goal_target else 0
+    return {
+        "balance": from_cents(to_cents(row.total_income) - to_cents(row.total_expenses)),
+        "total_expenses": row.total_expenses,
+        "total_income": row.total_income,
+        "goal_progress": round(goal_progress, 1),
+        "active_goals": row.active_goals,
+        "ledger_entries": row.transaction_count,  # includes expense postings and their reversals
+        "expense_count": row.expense_count,
+    }
@@ -0,0 +1,42 @@
+"""
+The Flask backend, imported once per test run against a temporary
+database and session store, with a cheap password hash cost. The import
+creates the tables and starts the job queue.
+"""
+
+import itertools
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+_emails = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def backend(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("flask")
+    # The config is read at import; the variables are restored right after
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv("FLASK_SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp / 'gryfftwin.db'}")
+        env.setenv("FLASK_SESSION_DB", str(tmp / "sessions.db"))
+        env.setenv("FLASK_PASSWORD_HASH_COST", "10")
+        import app_flask
+
+    yield app_flask
+    app_flask.jobs.stop()
+    app_flask.hasher.shutdown()
+
+
+
+@pytest.fixture
+def user_client(backend):
+    """A test client signed in as a newly registered user"""
+    n = next(_emails)
+    client = backend.app.test_client()
+    client.environ_base["REMOTE_ADDR"] = f"10.0.{n // 250}.{n % 250 + 1}"  # its own login rate limit bucket
+    credentials = {"email": f"user{n}@example.com", "password": "correct horse", "name": "Test"}
+    assert client.post("/register", json=credentials).status_code == 200
+    return client
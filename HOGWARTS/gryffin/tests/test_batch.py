@@ -0,0 +1,41 @@
+"""
+Batch endpoints of the Flask backend: a malformed operation rejects the
+whole batch with a 400 naming it, before any statement runs.
+"""
+
+import pytest
+
+
+@pytest.mark.parametrize("operation", [
+    1,
+    "delete",
+    {"op": "drop", "ids": [1]},
+    {"op": "delete", "ids": ["one"]},
+    {"op": "delete", "ids": "12"},
+    {"op": "update", "ids": [1], "category": {"name": "Food"}},
+])
+def test_malformed_expense_operation_is_rejected(user_client, operation):
+    expense = user_client.post("/api/expenses", json={"description": "Lunch", "amount": 12.5, "category": "Food"}).get_json()
+
+    response = user_client.post("/api/expenses/batch", json={"operations": [{"op": "delete", "ids": [expense["id"]]}, operation]})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Operation 1:")
+    assert [e["id"] for e in user_client.get("/api/expenses").get_json()["expenses"]] == [expense["id"]]
+
+
+@pytest.mark.parametrize("amounts", [{"x": 5}, {"1": "five"}, {"1": "nan"}, [5]])
+def test_malformed_goal_adjustment_is_rejected(user_client, amounts):
+    response = user_client.post("/api/goals/batch", json={"operations": [{"op": "adjust", "amounts": amounts}]})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("Operation 0:")
+
+
+def test_batch_parses_numeric_strings(user_client):
+    expense = user_client.post("/api/expenses", json={"description": "Taxi", "amount": 30, "category": "Transport"}).get_json()
+
+    response = user_client.post("/api/expenses/batch", json={"operations": [{"op": "delete", "ids": [str(expense["id"])]}]})
+
+    assert response.status_code == 200
+    assert response.get_json()["results"] == [{"op": "delete", "requested": 1, "affected": 1, "missing": []}]
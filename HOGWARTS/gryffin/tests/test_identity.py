@@ -0,0 +1,35 @@
+"""
+Identity resolution in the Flask backend: after login, API calls read the
+user from the session claims and never query the users table.
+"""
+
+import re
+
+from sqlalchemy import event
+
+USERS_QUERY = re.compile(r"\bFROM users\b", re.IGNORECASE)
+
+
+def test_api_calls_after_login_run_no_users_query(backend):
+    client = backend.app.test_client()
+    credentials = {"email": "identity@example.com", "password": "correct horse"}
+    assert client.post("/register", json={**credentials, "name": "Ida"}).status_code == 200
+    client.get("/logout")
+    assert client.post("/login", json=credentials).status_code == 200
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with backend.app.app_context():
+        engine = backend.db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for path in ("/api/dashboard", "/api/expenses", "/api/goals"):
+            assert client.get(path).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert statements, "the views should have queried their own tables"
+    assert [s for s in statements if USERS_QUERY.search(s)] == []
@@ -0,0 +1,15 @@
+"""
+Login in the Flask backend: an unknown email costs the same password
+check as a wrong password, so timing does not reveal which accounts exist.
+"""
+
+
+def test_unknown_email_runs_a_password_check(backend):
+    client = backend.app.test_client()
+    client.environ_base["REMOTE_ADDR"] = "10.1.0.1"
+    checks = backend.hasher.metrics()["completed"]
+
+    response = client.post("/login", json={"email": "nobody@example.com", "password": "guess"})
+
+    assert response.status_code == 401
+    assert backend.hasher.metrics()["completed"] == checks + 1
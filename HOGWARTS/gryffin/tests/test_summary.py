@@ -0,0 +1,43 @@
+"""
+Per-user summary rows in the Flask backend: built from one aggregate pass
+when missing, in a session of their own.
+"""
+
+
+def add_expenses(client, *amounts):
+    for amount in amounts:
+        assert client.post("/api/expenses", json={"description": "Item", "amount": amount, "category": "Food"}).status_code == 201
+
+
+def drop_summary(backend, user_id):
+    with backend.app.app_context():
+        backend.db.session.query(backend.UserSummary).filter_by(user_id=user_id).delete()
+        backend.db.session.commit()
+
+
+def current_user_id(backend, client):
+    with client.session_transaction() as session:
+        return session["user_id"]
+
+
+def test_missing_summary_is_rebuilt_from_rows(backend, user_client):
+    add_expenses(user_client, 12.5, 7.25)
+    drop_summary(backend, current_user_id(backend, user_client))
+
+    summary = user_client.get("/api/dashboard").get_json()
+
+    assert summary["total_expenses"] == 19.75
+    assert summary["expense_count"] == 2
+
+
+def test_building_a_summary_leaves_the_callers_session_alone(backend, user_client):
+    user_id = current_user_id(backend, user_client)
+    add_expenses(user_client, 10)
+    drop_summary(backend, user_id)
+
+    with backend.app.app_context():
+        backend.db.session.add(backend.Expense(user_id=user_id, description="Pending", amount=99, category="Food"))
+        summary = backend.get_summary(user_id)
+        assert (summary.expense_count, summary.total_expenses) == (1, 10)
+        backend.db.session.rollback()
+        assert backend.db.session.query(backend.Expense).filter_by(user_id=user_id).count() == 1